@@ -12,6 +12,55 @@ class Settings:
     DIR_ROOT = os.path.dirname(os.path.abspath(".env"))
     # API KEY
     API_KEY = os.environ["API_KEY"]
+    # JWT (mặc định dùng API_KEY làm khóa ký nếu chưa cấu hình riêng)
+    JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", API_KEY)
+    JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
+    ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
+    # Thời gian sống của cache thông tin user trong bộ nhớ (giây)
+    USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "60"))
+    # BILLING (đặt 0 để không tính phí)
+    CREDITS_PER_CHARACTER = float(os.environ.get("CREDITS_PER_CHARACTER", "0"))
+    CREDITS_PER_AUDIO_SECOND = float(os.environ.get("CREDITS_PER_AUDIO_SECOND", "0"))
+    # Ghi sổ cái theo lô: ghi khi đủ số bản ghi hoặc sau khoảng thời gian (giây)
+    LEDGER_BATCH_SIZE = int(os.environ.get("LEDGER_BATCH_SIZE", "200"))
+    LEDGER_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LEDGER_FLUSH_INTERVAL_SECONDS", "2"))
+    # CONFIG CACHE: chu kỳ kiểm tra phiên bản cấu hình (giây) và max-age cho client
+    CONFIG_CACHE_CHECK_SECONDS = float(os.environ.get("CONFIG_CACHE_CHECK_SECONDS", "5"))
+    CONFIG_CACHE_MAX_AGE = int(os.environ.get("CONFIG_CACHE_MAX_AGE", "60"))
+    # USER SEARCH: bật chỉ mục FULLTEXT (ngram) cho tìm kiếm chuỗi con trên MySQL >= 5.7
+    USER_SEARCH_FULLTEXT = os.environ.get("USER_SEARCH_FULLTEXT", "false").lower() in ("1", "true", "yes")
+    # AUDIO OUTPUT: định dạng mặc định và bitrate (kbps) cho các định dạng nén
+    AUDIO_OUTPUT_DEFAULT_FORMAT = os.environ.get("AUDIO_OUTPUT_DEFAULT_FORMAT", "wav")
+    AUDIO_OPUS_BITRATE_KBPS = int(os.environ.get("AUDIO_OPUS_BITRATE_KBPS", "32"))
+    AUDIO_MP3_BITRATE_KBPS = int(os.environ.get("AUDIO_MP3_BITRATE_KBPS", "64"))
+    # CONSTANT mặc định vì header VBR (Xing) chỉ được ghi khi đóng file, không sửa được khi đã stream
+    AUDIO_MP3_BITRATE_MODE = os.environ.get("AUDIO_MP3_BITRATE_MODE", "CONSTANT")
+    # FLAC không mất dữ liệu, mức nén (0.0 - 1.0) chỉ ảnh hưởng kích thước và CPU
+    AUDIO_FLAC_COMPRESSION_LEVEL = float(os.environ.get("AUDIO_FLAC_COMPRESSION_LEVEL", "0.6"))
+    # OUTPUT STORE: hạn dùng file kết quả tạm, tổng dung lượng tối đa và chu kỳ dọn (giây)
+    OUTPUT_MAX_AGE_SECONDS = int(os.environ.get("OUTPUT_MAX_AGE_SECONDS", "3600"))
+    OUTPUT_MAX_TOTAL_BYTES = int(os.environ.get("OUTPUT_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024)))
+    OUTPUT_JANITOR_INTERVAL_SECONDS = float(os.environ.get("OUTPUT_JANITOR_INTERVAL_SECONDS", "60"))
+    # Thời gian giữ file kết quả khi client yêu cầu giữ lại để tải về sau (giây)
+    OUTPUT_RETAIN_DEFAULT_SECONDS = int(os.environ.get("OUTPUT_RETAIN_DEFAULT_SECONDS", "86400"))
+    OUTPUT_RETAIN_MAX_SECONDS = int(os.environ.get("OUTPUT_RETAIN_MAX_SECONDS", str(7 * 86400)))
+    # TRACING: bật ghi span cho từng request (header Server-Timing), ghi span ra file JSON lines nếu có đường dẫn
+    TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+    TRACE_SINK_PATH = os.environ.get("TRACE_SINK_PATH", "")
+    TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "2000"))
+    # Tạo bảng/chỉ mục khi worker khởi động (run_production.py tắt đi và chạy một lần trước khi fork worker)
+    INIT_DB_ON_STARTUP = os.environ.get("INIT_DB_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    # VIETTTS: địa chỉ server VietTTS (giọng miền Bắc) và thời gian chờ tối đa mỗi request (giây)
+    VIETTTS_URL = os.environ.get("VIETTTS_URL", "http://localhost:8298")
+    VIETTTS_TIMEOUT_SECONDS = float(os.environ.get("VIETTTS_TIMEOUT_SECONDS", "60"))
+    # Thống kê sử dụng được cộng dồn xuống database sau mỗi khoảng này (giây)
+    USAGE_FLUSH_INTERVAL_SECONDS = float(os.environ.get("USAGE_FLUSH_INTERVAL_SECONDS", "60"))
+    # Làm nóng cache khi khởi động: số profile dùng nhiều nhất và số cụm từ mỗi profile
+    WARMUP_TOP_PROFILES = int(os.environ.get("WARMUP_TOP_PROFILES", "20"))
+    WARMUP_PHRASES_PER_PROFILE = int(os.environ.get("WARMUP_PHRASES_PER_PROFILE", "50"))
+    # Tổng thời gian làm nóng (chạy nền, 0 = tắt) và thời gian tối đa startup chờ làm nóng trước khi nhận request
+    WARMUP_BUDGET_SECONDS = float(os.environ.get("WARMUP_BUDGET_SECONDS", "60"))
+    WARMUP_READY_BUDGET_SECONDS = float(os.environ.get("WARMUP_READY_BUDGET_SECONDS", "5"))
 
 
 
@@ -0,0 +1,214 @@
+import os
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from app.database.audio_format import to_canonical
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# PyAV là tùy chọn: nếu có thì giải mã được M4A/AAC ngay trong tiến trình
+try:
+    import av
+except ImportError:
+    av = None
+
+# Số tiến trình ffmpeg chạy song song tối đa khi phải dùng ffmpeg
+FFMPEG_WORKERS = int(os.environ.get("FFMPEG_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Thời gian tối đa cho một lần giải mã bằng ffmpeg (giây)
+FFMPEG_TIMEOUT_SECONDS = int(os.environ.get("FFMPEG_TIMEOUT_SECONDS", "60"))
+
+# Đường dẫn ffmpeg được tìm một lần, sau đó dùng lại cho mọi request
+_ffmpeg_binary = None
+_ffmpeg_resolved = False
+_ffmpeg_lock = threading.Lock()
+_ffmpeg_executor: Optional[ThreadPoolExecutor] = None
+_ffmpeg_pending = 0
+
+# Sample rate của luồng output trong log của ffmpeg, vd: "Audio: pcm_f32le, 44100 Hz, mono"
+_FFMPEG_RATE_PATTERN = re.compile(r"Audio: pcm_f32le[^,]*, (\d+) Hz")
+
+
+class AudioDecodeError(Exception):
+    """Lỗi khi không có backend nào giải mã được file audio"""
+
+
+def resolve_ffmpeg() -> Optional[str]:
+    """Tìm ffmpeg một lần (biến môi trường FFMPEG_BINARY hoặc PATH), trả về None nếu không có"""
+    global _ffmpeg_binary, _ffmpeg_resolved
+    if _ffmpeg_resolved:
+        return _ffmpeg_binary
+    with _ffmpeg_lock:
+        if not _ffmpeg_resolved:
+            candidate = os.environ.get("FFMPEG_BINARY") or "ffmpeg"
+            _ffmpeg_binary = shutil.which(candidate)
+            _ffmpeg_resolved = True
+            if _ffmpeg_binary:
+                logger.info("Sử dụng ffmpeg tại: %s", _ffmpeg_binary)
+            else:
+                logger.warning("Không tìm thấy ffmpeg, chỉ giải mã các định dạng libsndfile/PyAV hỗ trợ")
+    return _ffmpeg_binary
+
+
+def _get_ffmpeg_executor() -> ThreadPoolExecutor:
+    global _ffmpeg_executor
+    if _ffmpeg_executor is None:
+        with _ffmpeg_lock:
+            if _ffmpeg_executor is None:
+                _ffmpeg_executor = ThreadPoolExecutor(
+                    max_workers=FFMPEG_WORKERS, thread_name_prefix="ffmpeg-decode"
+                )
+    return _ffmpeg_executor
+
+
+def shutdown_decoder() -> None:
+    global _ffmpeg_executor
+    with _ffmpeg_lock:
+        if _ffmpeg_executor is not None:
+            _ffmpeg_executor.shutdown(wait=False)
+            _ffmpeg_executor = None
+
+
+def probe_audio(file_path) -> dict:
+    """
+    Đọc thông tin container một lần để chọn backend giải mã
+    Trả về dict gồm backend, format, samplerate, channels (None nếu không biết)
+    """
+    file_path = str(file_path)
+    try:
+        info = sf.info(file_path)
+        return {
+            "backend": "soundfile",
+            "format": info.format,
+            "samplerate": info.samplerate,
+            "channels": info.channels,
+        }
+    except Exception:
+        pass
+
+    if av is not None:
+        try:
+            with av.open(file_path) as container:
+                stream = container.streams.audio[0]
+                return {
+                    "backend": "av",
+                    "format": container.format.name,
+                    "samplerate": stream.rate,
+                    "channels": stream.channels,
+                }
+        except Exception:
+            pass
+
+    if resolve_ffmpeg():
+        return {"backend": "ffmpeg", "format": None, "samplerate": None, "channels": None}
+
+    raise AudioDecodeError(f"Không nhận dạng được định dạng file: {file_path}")
+
+
+def _decode_soundfile(file_path: str) -> Tuple[np.ndarray, int]:
+    data, sr = sf.read(file_path, dtype="float32", always_2d=False)
+    return data, sr
+
+
+def _decode_av(file_path: str) -> Tuple[np.ndarray, int]:
+    with av.open(file_path) as container:
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono")
+        chunks = []
+        sr = stream.rate
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+                sr = out.sample_rate
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    if not chunks:
+        raise AudioDecodeError(f"File không có dữ liệu audio: {file_path}")
+    return np.concatenate(chunks).astype(np.float32, copy=False), sr
+
+
+def _run_ffmpeg(file_path: str, target_sr: Optional[int]) -> Tuple[np.ndarray, int]:
+    ffmpeg_binary = resolve_ffmpeg()
+    if not ffmpeg_binary:
+        raise AudioDecodeError("Không tìm thấy ffmpeg")
+    # Giải mã thẳng ra stdout dạng float32 mono, không ghi file WAV tạm
+    cmd = [ffmpeg_binary, "-hide_banner", "-nostdin", "-i", file_path, "-vn", "-ac", "1"]
+    if target_sr:
+        cmd += ["-ar", str(target_sr)]
+    cmd += ["-f", "f32le", "pipe:1"]
+    completed = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS)
+    stderr = completed.stderr.decode("utf-8", errors="replace")
+    if completed.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg lỗi: {stderr.strip()[-500:]}")
+    rates = _FFMPEG_RATE_PATTERN.findall(stderr)
+    sr = target_sr or (int(rates[-1]) if rates else None)
+    if not sr:
+        raise AudioDecodeError("Không xác định được sample rate từ ffmpeg")
+    data = np.frombuffer(completed.stdout, dtype="<f4").astype(np.float32)
+    if len(data) == 0:
+        raise AudioDecodeError(f"File không có dữ liệu audio: {file_path}")
+    return data, sr
+
+
+def pending_ffmpeg_jobs() -> int:
+    """Số lần giải mã ffmpeg đang chạy hoặc đang chờ trong pool"""
+    return _ffmpeg_pending
+
+
+def _decode_ffmpeg(file_path: str, target_sr: Optional[int]) -> Tuple[np.ndarray, int]:
+    global _ffmpeg_pending
+    with _ffmpeg_lock:
+        _ffmpeg_pending += 1
+    try:
+        # Giới hạn số tiến trình ffmpeg chạy đồng thời bằng pool worker dùng chung
+        return _get_ffmpeg_executor().submit(_run_ffmpeg, file_path, target_sr).result()
+    finally:
+        with _ffmpeg_lock:
+            _ffmpeg_pending -= 1
+
+
+def decode_audio(file_path, target_sr: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Giải mã file audio (WAV/FLAC/OGG/MP3 qua libsndfile, M4A/AAC qua PyAV hoặc ffmpeg)
+    thành mảng numpy float32 mono
+    - target_sr: nếu có, resample về sample rate này
+    Trả về (audio, sample rate)
+    """
+    file_path = str(file_path)
+    probe = probe_audio(file_path)
+    backend = probe["backend"]
+
+    errors = []
+    data = None
+    sr = None
+    if backend == "soundfile":
+        try:
+            data, sr = _decode_soundfile(file_path)
+        except Exception as e:
+            # libsndfile đọc được header nhưng không giải mã được dữ liệu
+            errors.append(f"soundfile: {e}")
+            backend = "av" if av is not None else "ffmpeg"
+    if data is None and backend == "av":
+        try:
+            data, sr = _decode_av(file_path)
+        except Exception as e:
+            errors.append(f"av: {e}")
+            backend = "ffmpeg"
+    if data is None and backend == "ffmpeg":
+        try:
+            # ffmpeg đã trộn mono và resample sẵn
+            data, sr = _decode_ffmpeg(file_path, target_sr)
+        except Exception as e:
+            errors.append(f"ffmpeg: {e}")
+    if data is None:
+        raise AudioDecodeError(" | ".join(errors) or f"Không thể giải mã file: {file_path}")
+
+    target_sr = target_sr or sr
+    return to_canonical(data, sr, target_sr), target_sr
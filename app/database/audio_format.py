@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Định dạng chuẩn mặc định cho clip từ vựng: mono, float32 trong bộ nhớ, PCM 16-bit trên đĩa
+DEFAULT_SAMPLE_RATE = int(os.environ.get("CANONICAL_SAMPLE_RATE", "22050"))
+CANONICAL_DTYPE = np.float32
+CANONICAL_SUBTYPE = "PCM_16"
+# Tên file lưu định dạng chuẩn trong thư mục profile
+PROFILE_FORMAT_FILENAME = ".format.json"
+
+# Cache định dạng của profile: path -> (mtime_ns, format)
+_format_cache: Dict[str, tuple] = {}
+_format_lock = threading.Lock()
+
+
+def profile_format_path(profile_dir) -> Path:
+    return Path(profile_dir) / PROFILE_FORMAT_FILENAME
+
+
+def get_profile_format(profile_dir) -> dict:
+    """Đọc định dạng chuẩn của profile, dùng mặc định nếu chưa được thiết lập"""
+    path = profile_format_path(profile_dir)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {"sample_rate": DEFAULT_SAMPLE_RATE, "channels": 1, "subtype": CANONICAL_SUBTYPE}
+
+    cached = _format_cache.get(str(path))
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        profile_format = {
+            "sample_rate": int(stored.get("sample_rate", DEFAULT_SAMPLE_RATE)),
+            "channels": 1,
+            "subtype": stored.get("subtype", CANONICAL_SUBTYPE),
+        }
+    except Exception as e:
+        logger.error("Lỗi khi đọc định dạng profile %s: %s", path, e)
+        return {"sample_rate": DEFAULT_SAMPLE_RATE, "channels": 1, "subtype": CANONICAL_SUBTYPE}
+
+    with _format_lock:
+        _format_cache[str(path)] = (mtime_ns, profile_format)
+    return profile_format
+
+
+def get_profile_sample_rate(profile_dir) -> int:
+    return get_profile_format(profile_dir)["sample_rate"]
+
+
+def set_profile_format(profile_dir, sample_rate: int, subtype: str = CANONICAL_SUBTYPE) -> dict:
+    """Ghi định dạng chuẩn cho profile"""
+    Path(profile_dir).mkdir(parents=True, exist_ok=True)
+    path = profile_format_path(profile_dir)
+    profile_format = {"sample_rate": int(sample_rate), "channels": 1, "subtype": subtype}
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(profile_format, f)
+    os.replace(temp_path, path)
+    with _format_lock:
+        _format_cache.pop(str(path), None)
+    return profile_format
+
+
+def ensure_profile_format(profile_dir) -> dict:
+    """Ghi định dạng mặc định cho profile nếu chưa có, để profile không đổi định dạng khi cấu hình đổi"""
+    if not profile_format_path(profile_dir).exists():
+        return set_profile_format(profile_dir, DEFAULT_SAMPLE_RATE)
+    return get_profile_format(profile_dir)
+
+
+def to_canonical(audio_data: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    """Chuyển audio về mono float32 với sample rate chuẩn"""
+    audio_data = np.asarray(audio_data)
+    if audio_data.ndim > 1:
+        # soundfile trả về (samples, channels)
+        audio_data = audio_data.mean(axis=1)
+    audio_data = audio_data.astype(CANONICAL_DTYPE, copy=False)
+    if sr != target_sr:
+        audio_data = librosa.resample(audio_data, orig_sr=sr, target_sr=target_sr)
+    return audio_data.astype(CANONICAL_DTYPE, copy=False)
+
+
+def is_canonical_file(file_path, target_sr: int) -> bool:
+    """Kiểm tra nhanh qua header file, không giải mã dữ liệu"""
+    try:
+        info = sf.info(str(file_path))
+    except Exception:
+        return False
+    return (
+        info.format == "WAV"
+        and info.samplerate == target_sr
+        and info.channels == 1
+        and info.subtype == CANONICAL_SUBTYPE
+    )
+
+
+def normalize_clip_file(file_path, target_sr: int) -> bool:
+    """
+    Chuyển file clip về định dạng chuẩn (WAV PCM 16-bit mono, sample rate chuẩn)
+    Trả về True nếu file đã được ghi lại, False nếu file đã đúng định dạng
+    """
+    file_path = str(file_path)
+    if is_canonical_file(file_path, target_sr):
+        return False
+    data, sr = sf.read(file_path, dtype="float32", always_2d=False)
+    canonical = to_canonical(data, sr, target_sr)
+    temp_path = file_path + ".canonical.wav"
+    sf.write(temp_path, canonical, target_sr, subtype=CANONICAL_SUBTYPE, format="WAV")
+    os.replace(temp_path, file_path)
+    return True
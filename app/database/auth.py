@@ -1,9 +1,18 @@
-from fastapi import Depends, HTTPException, status
+from datetime import datetime, timedelta, timezone
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwt
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
-from app.database.connection import get_db
-from app.database.user_crud import get_user_by_username, verify_password
-from app.models.user import User
+from app.config import settings
+from app.database.connection import SessionLocal, get_db
+from app.database.user_cache import cache_user, get_cached_user
+from app.database.user_crud import get_user_by_id, get_user_by_username, verify_password
+from app.models.user import CurrentUser, User
+
+# Đọc token từ header "Authorization: Bearer {token}"
+bearer_scheme = HTTPBearer(auto_error=False)
 
 # Hàm xác thực người dùng
 def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
@@ -14,4 +23,111 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         return None
     if not user.active:
         return None
-    return user 
\ No newline at end of file
+    return user
+
+# Tạo JWT access token cho user
+def create_access_token(user: User, expires_delta: Optional[timedelta] = None) -> str:
+    expire = datetime.now(timezone.utc) + (
+        expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    payload = {
+        "sub": str(user.id),
+        "username": user.username,
+        "exp": expire,
+    }
+    return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+# Giải mã token và trả về user_id, raise 401 nếu token không hợp lệ hoặc hết hạn
+def decode_access_token(token: str) -> int:
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        return int(payload["sub"])
+    except (JWTError, KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token không hợp lệ hoặc đã hết hạn",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+# Đọc user từ database khi cache không có (chạy trong threadpool)
+def _load_user_principal(user_id: int) -> Optional[CurrentUser]:
+    db = SessionLocal()
+    try:
+        user = get_user_by_id(db, user_id)
+        if user is None:
+            return None
+        return cache_user(user)
+    finally:
+        db.close()
+
+# Lấy thông tin user từ token: ưu tiên cache, chỉ truy vấn database khi cache hết hạn
+async def resolve_token_user(token: str) -> CurrentUser:
+    user_id = decode_access_token(token)
+    principal = get_cached_user(user_id)
+    if principal is None:
+        principal = await run_in_threadpool(_load_user_principal, user_id)
+    if principal is None or not principal.active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Tài khoản không tồn tại hoặc đã bị vô hiệu hóa",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+# Dependency: bắt buộc phải có token hợp lệ
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> CurrentUser:
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Chưa đăng nhập",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await resolve_token_user(credentials.credentials)
+
+# Dependency: token không bắt buộc, trả về None nếu không có
+async def get_optional_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> Optional[CurrentUser]:
+    if credentials is None:
+        return None
+    return await resolve_token_user(credentials.credentials)
+
+# Dependency: nếu có token thì user_id trong request phải trùng với user của token (trừ admin)
+async def verify_user_access(
+    request: Request,
+    current_user: Optional[CurrentUser] = Depends(get_optional_current_user),
+) -> Optional[CurrentUser]:
+    if current_user is None:
+        return None
+    user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+    if user_id is not None and current_user.usertype != "admin":
+        try:
+            same_user = int(user_id) == current_user.id
+        except ValueError:
+            same_user = False
+        if not same_user:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Bạn không có quyền truy cập dữ liệu của người dùng khác",
+            )
+    return current_user
+
+# Dependency cho các route tính phí: bắt buộc có token, user_id trong request phải trùng với user của token (trừ admin)
+async def require_user_access(
+    request: Request,
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
+    return await verify_user_access(request, current_user)
+
+# Dependency: bắt buộc đăng nhập bằng tài khoản admin
+async def require_admin(
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
+    if current_user.usertype != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Chỉ admin mới được thực hiện thao tác này",
+        )
+    return current_user
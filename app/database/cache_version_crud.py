@@ -0,0 +1,25 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.cache_version import CacheVersion
+
+# Lấy phiên bản hiện tại của một cache (0 nếu chưa có)
+def get_cache_version(db: Session, name: str) -> int:
+    version = db.query(CacheVersion.version).filter(CacheVersion.name == name).scalar()
+    return version or 0
+
+# Tăng phiên bản của một cache (nguyên tử), trả về phiên bản mới
+def bump_cache_version(db: Session, name: str) -> int:
+    updated = db.query(CacheVersion).filter(CacheVersion.name == name).update(
+        {CacheVersion.version: CacheVersion.version + 1}, synchronize_session=False
+    )
+    if updated == 0:
+        try:
+            db.add(CacheVersion(name=name, version=1))
+            db.commit()
+        except IntegrityError:
+            # Worker khác vừa tạo bản ghi, tăng lại lần nữa
+            db.rollback()
+            return bump_cache_version(db, name)
+    else:
+        db.commit()
+    return get_cache_version(db, name)
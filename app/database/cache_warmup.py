@@ -0,0 +1,107 @@
+# Làm nóng cache sau khi khởi động theo thống kê sử dụng (bảng usage_stats):
+# profile dùng nhiều nhất được nạp trước (chỉ mục từ vựng, segment clip dùng chung, các cụm từ hay dùng nhất)
+# trong giới hạn WARMUP_BUDGET_SECONDS; startup chỉ chờ tối đa WARMUP_READY_BUDGET_SECONDS, phần còn lại chạy nền.
+
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.database.clip_store import request_clips
+from app.database.connection import SessionLocal
+from app.database.phrase_cache import seed_phrase_counts
+from app.database.usage_stats import PHRASE_SEPARATOR, top_entries, top_profiles
+from app.database.vocabulary_index import get_vocabulary_index
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_done_event = threading.Event()
+_stop_event = threading.Event()
+_warmup_thread: Optional[threading.Thread] = None
+_summary = {"state": "idle", "profiles": 0, "phrases": 0, "errors": 0, "seconds": 0.0}
+
+
+def warm_up(budget_seconds: float) -> dict:
+    """Làm nóng cache theo thứ tự ưu tiên, dừng khi hết thời gian; trả về tóm tắt"""
+    # Import trong hàm để tránh import vòng (voice_service import các module cache)
+    from app.database.voice_service import synthesize_speech
+
+    started = time.monotonic()
+    deadline = started + budget_seconds
+    _summary.update(state="running", profiles=0, phrases=0, errors=0, seconds=0.0)
+    db = SessionLocal()
+    try:
+        profiles = top_profiles(db, settings.WARMUP_TOP_PROFILES)
+        # Leader của kho clip tạo segment theo thứ tự này ở nền, không tính vào thời gian của worker
+        request_clips([(user_id, profile_id) for profile_id, user_id, _ in profiles])
+        for profile_id, user_id, _ in profiles:
+            if _stop_event.is_set() or time.monotonic() >= deadline:
+                break
+            get_vocabulary_index(db, profile_id)
+            phrases = [
+                tuple(entry.split(PHRASE_SEPARATOR))
+                for entry, _ in top_entries(db, profile_id, "phrase", settings.WARMUP_PHRASES_PER_PROFILE)
+            ]
+            # Cụm từ đủ tần suất được ghép và lưu vào cache cụm từ ngay ở lần ghép đầu tiên
+            seed_phrase_counts(profile_id, phrases)
+            for phrase in phrases:
+                if _stop_event.is_set() or time.monotonic() >= deadline:
+                    break
+                try:
+                    synthesize_speech(profile_id, user_id, " ".join(phrase), db, count_usage=False)
+                    _summary["phrases"] += 1
+                except HTTPException as e:
+                    # Từ trong cụm đã bị xóa khỏi vocabulary
+                    logger.debug("Bỏ qua cụm từ %s của profile %s: %s", phrase, profile_id, e.detail)
+                    _summary["errors"] += 1
+            _summary["profiles"] += 1
+    except Exception as e:
+        logger.error("Lỗi khi làm nóng cache: %s", e)
+        _summary["errors"] += 1
+    finally:
+        db.close()
+    _summary.update(state="done", seconds=round(time.monotonic() - started, 3))
+    logger.info(
+        "Làm nóng cache: %d profile, %d cụm từ trong %.1fs",
+        _summary["profiles"], _summary["phrases"], _summary["seconds"],
+    )
+    return dict(_summary)
+
+
+def _warmup_loop() -> None:
+    try:
+        warm_up(settings.WARMUP_BUDGET_SECONDS)
+    finally:
+        _done_event.set()
+
+
+def start_warmup() -> None:
+    """Chạy làm nóng cache trong thread nền (WARMUP_BUDGET_SECONDS <= 0 để tắt)"""
+    global _warmup_thread
+    if settings.WARMUP_BUDGET_SECONDS <= 0 or (_warmup_thread is not None and _warmup_thread.is_alive()):
+        _done_event.set()
+        return
+    _done_event.clear()
+    _stop_event.clear()
+    _warmup_thread = threading.Thread(target=_warmup_loop, name="cache-warmup", daemon=True)
+    _warmup_thread.start()
+
+
+def wait_for_warmup(timeout: float) -> bool:
+    """Chờ làm nóng xong tối đa timeout giây, trả về True nếu đã xong"""
+    return _done_event.wait(timeout)
+
+
+def stop_warmup(timeout: float = 5.0) -> None:
+    global _warmup_thread
+    _stop_event.set()
+    if _warmup_thread is not None:
+        _warmup_thread.join(timeout)
+        _warmup_thread = None
+
+
+def warmup_summary() -> dict:
+    return dict(_summary)
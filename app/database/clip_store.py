@@ -0,0 +1,515 @@
+# Kho clip từ vựng đã xử lý dùng chung giữa các worker trên cùng máy.
+# Mỗi profile có một file segment bất biến (header JSON + dữ liệu float32 của mọi clip) trong thư mục tmpfs (/dev/shm),
+# các worker mmap chỉ đọc nên bộ nhớ clip tăng theo số profile chứ không theo số worker.
+# Một worker giữ file lock (leader) tạo/giải phóng segment; worker khác chỉ đọc và đánh dấu profile cần tạo lại.
+# Worker chuyển sang segment mới qua file con trỏ được thay nguyên tử (os.replace), đường đọc không cần khóa giữa các process.
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.database.noise_profile import noise_profile_path
+from app.utils.metrics import inc
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CLIP_STORE_ENABLED = os.environ.get("CLIP_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Thư mục dùng chung của các worker (nên là tmpfs); các deployment khác nhau trên cùng máy cần thư mục khác nhau
+CLIP_STORE_DIR = os.environ.get(
+    "CLIP_STORE_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "tts_clip_store"),
+)
+# Tổng dung lượng segment tối đa, vượt quá thì giải phóng profile lâu không dùng nhất
+CLIP_STORE_MAX_BYTES = int(os.environ.get("CLIP_STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Giải phóng segment của profile không được dùng trong khoảng thời gian này (giây)
+CLIP_STORE_IDLE_SECONDS = float(os.environ.get("CLIP_STORE_IDLE_SECONDS", "3600"))
+CLIP_STORE_POLL_SECONDS = float(os.environ.get("CLIP_STORE_POLL_SECONDS", "2"))
+# Mỗi worker cập nhật thời điểm dùng profile tối đa một lần trong khoảng này (giây)
+TOUCH_INTERVAL_SECONDS = 10.0
+# Chừa lại dung lượng trống của tmpfs khi tạo segment
+FREE_SPACE_MARGIN_BYTES = 16 * 1024 * 1024
+
+MAGIC = b"TTSCLIP1"
+HEADER = struct.Struct("<8sQ")
+DATA_ALIGNMENT = 16
+
+_lock = threading.Lock()
+# "{user_id}_{profile_id}" -> segment đang mmap: pointer (inode, mtime), mmap, index, users, retired, stale_marked
+_attached: Dict[str, dict] = {}
+_last_touch: Dict[str, float] = {}
+_stats = {"hits": 0, "misses": 0, "builds": 0, "evictions": 0}
+
+_leader_fd: Optional[int] = None
+# Profile không tạo được segment (quá lớn, hết chỗ), chỉ thử lại khi có đánh dấu stale mới
+_unbuildable = set()
+_store_thread: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+
+
+def _key(user_id: int, profile_id: int) -> str:
+    return f"{user_id}_{profile_id}"
+
+
+def _path(key: str, suffix: str) -> str:
+    return os.path.join(CLIP_STORE_DIR, f"p{key}.{suffix}")
+
+
+def _file_signature(path) -> Optional[Tuple[int, int]]:
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+def _noise_signature(profile_dir) -> Optional[list]:
+    signature = _file_signature(noise_profile_path(profile_dir))
+    return list(signature) if signature is not None else None
+
+
+def _touch(path: str) -> bool:
+    try:
+        with open(path, "a"):
+            pass
+        os.utime(path)
+        return True
+    except OSError as e:
+        logger.debug("Không cập nhật được %s: %s", path, e)
+        return False
+
+
+def _mark_used(key: str) -> None:
+    now = time.monotonic()
+    if now - _last_touch.get(key, 0.0) < TOUCH_INTERVAL_SECONDS:
+        return
+    if _touch(_path(key, "want")):
+        _last_touch[key] = now
+
+
+def _mark_stale(segment: dict, key: str) -> None:
+    # Nhờ leader tạo lại segment (mỗi segment chỉ đánh dấu một lần)
+    if segment["stale_marked"]:
+        return
+    segment["stale_marked"] = True
+    _touch(_path(key, "stale"))
+
+
+# ----- Đọc segment (mọi worker) -----
+
+def _read_pointer(key: str) -> Optional[dict]:
+    try:
+        with open(_path(key, "json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pointer_stamp(key: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat_result = os.stat(_path(key, "json"))
+    except OSError:
+        return None
+    return stat_result.st_ino, stat_result.st_mtime_ns
+
+
+def _map_segment(path: str) -> Tuple[mmap.mmap, dict]:
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, index_length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        mapped.close()
+        raise ValueError(f"Segment không hợp lệ: {path}")
+    index = json.loads(mapped[HEADER.size:HEADER.size + index_length].decode("utf-8"))
+    return mapped, index
+
+
+def _retire(key: str) -> None:
+    # Gọi khi giữ _lock: bỏ segment cũ, đóng mmap khi không còn request nào đang đọc
+    segment = _attached.pop(key, None)
+    if segment is not None:
+        segment["retired"] = True
+        if segment["users"] == 0:
+            segment["mmap"].close()
+
+
+def _acquire_segment(key: str) -> Optional[dict]:
+    stamp = _pointer_stamp(key)
+    with _lock:
+        segment = _attached.get(key)
+        if segment is not None and segment["stamp"] != stamp:
+            _retire(key)
+            segment = None
+        if segment is None and stamp is not None:
+            pointer = _read_pointer(key)
+            if pointer is None:
+                return None
+            try:
+                mapped, index = _map_segment(os.path.join(CLIP_STORE_DIR, pointer["segment"]))
+            except (OSError, ValueError) as e:
+                # Segment vừa bị leader thay thế hoặc giải phóng
+                logger.debug("Không mở được segment của profile %s: %s", key, e)
+                return None
+            segment = {
+                "stamp": stamp, "mmap": mapped, "index": index,
+                "users": 0, "retired": False, "stale_marked": False,
+            }
+            _attached[key] = segment
+        if segment is not None:
+            segment["users"] += 1
+        return segment
+
+
+def _release_segment(segment: dict) -> None:
+    with _lock:
+        segment["users"] -= 1
+        if segment["retired"] and segment["users"] == 0:
+            segment["mmap"].close()
+
+
+def _copy_clip(segment: dict, key: str, word: str, audio_path: str) -> Optional[np.ndarray]:
+    index = segment["index"]
+    entry = index["clips"].get(word)
+    if entry is None:
+        # Từ mới thêm sau khi tạo segment; từ xử lý lỗi lúc tạo segment thì không cần tạo lại
+        if word not in index["failed"]:
+            _mark_stale(segment, key)
+        return None
+    offset, length, path, mtime_ns, size = entry
+    if path != audio_path or _file_signature(audio_path) != (mtime_ns, size):
+        # Từ đã được ghi âm lại
+        _mark_stale(segment, key)
+        return None
+    # Bước ghép câu có thể sửa mảng tại chỗ nên luôn trả về bản sao
+    return np.frombuffer(segment["mmap"], dtype=np.float32, count=length, offset=offset).copy()
+
+
+def _no_clip(word: str, audio_path: str) -> Optional[np.ndarray]:
+    return None
+
+
+@contextmanager
+def shared_clips(user_id: int, profile_id: int, profile_dir, sampling_rate: int):
+    """
+    Dùng trong khối with khi ghép câu: trả về hàm lookup(word, audio_path) -> clip đã xử lý (float32, sample rate chuẩn
+    của profile) hoặc None nếu kho chưa có clip hợp lệ (khi đó đọc và xử lý file như bình thường).
+    Clip đã đổi (ghi âm lại, mô hình nhiễu hoặc sample rate thay đổi) được coi là không có và profile được đánh dấu tạo lại.
+    """
+    if not CLIP_STORE_ENABLED:
+        yield _no_clip
+        return
+    key = _key(user_id, profile_id)
+    _mark_used(key)
+    segment = _acquire_segment(key)
+    if segment is None:
+        inc("tts_cache_requests_total", cache="clip_store", result="miss")
+        yield _no_clip
+        return
+    try:
+        index = segment["index"]
+        if index["sample_rate"] != sampling_rate or index["noise"] != _noise_signature(profile_dir):
+            _mark_stale(segment, key)
+            inc("tts_cache_requests_total", cache="clip_store", result="stale")
+            yield _no_clip
+            return
+
+        def lookup(word: str, audio_path: str) -> Optional[np.ndarray]:
+            clip = _copy_clip(segment, key, word, audio_path)
+            with _lock:
+                _stats["hits" if clip is not None else "misses"] += 1
+            return clip
+
+        inc("tts_cache_requests_total", cache="clip_store", result="hit")
+        yield lookup
+    finally:
+        _release_segment(segment)
+
+
+def _sweep_attached() -> None:
+    # Bỏ mmap của segment đã bị thay thế hoặc giải phóng để bộ nhớ được trả lại
+    with _lock:
+        keys = list(_attached)
+    for key in keys:
+        stamp = _pointer_stamp(key)
+        with _lock:
+            segment = _attached.get(key)
+            if segment is not None and segment["stamp"] != stamp:
+                _retire(key)
+
+
+def request_clips(profiles: Sequence[Tuple[int, int]]) -> None:
+    """
+    Nhờ leader tạo segment cho các profile (user_id, profile_id) chưa được dùng kể từ khi khởi động,
+    theo thứ tự ưu tiên giảm dần (leader tạo profile có thời điểm dùng gần nhất trước)
+    """
+    if not CLIP_STORE_ENABLED:
+        return
+    now = time.time()
+    for rank, (user_id, profile_id) in enumerate(profiles):
+        path = _path(_key(user_id, profile_id), "want")
+        if os.path.exists(path):
+            continue
+        if _touch(path):
+            stamp = now - rank * 0.001
+            os.utime(path, (stamp, stamp))
+
+
+# ----- Tạo và giải phóng segment (chỉ leader) -----
+
+def _become_leader() -> bool:
+    global _leader_fd
+    if _leader_fd is not None:
+        return True
+    fd = os.open(os.path.join(CLIP_STORE_DIR, "leader.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _leader_fd = fd
+    logger.info("Worker %s quản lý kho clip dùng chung %s", os.getpid(), CLIP_STORE_DIR)
+    _remove_orphans()
+    return True
+
+
+def _resign_leader() -> None:
+    global _leader_fd
+    if _leader_fd is not None:
+        os.close(_leader_fd)
+        _leader_fd = None
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_orphans() -> None:
+    # Segment không còn file con trỏ nào trỏ tới (leader trước dừng giữa chừng)
+    referenced = set()
+    for name in os.listdir(CLIP_STORE_DIR):
+        if name.endswith(".json"):
+            pointer = _read_pointer(name[1:-len(".json")])
+            if pointer is not None:
+                referenced.add(pointer["segment"])
+    for name in os.listdir(CLIP_STORE_DIR):
+        if (name.endswith(".clips") and name not in referenced) or name.endswith(".tmp"):
+            _unlink(os.path.join(CLIP_STORE_DIR, name))
+
+
+def _evict(key: str) -> None:
+    pointer = _read_pointer(key)
+    _unlink(_path(key, "json"))
+    _unlink(_path(key, "want"))
+    if pointer is not None:
+        # Worker đang mmap vẫn đọc được cho tới khi đóng, bộ nhớ được trả lại khi không còn ai dùng
+        _unlink(os.path.join(CLIP_STORE_DIR, pointer["segment"]))
+    with _lock:
+        _stats["evictions"] += 1
+
+
+def _write_segment(key: str, sampling_rate: int, noise, clips: Dict[str, tuple], failed: List[str]) -> Optional[int]:
+    """Ghi segment mới và chuyển con trỏ sang segment đó, trả về kích thước (None nếu không đủ chỗ)"""
+    index = {"sample_rate": sampling_rate, "noise": noise, "clips": {}, "failed": failed}
+    # Độ dài phần header phụ thuộc offset nên tính offset với chỗ dành sẵn đủ lớn rồi mới ghi
+    reserve = len(json.dumps({**index, "clips": {w: [0, 0, p, m, s] for w, (_, p, m, s) in clips.items()}},
+                             ensure_ascii=False).encode("utf-8")) + 32 * len(clips) + 64
+    offset = -(-(HEADER.size + reserve) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    data_start = offset
+    for word, (audio, path, mtime_ns, size) in clips.items():
+        index["clips"][word] = [offset, len(audio), path, mtime_ns, size]
+        offset += -(-audio.nbytes // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    total = offset
+    if total > CLIP_STORE_MAX_BYTES:
+        logger.warning("Clip của profile %s cần %d byte, vượt CLIP_STORE_MAX_BYTES", key, total)
+        return None
+    usage = os.statvfs(CLIP_STORE_DIR)
+    if usage.f_bavail * usage.f_frsize < total + FREE_SPACE_MARGIN_BYTES:
+        logger.warning("Không đủ chỗ trong %s cho clip của profile %s (%d byte)", CLIP_STORE_DIR, key, total)
+        return None
+
+    header = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    name = f"p{key}.{time.time_ns()}.clips"
+    tmp_path = os.path.join(CLIP_STORE_DIR, name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - HEADER.size - len(header)))
+        for audio, _, _, _ in clips.values():
+            data = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+            f.write(data)
+            f.write(b"\0" * (-len(data) % DATA_ALIGNMENT))
+    os.replace(tmp_path, os.path.join(CLIP_STORE_DIR, name))
+
+    previous = _read_pointer(key)
+    pointer_tmp = _path(key, "json.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        json.dump({"segment": name, "bytes": total, "words": len(clips), "built_at": time.time()}, f)
+    os.replace(pointer_tmp, _path(key, "json"))
+    if previous is not None and previous["segment"] != name:
+        _unlink(os.path.join(CLIP_STORE_DIR, previous["segment"]))
+    return total
+
+
+def _build(key: str) -> None:
+    # Import trong hàm để tránh import vòng (voice_service dùng module này)
+    from app.database.connection import SessionLocal
+    from app.database.audio_format import get_profile_sample_rate
+    from app.database.noise_profile import load_noise_profile
+    from app.database.vocabulary_index import get_vocabulary_index
+    from app.database.voice_service import VOICE_PROFILES_DIR, load_vocabulary_clip
+
+    user_id, profile_id = (int(part) for part in key.split("_"))
+    profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
+    if not profile_dir.is_dir():
+        # Profile đã bị xóa
+        _unlink(_path(key, "stale"))
+        _evict(key)
+        return
+    # Xóa đánh dấu trước khi tạo để thay đổi trong lúc tạo sẽ được đánh dấu lại
+    _unlink(_path(key, "stale"))
+    _unbuildable.discard(key)
+
+    db = SessionLocal()
+    try:
+        audio_paths = dict(get_vocabulary_index(db, profile_id)["audio_paths"])
+    finally:
+        db.close()
+    sampling_rate = get_profile_sample_rate(profile_dir)
+    # Lấy dấu vết trước khi đọc để thay đổi xảy ra trong lúc tạo làm segment bị coi là cũ chứ không bị bỏ sót
+    noise = _noise_signature(profile_dir)
+    noise_profile = load_noise_profile(profile_dir)
+
+    # Dùng lại clip chưa đổi của segment hiện tại (chỉ khi cùng mô hình nhiễu và sample rate)
+    previous = _acquire_segment(key)
+    try:
+        reusable = (
+            previous is not None
+            and previous["index"]["sample_rate"] == sampling_rate
+            and previous["index"]["noise"] == noise
+        )
+        started = time.perf_counter()
+        clips: Dict[str, tuple] = {}
+        failed: List[str] = []
+        for word, audio_path in audio_paths.items():
+            if _stop_event.is_set():
+                # Đang tắt: để leader tiếp theo tạo lại
+                _touch(_path(key, "stale"))
+                return
+            signature = _file_signature(audio_path)
+            if signature is None:
+                failed.append(word)
+                continue
+            entry = previous["index"]["clips"].get(word) if reusable else None
+            if entry is not None and entry[2] == audio_path and tuple(entry[3:]) == signature:
+                audio = np.frombuffer(previous["mmap"], dtype=np.float32, count=entry[1], offset=entry[0]).copy()
+            else:
+                try:
+                    audio = load_vocabulary_clip(word, audio_path, noise_profile, sampling_rate)
+                except Exception as e:
+                    logger.debug("Bỏ qua từ '%s' của profile %s: %s", word, key, e)
+                    failed.append(word)
+                    continue
+            clips[word] = (audio, audio_path) + signature
+    finally:
+        if previous is not None:
+            _release_segment(previous)
+
+    total = _write_segment(key, sampling_rate, noise, clips, failed)
+    if total is None:
+        _unbuildable.add(key)
+        return
+    with _lock:
+        _stats["builds"] += 1
+    logger.info("Đã tạo segment clip cho profile %s: %d từ, %d byte, %.1fs",
+                key, len(clips), total, time.perf_counter() - started)
+
+
+def _maintain() -> None:
+    now = time.time()
+    wanted: Dict[str, float] = {}
+    stale = set()
+    built: Dict[str, int] = {}
+    for name in os.listdir(CLIP_STORE_DIR):
+        if not name.startswith("p"):
+            continue
+        key, _, suffix = name[1:].partition(".")
+        if suffix == "want":
+            signature = _file_signature(os.path.join(CLIP_STORE_DIR, name))
+            if signature is not None:
+                wanted[key] = signature[0] / 1e9
+        elif suffix == "stale":
+            stale.add(key)
+        elif suffix == "json":
+            pointer = _read_pointer(key)
+            if pointer is not None:
+                built[key] = pointer["bytes"]
+
+    # Giải phóng profile lâu không dùng, sau đó theo thứ tự ít dùng gần đây nhất khi vượt dung lượng
+    for key in list(built):
+        if now - wanted.get(key, 0.0) > CLIP_STORE_IDLE_SECONDS:
+            _evict(key)
+            built.pop(key)
+    for key in sorted(built, key=lambda k: wanted.get(k, 0.0)):
+        if sum(built.values()) <= CLIP_STORE_MAX_BYTES:
+            break
+        _evict(key)
+        built.pop(key)
+
+    # Tạo segment cho profile đang được dùng mà chưa có hoặc đã cũ, profile dùng gần đây nhất trước
+    for key in sorted(wanted, key=wanted.get, reverse=True):
+        if _stop_event.is_set():
+            return
+        if now - wanted[key] > CLIP_STORE_IDLE_SECONDS:
+            continue
+        if key in stale or (key not in built and key not in _unbuildable):
+            _build(key)
+
+
+def _store_loop():
+    while not _stop_event.wait(CLIP_STORE_POLL_SECONDS):
+        try:
+            _sweep_attached()
+            if _become_leader():
+                _maintain()
+        except Exception as e:
+            logger.error("Lỗi khi cập nhật kho clip dùng chung: %s", e)
+
+
+def start_clip_store() -> None:
+    """Khởi động thread nền của kho clip (mọi worker; worker giữ được file lock sẽ tạo/giải phóng segment)"""
+    global _store_thread
+    if not CLIP_STORE_ENABLED or (_store_thread is not None and _store_thread.is_alive()):
+        return
+    os.makedirs(CLIP_STORE_DIR, exist_ok=True)
+    _stop_event.clear()
+    _store_thread = threading.Thread(target=_store_loop, name="clip-store", daemon=True)
+    _store_thread.start()
+
+
+def stop_clip_store(timeout: float = 5.0) -> None:
+    global _store_thread
+    _stop_event.set()
+    if _store_thread is not None:
+        _store_thread.join(timeout)
+        _store_thread = None
+    # Segment được giữ lại cho leader tiếp theo, chỉ nhả file lock
+    _resign_leader()
+
+
+def clip_store_stats() -> dict:
+    with _lock:
+        stats = dict(_stats, attached=len(_attached), leader=_leader_fd is not None)
+        stats["attached_bytes"] = sum(len(segment["mmap"]) for segment in _attached.values())
+    return stats
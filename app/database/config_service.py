@@ -1,9 +1,125 @@
+import base64
+import binascii
+import hashlib
+import json
+import threading
+import time
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
+from app.config import settings
 from app.models.config import ConfigUpdate, Config
 from app.database.config_crud import get_config, upsert_config
+from app.database.cache_version_crud import get_cache_version, bump_cache_version
+
+# Tên bộ đếm phiên bản của cấu hình trong bảng cache_versions
+CONFIG_CACHE_NAME = "config"
+
+# Cache cấu hình trong bộ nhớ của worker (thay thế nguyên khối, không sửa tại chỗ)
+_config_cache: Optional[Dict[str, Any]] = None
+_config_cache_lock = threading.Lock()
+
+# Chữ ký nhận dạng định dạng ảnh từ các byte đầu file
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"\x00\x00\x01\x00", "image/x-icon"),
+]
+
+def _content_hash(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+def _make_etag(payload: bytes) -> str:
+    return f'"{_content_hash(payload)}"'
+
+# Giải mã logo base64 (hỗ trợ cả dạng data URI "data:image/png;base64,...")
+def _decode_logo(logo_base64: Optional[str]):
+    if not logo_base64:
+        return None, None
+    media_type = None
+    data = logo_base64.strip()
+    if data.startswith("data:"):
+        header, _, data = data.partition(",")
+        media_type = header[5:].split(";")[0] or None
+    try:
+        logo_bytes = base64.b64decode(data)
+    except (binascii.Error, ValueError):
+        return None, None
+    if media_type is None:
+        for signature, guessed_type in _IMAGE_SIGNATURES:
+            if logo_bytes.startswith(signature):
+                media_type = guessed_type
+                break
+        else:
+            if logo_bytes[:4] == b"RIFF" and logo_bytes[8:12] == b"WEBP":
+                media_type = "image/webp"
+            elif b"<svg" in logo_bytes[:512]:
+                media_type = "image/svg+xml"
+            else:
+                media_type = "application/octet-stream"
+    return logo_bytes, media_type
+
+# Tạo bản cache từ bản ghi cấu hình
+def _build_config_cache(db_config: Config, version: int) -> Dict[str, Any]:
+    logo_bytes, logo_media_type = _decode_logo(db_config.logo_base64)
+    logo_hash = _content_hash(logo_bytes) if logo_bytes else None
+
+    data = {
+        "id": db_config.id,
+        "website_url": db_config.website_url,
+        "website_name": db_config.website_name,
+        "logo_base64": db_config.logo_base64,
+        "phone_1": db_config.phone_1,
+        "phone_2": db_config.phone_2,
+        "email": db_config.email,
+        # Tham số v đổi theo nội dung logo nên client có thể cache vĩnh viễn
+        "logo_url": f"/config/logo?v={logo_hash}" if logo_hash else None,
+    }
+    data_without_logo = dict(data, logo_base64=None)
+
+    return {
+        "version": version,
+        "checked_at": time.monotonic(),
+        "data": data,
+        "etag": _make_etag(json.dumps(data, sort_keys=True).encode("utf-8")),
+        "data_without_logo": data_without_logo,
+        "etag_without_logo": _make_etag(json.dumps(data_without_logo, sort_keys=True).encode("utf-8")),
+        "logo_bytes": logo_bytes,
+        "logo_media_type": logo_media_type,
+        "logo_hash": logo_hash,
+    }
+
+# Lấy cấu hình từ cache, chỉ đọc lại database khi phiên bản thay đổi
+def get_cached_config(db: Session) -> Dict[str, Any]:
+    global _config_cache
+    cache = _config_cache
+    now = time.monotonic()
+    if cache is not None and now - cache["checked_at"] < settings.CONFIG_CACHE_CHECK_SECONDS:
+        return cache
+
+    with _config_cache_lock:
+        # Kiểm tra lại sau khi lấy lock, có thể thread khác vừa nạp xong
+        cache = _config_cache
+        if cache is not None and time.monotonic() - cache["checked_at"] < settings.CONFIG_CACHE_CHECK_SECONDS:
+            return cache
+
+        # Chỉ đọc bộ đếm phiên bản (truy vấn rất nhẹ) để biết worker khác đã cập nhật chưa
+        version = get_cache_version(db, CONFIG_CACHE_NAME)
+        if cache is not None and cache["version"] == version:
+            _config_cache = dict(cache, checked_at=time.monotonic())
+            return _config_cache
+
+        db_config = get_config(db)
+        if db_config is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chưa có cấu hình trong hệ thống"
+            )
+        _config_cache = _build_config_cache(db_config, version)
+        return _config_cache
 
 # Service lấy cấu hình
 def get_config_service(db: Session) -> Config:
@@ -11,12 +127,18 @@ def get_config_service(db: Session) -> Config:
     if db_config is None:
         # Nếu chưa có cấu hình, trả về lỗi hoặc tạo một cấu hình rỗng
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
+            status_code=status.HTTP_404_NOT_FOUND,
             detail="Chưa có cấu hình trong hệ thống"
         )
     return db_config
 
 # Service cập nhật cấu hình
-def update_config_service(config_update: ConfigUpdate, db: Session) -> Config:
+def update_config_service(config_update: ConfigUpdate, db: Session) -> Dict[str, Any]:
+    global _config_cache
     # Sử dụng hàm upsert để tạo mới hoặc cập nhật
-    return upsert_config(db, config_update) 
\ No newline at end of file
+    db_config = upsert_config(db, config_update)
+    # Tăng phiên bản để các worker khác nạp lại cấu hình
+    version = bump_cache_version(db, CONFIG_CACHE_NAME)
+    with _config_cache_lock:
+        _config_cache = _build_config_cache(db_config, version)
+    return _config_cache["data"]
@@ -1,12 +1,23 @@
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-# Thông tin kết nối MySQL
-SQLALCHEMY_DATABASE_URL = "mysql+pymysql://root:@127.0.0.1/db_tts"
+# Thông tin kết nối MySQL (DATABASE_URL để dùng database khác, vd "sqlite://" khi chạy benchmark)
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "mysql+pymysql://root:@127.0.0.1/db_tts")
 
 # Tạo engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # SQLite trong bộ nhớ chỉ tồn tại trên một kết nối, dùng chung kết nối đó cho mọi thread
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool if SQLALCHEMY_DATABASE_URL in ("sqlite://", "sqlite:///:memory:") else None,
+    )
+else:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 # Tạo session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -20,4 +31,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close() 
@@ -0,0 +1,185 @@
+import math
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import anyio
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.connection import SessionLocal
+from app.database.user_crud import add_credits_atomic, deduct_credits_atomic
+from app.models.credit_ledger import CreditLedger
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bộ đệm các bản ghi sổ cái chưa ghi xuống database
+_pending_entries: List[Dict] = []
+_pending_lock = threading.Lock()
+# Giới hạn bộ đệm khi database lỗi kéo dài để tránh tràn bộ nhớ
+_MAX_PENDING_ENTRIES = 100000
+
+_flush_event = threading.Event()
+_stop_event = threading.Event()
+_flusher_thread: Optional[threading.Thread] = None
+
+# Ghi nhận một biến động credits vào bộ đệm (không truy vấn database)
+def record_usage(
+    user_id: int,
+    amount: int,
+    reason: str,
+    route: Optional[str] = None,
+    units: Optional[float] = None
+) -> None:
+    entry = {
+        "user_id": user_id,
+        "amount": amount,
+        "reason": reason,
+        "route": route,
+        "units": units,
+        "created_at": datetime.now(timezone.utc),
+    }
+    with _pending_lock:
+        _pending_entries.append(entry)
+        pending_count = len(_pending_entries)
+    if pending_count >= settings.LEDGER_BATCH_SIZE:
+        _flush_event.set()
+
+# Số bản ghi đang chờ ghi xuống database
+def pending_ledger_entries() -> int:
+    return len(_pending_entries)
+
+# Ghi toàn bộ bộ đệm xuống database bằng một câu INSERT nhiều dòng
+def flush_ledger() -> int:
+    global _pending_entries
+    with _pending_lock:
+        if not _pending_entries:
+            return 0
+        entries = _pending_entries
+        _pending_entries = []
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(CreditLedger), entries)
+        db.commit()
+        return len(entries)
+    except Exception as e:
+        db.rollback()
+        logger.error("Lỗi khi ghi sổ cái credits: %s", e)
+        # Trả lại bộ đệm để ghi ở lần sau
+        with _pending_lock:
+            _pending_entries = (entries + _pending_entries)[-_MAX_PENDING_ENTRIES:]
+        return 0
+    finally:
+        db.close()
+
+def _flusher_loop() -> None:
+    while not _stop_event.is_set():
+        _flush_event.wait(settings.LEDGER_FLUSH_INTERVAL_SECONDS)
+        _flush_event.clear()
+        flush_ledger()
+    # Ghi nốt phần còn lại khi dừng
+    flush_ledger()
+
+# Khởi động thread nền ghi sổ cái theo lô
+def start_ledger_flusher() -> None:
+    global _flusher_thread
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    _stop_event.clear()
+    _flusher_thread = threading.Thread(target=_flusher_loop, name="credit-ledger-flusher", daemon=True)
+    _flusher_thread.start()
+
+# Dừng thread nền và ghi nốt các bản ghi còn lại
+def stop_ledger_flusher(timeout: float = 5.0) -> None:
+    global _flusher_thread
+    _stop_event.set()
+    _flush_event.set()
+    if _flusher_thread is not None:
+        _flusher_thread.join(timeout)
+        _flusher_thread = None
+
+# Trừ credits nguyên tử và ghi sổ cái, trả về False nếu không đủ số dư
+def charge_credits(
+    db: Session,
+    user_id: int,
+    amount: int,
+    reason: str,
+    route: Optional[str] = None,
+    units: Optional[float] = None
+) -> bool:
+    if amount <= 0:
+        return True
+    if not deduct_credits_atomic(db, user_id, amount):
+        return False
+    record_usage(user_id, -amount, reason, route=route, units=units)
+    return True
+
+# Hoàn lại credits đã trừ (ghi một dòng sổ cái bù trừ với lý do refund)
+def refund_credits(
+    db: Session,
+    user_id: int,
+    amount: int,
+    route: Optional[str] = None,
+    units: Optional[float] = None
+) -> None:
+    if amount <= 0:
+        return
+    if not add_credits_atomic(db, user_id, amount):
+        logger.error("Không hoàn lại được %s credits cho user %s (route %s)", amount, user_id, route)
+        return
+    record_usage(user_id, amount, "refund", route=route, units=units)
+
+# Tính phí theo số ký tự của văn bản, raise 402 nếu không đủ credits
+def meter_characters(db: Session, user_id: int, text: str, route: str) -> int:
+    if settings.CREDITS_PER_CHARACTER <= 0:
+        return 0
+    characters = len(text)
+    cost = math.ceil(characters * settings.CREDITS_PER_CHARACTER)
+    if not charge_credits(db, user_id, cost, "tts_characters", route=route, units=characters):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Không đủ credits: cần {cost} credits cho {characters} ký tự"
+        )
+    return cost
+
+# Tính phí theo số giây âm thanh đã tạo, raise 402 nếu không đủ credits
+def meter_audio_seconds(db: Session, user_id: int, seconds: float, route: str) -> int:
+    if settings.CREDITS_PER_AUDIO_SECOND <= 0:
+        return 0
+    cost = math.ceil(seconds * settings.CREDITS_PER_AUDIO_SECOND)
+    if not charge_credits(db, user_id, cost, "tts_audio_seconds", route=route, units=round(seconds, 3)):
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=f"Không đủ credits: cần {cost} credits cho {seconds:.1f} giây âm thanh"
+        )
+    return cost
+
+def _refund_after_error(db: Session, user_id: int, amount: int, route: str) -> None:
+    # Session có thể đang ở trạng thái lỗi nếu lỗi đến từ database
+    db.rollback()
+    refund_credits(db, user_id, amount, route=route)
+
+# Giữ trước phí theo số ký tự cho một lần tổng hợp, trả về coroutine tính phí theo số giây âm thanh khi tổng hợp xong.
+# Nếu khối async with raise (lỗi tổng hợp, 402 khi tính phí theo giây, client ngắt kết nối...) thì hoàn lại toàn bộ đã trừ.
+# Các câu lệnh database chạy trong threadpool để không chặn event loop.
+@asynccontextmanager
+async def metered_synthesis(db: Session, user_id: int, text: str, route: str):
+    charged = [await anyio.to_thread.run_sync(meter_characters, db, user_id, text, route)]
+
+    async def settle(seconds: float) -> int:
+        cost = await anyio.to_thread.run_sync(meter_audio_seconds, db, user_id, seconds, route)
+        charged.append(cost)
+        return cost
+
+    try:
+        yield settle
+    except BaseException:
+        # Vẫn hoàn lại khi request bị hủy (client ngắt kết nối)
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(_refund_after_error, db, user_id, sum(charged), route)
+        raise
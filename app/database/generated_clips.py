@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from app.database.audio_decoder import decode_audio
+from app.database.audio_format import CANONICAL_DTYPE, CANONICAL_SUBTYPE, get_profile_sample_rate, to_canonical
+from app.database.mms_model import MMS_MODEL_NAME, synthesize_mms
+from app.utils.metrics import inc
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Clip do model tạo cho từ chưa ghi âm nằm riêng trong thư mục con của profile,
+# không có record trong bảng vocabularies để không lẫn với clip người dùng ghi âm
+GENERATED_DIR_NAME = "generated"
+# Độ lớn tham chiếu của giọng đã ghi âm (RMS phần có tiếng)
+REFERENCE_FILENAME = ".reference.json"
+# Số clip ghi âm dùng để ước lượng độ lớn tham chiếu
+REFERENCE_SAMPLE_CLIPS = 20
+# Ngưỡng cắt khoảng lặng (dB dưới đỉnh)
+TRIM_TOP_DB = 40
+# Biên độ đỉnh tối đa sau khi khuếch đại
+MAX_PEAK = 0.95
+
+# Khóa theo (profile, từ) để hai request cùng thiếu một từ chỉ chạy model một lần
+_generation_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_generation_locks_guard = threading.Lock()
+
+
+def generated_dir(profile_dir) -> Path:
+    return Path(profile_dir) / GENERATED_DIR_NAME
+
+
+def generated_clip_path(profile_dir, word: str) -> Path:
+    return generated_dir(profile_dir) / f"{word}.wav"
+
+
+def _active_rms(audio: np.ndarray) -> float:
+    # RMS phần có tiếng, bỏ khoảng lặng hai đầu
+    if len(audio) == 0:
+        return 0.0
+    trimmed, _ = librosa.effects.trim(audio, top_db=TRIM_TOP_DB)
+    if len(trimmed) == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(np.square(trimmed, dtype=np.float64))))
+
+
+def get_reference_rms(profile_dir, audio_paths: Iterable[str]) -> float:
+    """
+    Độ lớn tham chiếu của giọng đã ghi âm trong profile, tính một lần từ một mẫu clip
+    và lưu vào generated/.reference.json (xóa file này để tính lại)
+    """
+    reference_path = generated_dir(profile_dir) / REFERENCE_FILENAME
+    try:
+        with open(reference_path, "r", encoding="utf-8") as f:
+            return float(json.load(f)["rms"])
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    paths = sorted(set(audio_paths))
+    step = max(1, len(paths) // REFERENCE_SAMPLE_CLIPS)
+    levels = []
+    for path in paths[::step][:REFERENCE_SAMPLE_CLIPS]:
+        try:
+            audio, _ = decode_audio(path)
+        except Exception as e:
+            logger.warning("Bỏ qua %s khi tính độ lớn tham chiếu: %s", path, e)
+            continue
+        level = _active_rms(audio)
+        if level > 0:
+            levels.append(level)
+    if not levels:
+        return 0.0
+
+    rms = float(np.median(levels))
+    os.makedirs(reference_path.parent, exist_ok=True)
+    with open(reference_path, "w", encoding="utf-8") as f:
+        json.dump({"rms": rms, "clips": len(levels)}, f)
+    return rms
+
+
+def _generation_lock(profile_dir, word: str) -> threading.Lock:
+    key = (str(profile_dir), word)
+    with _generation_locks_guard:
+        lock = _generation_locks.get(key)
+        if lock is None:
+            lock = _generation_locks[key] = threading.Lock()
+        return lock
+
+
+def _read_clip(path: Path, sampling_rate: int) -> np.ndarray:
+    data, rate = sf.read(str(path), dtype=CANONICAL_DTYPE)
+    return to_canonical(data, rate, sampling_rate)
+
+
+def get_generated_clip(profile_dir, word: str, audio_paths: Iterable[str]) -> np.ndarray:
+    """
+    Lấy clip cho từ chưa có trong vocabulary: đọc từ cache nếu đã tạo,
+    nếu chưa thì tổng hợp bằng MMS-TTS, khớp sample rate và độ lớn với giọng đã ghi âm rồi lưu lại.
+    Trả về audio float32 mono theo sample rate chuẩn của profile.
+    Raise RuntimeError nếu model không khả dụng.
+    """
+    sampling_rate = get_profile_sample_rate(profile_dir)
+    path = generated_clip_path(profile_dir, word)
+    if path.exists():
+        inc("tts_cache_requests_total", cache="generated_clip", result="hit")
+        return _read_clip(path, sampling_rate)
+    inc("tts_cache_requests_total", cache="generated_clip", result="miss")
+
+    with _generation_lock(profile_dir, word):
+        # Request khác có thể đã tạo xong trong lúc chờ khóa
+        if path.exists():
+            return _read_clip(path, sampling_rate)
+
+        logger.info("Tạo clip cho từ '%s' bằng %s", word, MMS_MODEL_NAME)
+        audio, rate = synthesize_mms(word)
+        audio, _ = librosa.effects.trim(audio, top_db=TRIM_TOP_DB)
+        audio = to_canonical(audio, rate, sampling_rate)
+
+        reference = get_reference_rms(profile_dir, audio_paths)
+        level = _active_rms(audio)
+        if reference > 0 and level > 0:
+            audio = audio * (reference / level)
+        peak = float(np.max(np.abs(audio))) if len(audio) else 0.0
+        if peak > MAX_PEAK:
+            audio = audio * (MAX_PEAK / peak)
+        audio = audio.astype(CANONICAL_DTYPE)
+
+        os.makedirs(path.parent, exist_ok=True)
+        temp_path = path.with_suffix(".part")
+        sf.write(str(temp_path), audio, sampling_rate, subtype=CANONICAL_SUBTYPE, format="WAV")
+        os.replace(temp_path, path)
+        return audio
+
+
+def discard_generated_clip(profile_dir, word: str) -> None:
+    """Xóa clip tạo tự động của từ (gọi khi người dùng ghi âm từ đó)"""
+    try:
+        os.remove(generated_clip_path(profile_dir, word))
+    except FileNotFoundError:
+        pass
@@ -1,6 +1,54 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.database.connection import Base, engine
+from app.config import settings
+# Import mọi model để Base.metadata biết đến các bảng (init_db có thể chạy trước khi import app.main)
+import app.models.user  # noqa: F401
+import app.models.config  # noqa: F401
+import app.models.voice_library.vocabulary  # noqa: F401
+import app.models.credit_ledger  # noqa: F401
+import app.models.cache_version  # noqa: F401
+import app.models.usage_stat  # noqa: F401
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tên chỉ mục FULLTEXT dùng cho tìm kiếm user
+USER_FULLTEXT_INDEX = "ft_users_username_email"
 
 def init_db():
     # Tạo các bảng trong database
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # create_all không thêm chỉ mục mới vào bảng đã tồn tại, tạo bổ sung nếu thiếu
+    ensure_indexes()
+
+# Tạo các chỉ mục đã khai báo trong model nhưng chưa có trong database
+def ensure_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                logger.error("Không thể tạo chỉ mục %s: %s", index.name, e)
+
+    if settings.USER_SEARCH_FULLTEXT and engine.dialect.name == "mysql":
+        ensure_user_fulltext_index()
+
+# Tạo chỉ mục FULLTEXT với parser ngram cho username/email (MySQL >= 5.7.6)
+def ensure_user_fulltext_index():
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'users' AND index_name = :name"
+            ),
+            {"name": USER_FULLTEXT_INDEX},
+        ).scalar()
+        if exists:
+            return
+        try:
+            conn.execute(text(
+                f"CREATE FULLTEXT INDEX {USER_FULLTEXT_INDEX} ON users (username, email) WITH PARSER ngram"
+            ))
+        except Exception as e:
+            logger.error("Không thể tạo chỉ mục FULLTEXT cho users: %s", e)
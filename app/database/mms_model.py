@@ -0,0 +1,50 @@
+import os
+from typing import Tuple
+
+import numpy as np
+
+from app.database.model_registry import get_model, use_model
+from app.utils.metrics import stage
+from app.utils.tracing import traced
+
+# Model Facebook MMS-TTS dùng chung cho router /tts-facebook, /tts và chế độ hybrid của voice library
+MMS_MODEL_NAME = os.environ.get("MMS_MODEL_NAME", "facebook/mms-tts-vie")
+
+
+def _load_mms():
+    from transformers import AutoTokenizer, AutoModelForTextToWaveform
+    tokenizer = AutoTokenizer.from_pretrained(MMS_MODEL_NAME)
+    model = AutoModelForTextToWaveform.from_pretrained(MMS_MODEL_NAME)
+    model.eval()
+    return tokenizer, model
+
+
+def load_mms_model():
+    """
+    Tải model MMS-TTS qua model registry (một bản cho cả process, lần gọi sau dùng lại bản đã tải)
+    Raise RuntimeError nếu không tải được (thiếu torch/transformers hoặc không tải được weights)
+    """
+    return get_model(MMS_MODEL_NAME, _load_mms)
+
+
+def mms_available() -> bool:
+    try:
+        load_mms_model()
+        return True
+    except RuntimeError:
+        return False
+
+
+@traced("mms_synthesize")
+def synthesize_mms(text: str) -> Tuple[np.ndarray, int]:
+    """Tổng hợp văn bản (đã chuẩn hóa) bằng MMS-TTS, trả về (audio float32 mono, sample rate)"""
+    import torch
+
+    # Giữ model trong suốt lần tổng hợp để registry không giải phóng model đang dùng
+    with use_model(MMS_MODEL_NAME, _load_mms) as (tokenizer, model):
+        with stage("tokenize", pipeline="mms"):
+            inputs = tokenizer(text, return_tensors="pt")
+        with stage("forward", pipeline="mms"), torch.no_grad():
+            output = model(**inputs).waveform
+    audio = output.squeeze().cpu().numpy().astype(np.float32)
+    return audio, model.config.sampling_rate
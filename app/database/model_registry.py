@@ -0,0 +1,190 @@
+# Registry dùng chung cho các model nặng (MMS-TTS...): mỗi model id chỉ được tải một lần cho cả process,
+# đếm số nơi đang dùng để có thể giải phóng model không dùng sau một khoảng thời gian (MODEL_IDLE_UNLOAD_SECONDS)
+
+import gc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Giải phóng model không có request nào dùng sau số giây này (0 = giữ model đến khi tắt)
+# Khi chạy run_production.py (preload trước khi fork), giải phóng trong worker không trả lại bộ nhớ dùng chung
+MODEL_IDLE_UNLOAD_SECONDS = float(os.environ.get("MODEL_IDLE_UNLOAD_SECONDS", "0"))
+
+_registry_lock = threading.Lock()
+# model id -> trạng thái: value, loader, refs, last_used, loaded_at, load_seconds, parameter_bytes, rss_delta_bytes, error
+_models: Dict[str, dict] = {}
+
+_reaper_thread: Optional[threading.Thread] = None
+_reaper_stop = threading.Event()
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _parameter_bytes(value) -> Optional[int]:
+    # Tổng kích thước tham số và buffer của các module torch trong giá trị model (tuple tokenizer, model...)
+    items = value if isinstance(value, (tuple, list)) else (value,)
+    total = None
+    for item in items:
+        if hasattr(item, "parameters") and hasattr(item, "buffers"):
+            tensors = list(item.parameters()) + list(item.buffers())
+            total = (total or 0) + sum(t.numel() * t.element_size() for t in tensors)
+    return total
+
+
+def _entry(model_id: str, loader: Callable[[], Any]) -> dict:
+    with _registry_lock:
+        entry = _models.get(model_id)
+        if entry is None:
+            entry = _models[model_id] = {
+                "lock": threading.Lock(),
+                "loader": loader,
+                "value": None,
+                "refs": 0,
+                "last_used": None,
+                "loaded_at": None,
+                "load_seconds": None,
+                "parameter_bytes": None,
+                "rss_delta_bytes": None,
+                "error": None,
+            }
+        return entry
+
+
+def get_model(model_id: str, loader: Callable[[], Any]):
+    """
+    Trả về model đã tải (gọi loader() để tải nếu chưa có)
+    Lỗi khi tải được ghi nhớ để không thử lại ở mỗi request (unload_model để thử lại), raise RuntimeError
+    """
+    entry = _entry(model_id, loader)
+    value = entry["value"]
+    if value is not None:
+        return value
+    with entry["lock"]:
+        if entry["value"] is not None:
+            return entry["value"]
+        if entry["error"] is not None:
+            raise RuntimeError(entry["error"])
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        try:
+            value = loader()
+        except Exception as e:
+            entry["error"] = f"Lỗi khi tải model {model_id}: {str(e)}"
+            logger.error("%s", entry["error"])
+            raise RuntimeError(entry["error"])
+        rss_after = _rss_bytes()
+        entry.update(
+            value=value,
+            loaded_at=time.time(),
+            last_used=time.monotonic(),
+            load_seconds=time.perf_counter() - started,
+            parameter_bytes=_parameter_bytes(value),
+            rss_delta_bytes=rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        )
+        logger.info("Đã tải model %s trong %.1fs", model_id, entry["load_seconds"])
+        return value
+
+
+@contextmanager
+def use_model(model_id: str, loader: Callable[[], Any]):
+    """Dùng model trong khối with; model không bị giải phóng khi còn nơi đang dùng"""
+    entry = _entry(model_id, loader)
+    with _registry_lock:
+        entry["refs"] += 1
+    try:
+        yield get_model(model_id, loader)
+    finally:
+        with _registry_lock:
+            entry["refs"] -= 1
+            entry["last_used"] = time.monotonic()
+
+
+def unload_model(model_id: str) -> bool:
+    """
+    Giải phóng model (và xóa lỗi đã ghi nhớ để lần dùng sau tải lại)
+    Trả về False nếu model đang được dùng; raise KeyError nếu model id chưa từng được đăng ký
+    """
+    with _registry_lock:
+        entry = _models[model_id]
+        if entry["refs"] > 0:
+            return False
+        was_loaded = entry["value"] is not None
+        entry.update(value=None, error=None, loaded_at=None, parameter_bytes=None, rss_delta_bytes=None)
+    if was_loaded:
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info("Đã giải phóng model %s", model_id)
+    return True
+
+
+def unload_idle_models(idle_seconds: float) -> List[str]:
+    """Giải phóng các model đã tải, không có nơi nào dùng trong idle_seconds giây"""
+    now = time.monotonic()
+    with _registry_lock:
+        idle = [
+            model_id for model_id, entry in _models.items()
+            if entry["value"] is not None and entry["refs"] == 0 and now - entry["last_used"] >= idle_seconds
+        ]
+    return [model_id for model_id in idle if unload_model(model_id)]
+
+
+def model_registry_stats() -> List[dict]:
+    """Các model đã đăng ký: trạng thái, số nơi đang dùng, thời gian rảnh và dung lượng bộ nhớ"""
+    now = time.monotonic()
+    with _registry_lock:
+        return [
+            {
+                "model_id": model_id,
+                "loaded": entry["value"] is not None,
+                "refs": entry["refs"],
+                "idle_seconds": now - entry["last_used"] if entry["last_used"] is not None else None,
+                "loaded_at": entry["loaded_at"],
+                "load_seconds": entry["load_seconds"],
+                "parameter_bytes": entry["parameter_bytes"],
+                "rss_delta_bytes": entry["rss_delta_bytes"],
+                "error": entry["error"],
+            }
+            for model_id, entry in sorted(_models.items())
+        ]
+
+
+def _reaper_loop():
+    interval = min(60.0, max(1.0, MODEL_IDLE_UNLOAD_SECONDS / 2))
+    while not _reaper_stop.wait(interval):
+        try:
+            unload_idle_models(MODEL_IDLE_UNLOAD_SECONDS)
+        except Exception as e:
+            logger.error("Lỗi khi giải phóng model không dùng: %s", e)
+
+
+def start_model_reaper() -> None:
+    """Khởi động thread nền giải phóng model không dùng (chỉ khi MODEL_IDLE_UNLOAD_SECONDS > 0)"""
+    global _reaper_thread
+    if MODEL_IDLE_UNLOAD_SECONDS <= 0 or (_reaper_thread is not None and _reaper_thread.is_alive()):
+        return
+    _reaper_stop.clear()
+    _reaper_thread = threading.Thread(target=_reaper_loop, name="model-reaper", daemon=True)
+    _reaper_thread.start()
+
+
+def stop_model_reaper(timeout: float = 5.0) -> None:
+    global _reaper_thread
+    _reaper_stop.set()
+    if _reaper_thread is not None:
+        _reaper_thread.join(timeout)
+        _reaper_thread = None
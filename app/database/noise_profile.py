@@ -0,0 +1,184 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import librosa
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Tham số STFT cố định để mô hình nhiễu dùng chung cho mọi clip của profile
+NOISE_N_FFT = 2048
+NOISE_HOP_LENGTH = NOISE_N_FFT // 4
+# Phân vị dùng để ước tính mức nhiễu nền của từng dải tần
+NOISE_PERCENTILE = 10
+# Chỉ giảm nhiễu ở các bin thấp hơn mức nhiễu nền + 3dB (giống denoise_audio)
+NOISE_MARGIN_DB = 3.0
+# Giới hạn trọng số tích lũy để các bản ghi âm mới vẫn ảnh hưởng đến mô hình
+MAX_NOISE_PROFILE_WEIGHT = 200
+# Số clip tối đa xử lý trong một lần STFT theo lô
+DENOISE_BATCH_SIZE = 32
+# Tên file lưu mô hình nhiễu trong thư mục profile
+NOISE_PROFILE_FILENAME = ".noise_profile.npz"
+
+# Cache mô hình nhiễu đã đọc: path -> (mtime_ns, profile)
+_noise_profile_cache: Dict[str, tuple] = {}
+_noise_profile_lock = threading.RLock()
+
+
+def noise_profile_path(profile_dir) -> Path:
+    return Path(profile_dir) / NOISE_PROFILE_FILENAME
+
+
+def noise_profile_signature(profile_dir) -> Optional[tuple]:
+    """Dấu vết file mô hình nhiễu (inode, mtime, kích thước), đổi mỗi lần mô hình được lưu lại; None nếu chưa có"""
+    try:
+        stat_result = os.stat(noise_profile_path(profile_dir))
+    except OSError:
+        return None
+    return stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
+
+
+def estimate_clip_noise(audio_data: np.ndarray, sr: int) -> Optional[np.ndarray]:
+    """
+    Ước tính mức nhiễu nền (dB) cho từng dải tần của một clip
+    Trả về None nếu clip quá ngắn để phân tích
+    """
+    if len(audio_data) < NOISE_N_FFT:
+        return None
+    mag = np.abs(librosa.stft(
+        np.asarray(audio_data, dtype=np.float32),
+        n_fft=NOISE_N_FFT, hop_length=NOISE_HOP_LENGTH, window='hann'
+    ))
+    noise_mag = np.percentile(mag, NOISE_PERCENTILE, axis=1)
+    return 20 * np.log10(np.maximum(noise_mag, 1e-5))
+
+
+def load_noise_profile(profile_dir) -> Optional[dict]:
+    """Đọc mô hình nhiễu của profile (có cache theo mtime của file)"""
+    path = noise_profile_path(profile_dir)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _noise_profile_cache.get(str(path))
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    try:
+        with np.load(path) as data:
+            profile = {
+                "noise_db": data["noise_db"].astype(np.float32),
+                "weight": int(data["weight"]),
+                "sr": int(data["sr"]),
+            }
+    except Exception as e:
+        logger.error("Lỗi khi đọc mô hình nhiễu %s: %s", path, e)
+        return None
+
+    with _noise_profile_lock:
+        _noise_profile_cache[str(path)] = (mtime_ns, profile)
+    return profile
+
+
+def save_noise_profile(profile_dir, profile: dict) -> None:
+    path = noise_profile_path(profile_dir)
+    temp_path = path.with_name(path.name + ".tmp.npz")
+    np.savez(temp_path, noise_db=profile["noise_db"], weight=profile["weight"], sr=profile["sr"])
+    os.replace(temp_path, path)
+    with _noise_profile_lock:
+        _noise_profile_cache.pop(str(path), None)
+
+
+def update_noise_profile(profile_dir, audio_data: np.ndarray, sr: int) -> Optional[dict]:
+    """Cập nhật dần mô hình nhiễu của profile khi có bản ghi âm mới"""
+    clip_noise = estimate_clip_noise(audio_data, sr)
+    if clip_noise is None:
+        return load_noise_profile(profile_dir)
+
+    with _noise_profile_lock:
+        profile = load_noise_profile(profile_dir)
+        if profile is None or profile["sr"] != sr:
+            profile = {"noise_db": clip_noise.astype(np.float32), "weight": 1, "sr": sr}
+        else:
+            weight = min(profile["weight"], MAX_NOISE_PROFILE_WEIGHT)
+            noise_db = (profile["noise_db"] * weight + clip_noise) / (weight + 1)
+            profile = {"noise_db": noise_db.astype(np.float32), "weight": weight + 1, "sr": sr}
+        save_noise_profile(profile_dir, profile)
+    return profile
+
+
+def build_noise_profile(profile_dir, clips: Sequence[np.ndarray], sr: int) -> Optional[dict]:
+    """Tính lại mô hình nhiễu từ toàn bộ bản ghi âm của profile"""
+    estimates = [n for n in (estimate_clip_noise(clip, sr) for clip in clips) if n is not None]
+    if not estimates:
+        return None
+    profile = {
+        "noise_db": np.mean(estimates, axis=0).astype(np.float32),
+        "weight": len(estimates),
+        "sr": sr,
+    }
+    save_noise_profile(profile_dir, profile)
+    return profile
+
+
+def _noise_threshold(noise_profile: dict, sr: int) -> np.ndarray:
+    """Ngưỡng biên độ tuyến tính cho từng bin, nội suy nếu sample rate khác"""
+    noise_db = noise_profile["noise_db"]
+    if noise_profile["sr"] != sr:
+        target_freqs = librosa.fft_frequencies(sr=sr, n_fft=NOISE_N_FFT)
+        source_freqs = librosa.fft_frequencies(sr=noise_profile["sr"], n_fft=NOISE_N_FFT)
+        noise_db = np.interp(target_freqs, source_freqs, noise_db)
+    return (10 ** ((noise_db + NOISE_MARGIN_DB) / 20)).astype(np.float32)
+
+
+def denoise_audio_batch(
+    clips: Sequence[np.ndarray],
+    sr: int,
+    noise_profile: dict,
+    reduction_factor: float = 0.15,
+    alpha: float = 0.3
+) -> List[np.ndarray]:
+    """
+    Giảm nhiễu nhiều clip trong một lần STFT/ISTFT theo lô, dùng chung mô hình nhiễu của profile.
+
+    Kết quả tương đương denoise_audio: trộn 70% tín hiệu gốc với 30% tín hiệu đã giảm
+    các bin nhiễu. Vì STFT tuyến tính nên phép trộn được viết lại thành
+        x - alpha * k * ISTFT(D * mask)
+    tức là chỉ cần dựng lại phần bin bị giảm, không cần magphase hay đổi sang dB.
+    """
+    if reduction_factor < 0.05 or not clips:
+        return list(clips)
+    reduction_factor = min(reduction_factor, 0.2)
+    attenuation = alpha * reduction_factor * 0.8
+    threshold = _noise_threshold(noise_profile, sr)[:, np.newaxis]
+
+    results: List[Optional[np.ndarray]] = [None] * len(clips)
+    # Sắp xếp theo độ dài để giảm phần padding trong mỗi lô
+    order = sorted(range(len(clips)), key=lambda i: len(clips[i]))
+    for start in range(0, len(order), DENOISE_BATCH_SIZE):
+        indices = order[start:start + DENOISE_BATCH_SIZE]
+        short = [i for i in indices if len(clips[i]) < NOISE_N_FFT]
+        for i in short:
+            results[i] = clips[i]
+        indices = [i for i in indices if len(clips[i]) >= NOISE_N_FFT]
+        if not indices:
+            continue
+
+        max_len = max(len(clips[i]) for i in indices)
+        batch = np.zeros((len(indices), max_len), dtype=np.float32)
+        for row, i in enumerate(indices):
+            batch[row, :len(clips[i])] = clips[i]
+
+        D = librosa.stft(batch, n_fft=NOISE_N_FFT, hop_length=NOISE_HOP_LENGTH, window='hann')
+        noise_part = np.where(np.abs(D) < threshold, D, 0)
+        residual = librosa.istft(noise_part, hop_length=NOISE_HOP_LENGTH, window='hann', length=max_len)
+        denoised = batch - attenuation * residual
+
+        for row, i in enumerate(indices):
+            results[i] = denoised[row, :len(clips[i])].astype(np.asarray(clips[i]).dtype, copy=False)
+    return results
@@ -0,0 +1,159 @@
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Thư mục chứa file âm thanh tạo ra (dùng chung với voice_service.TEMP_DIR)
+OUTPUT_DIR = os.environ.get('AUDIO_TEMP_DIR', 'app/temp/audio')
+
+# Tên file do store quản lý: tts_{user_id}_{uuid}_{hạn dùng epoch}.{ext}
+ARTIFACT_NAME = re.compile(r"^tts_(\d+)_([0-9a-f]{32})_(\d+)\.([a-z0-9]{1,5})$")
+
+_stop_event = threading.Event()
+_janitor_thread: Optional[threading.Thread] = None
+
+
+class OutputExpiredError(Exception):
+    """File kết quả đã hết hạn hoặc đã bị dọn"""
+
+
+def _artifact_name(user_id: int, extension: str, expires_at: int) -> str:
+    # uuid4 đảm bảo hai request cùng giây không ghi đè nhau
+    return f"tts_{user_id}_{uuid.uuid4().hex}_{expires_at}.{extension}"
+
+
+def new_output_path(user_id: int, extension: str, ttl_seconds: Optional[int] = None) -> str:
+    """Tạo đường dẫn file kết quả mới (chưa ghi), mặc định hết hạn sau OUTPUT_MAX_AGE_SECONDS"""
+    ttl = ttl_seconds if ttl_seconds is not None else settings.OUTPUT_MAX_AGE_SECONDS
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return os.path.join(OUTPUT_DIR, _artifact_name(user_id, extension, int(time.time() + ttl)))
+
+
+def retention_seconds(requested: Optional[int]) -> int:
+    """Giới hạn thời gian lưu giữ theo cấu hình"""
+    if requested is None or requested <= 0:
+        return settings.OUTPUT_RETAIN_DEFAULT_SECONDS
+    return min(requested, settings.OUTPUT_RETAIN_MAX_SECONDS)
+
+
+def save_output(data: bytes, user_id: int, extension: str, ttl_seconds: int) -> dict:
+    """Lưu file kết quả được giữ lại để tải về sau, trả về tên file và thời điểm hết hạn"""
+    path = new_output_path(user_id, extension, ttl_seconds)
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    name = os.path.basename(path)
+    return {"name": name, "path": path, "expires_at": int(ARTIFACT_NAME.match(name).group(3))}
+
+
+def resolve_output(name: str, user_id: int) -> str:
+    """
+    Tìm file kết quả theo tên, kiểm tra chủ sở hữu và hạn dùng
+    Raise FileNotFoundError nếu tên không hợp lệ/không thuộc user, OutputExpiredError nếu đã hết hạn
+    """
+    match = ARTIFACT_NAME.match(name)
+    if not match or int(match.group(1)) != user_id:
+        raise FileNotFoundError(name)
+    path = os.path.join(OUTPUT_DIR, name)
+    if int(match.group(3)) < time.time():
+        remove_output(path)
+        raise OutputExpiredError(name)
+    if not os.path.exists(path):
+        raise OutputExpiredError(name)
+    return path
+
+
+def remove_output(path: str) -> None:
+    """Xóa file kết quả (dùng làm background task sau khi đã gửi xong)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error("Lỗi khi xóa file kết quả %s: %s", path, e)
+
+
+def cleanup_outputs(now: Optional[float] = None) -> dict:
+    """
+    Dọn thư mục kết quả:
+    - Xóa file do store quản lý đã quá hạn dùng
+    - Xóa file khác (file cũ, file tạm) cũ hơn OUTPUT_MAX_AGE_SECONDS
+    - Nếu tổng dung lượng vượt OUTPUT_MAX_TOTAL_BYTES, xóa file sắp hết hạn nhất trước
+      (file được yêu cầu giữ lại có hạn dài hơn nên bị xóa sau cùng)
+    """
+    now = now or time.time()
+    removed = 0
+    freed = 0
+    remaining = []
+    try:
+        entries = list(os.scandir(OUTPUT_DIR))
+    except FileNotFoundError:
+        return {"removed": 0, "freed_bytes": 0, "total_bytes": 0}
+
+    for entry in entries:
+        try:
+            if not entry.is_file(follow_symlinks=False) or entry.name.startswith("."):
+                continue
+            stat_result = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        match = ARTIFACT_NAME.match(entry.name)
+        if match:
+            expires_at = int(match.group(3))
+        else:
+            expires_at = stat_result.st_mtime + settings.OUTPUT_MAX_AGE_SECONDS
+        if expires_at < now:
+            remove_output(entry.path)
+            removed += 1
+            freed += stat_result.st_size
+        else:
+            remaining.append((expires_at, stat_result.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in remaining)
+    if total_bytes > settings.OUTPUT_MAX_TOTAL_BYTES:
+        for _, size, path in sorted(remaining):
+            if total_bytes <= settings.OUTPUT_MAX_TOTAL_BYTES:
+                break
+            remove_output(path)
+            removed += 1
+            freed += size
+            total_bytes -= size
+
+    return {"removed": removed, "freed_bytes": freed, "total_bytes": total_bytes}
+
+
+def _janitor_loop() -> None:
+    while not _stop_event.is_set():
+        try:
+            result = cleanup_outputs()
+            if result["removed"]:
+                logger.info("Đã dọn %s file kết quả (%s bytes)", result['removed'], result['freed_bytes'])
+        except Exception as e:
+            logger.error("Lỗi khi dọn thư mục kết quả: %s", e)
+        _stop_event.wait(settings.OUTPUT_JANITOR_INTERVAL_SECONDS)
+
+
+# Khởi động thread nền dọn thư mục kết quả
+def start_output_janitor() -> None:
+    global _janitor_thread
+    if _janitor_thread is not None and _janitor_thread.is_alive():
+        return
+    _stop_event.clear()
+    _janitor_thread = threading.Thread(target=_janitor_loop, name="output-janitor", daemon=True)
+    _janitor_thread.start()
+
+
+def stop_output_janitor(timeout: float = 5.0) -> None:
+    global _janitor_thread
+    _stop_event.set()
+    if _janitor_thread is not None:
+        _janitor_thread.join(timeout)
+        _janitor_thread = None
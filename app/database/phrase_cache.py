@@ -0,0 +1,180 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.metrics import inc
+
+# Cache audio đã ghép sẵn của các cụm từ (n-gram) hay gặp, theo từng profile.
+# Cụm từ chỉ được ghép và lưu lại khi đã xuất hiện ít nhất PHRASE_MIN_COUNT lần.
+PHRASE_MAX_WORDS = int(os.environ.get("PHRASE_MAX_WORDS", "4"))
+PHRASE_MIN_COUNT = int(os.environ.get("PHRASE_MIN_COUNT", "3"))
+PHRASE_CACHE_MAX_BYTES = int(os.environ.get("PHRASE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Số cụm từ tối đa được đếm tần suất cho mỗi profile, vượt quá thì giảm nửa bộ đếm
+PHRASE_MAX_TRACKED = 5000
+
+# (profile_id, cụm từ) -> {"audio", "signature"}, sắp xếp theo lần dùng gần nhất
+_phrases: "OrderedDict[Tuple[int, Tuple[str, ...]], dict]" = OrderedDict()
+_counts: Dict[int, Counter] = {}
+_cache_lock = threading.Lock()
+_stats = {"bytes": 0, "hits": 0, "builds": 0, "stale": 0, "evictions": 0}
+
+
+def _signature(
+    words: Sequence[str], audio_paths: Mapping[str, str], noise_signature: Optional[tuple]
+) -> Optional[tuple]:
+    """
+    Dấu vết các file ghi âm tạo nên cụm từ (đường dẫn, mtime, kích thước) và mô hình nhiễu đã dùng để khử nhiễu.
+    Ghi âm lại một từ hoặc cập nhật mô hình nhiễu (khi thêm từ bất kỳ) thay đổi dấu vết, kể cả khi được ghi từ worker khác.
+    """
+    signature = [noise_signature]
+    for word in words:
+        path = audio_paths[word]
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        signature.append((path, stat_result.st_mtime_ns, stat_result.st_size))
+    return tuple(signature)
+
+
+def _drop(key) -> None:
+    entry = _phrases.pop(key, None)
+    if entry is not None:
+        _stats["bytes"] -= entry["audio"].nbytes
+
+
+def _runs(words: Sequence[str], recorded: Sequence[bool]) -> List[Tuple[int, int]]:
+    """Các đoạn liên tiếp gồm toàn từ đã ghi âm (không có dấu câu hay từ tạo tự động)"""
+    runs = []
+    start = None
+    for i, is_recorded in enumerate(list(recorded) + [False]):
+        if is_recorded and start is None:
+            start = i
+        elif not is_recorded and start is not None:
+            if i - start >= 2:
+                runs.append((start, i))
+            start = None
+    return runs
+
+
+def record_phrases(profile_id: int, words: Sequence[str], recorded: Sequence[bool]) -> None:
+    """Đếm tần suất các cụm 2..PHRASE_MAX_WORDS từ trong câu"""
+    with _cache_lock:
+        counts = _counts.setdefault(profile_id, Counter())
+        for start, end in _runs(words, recorded):
+            for i in range(start, end - 1):
+                for j in range(i + 2, min(end, i + PHRASE_MAX_WORDS) + 1):
+                    counts[tuple(words[i:j])] += 1
+        if len(counts) > PHRASE_MAX_TRACKED:
+            # Giảm nửa để cụm từ cũ không còn dùng dần bị loại khỏi bộ đếm
+            for phrase in list(counts):
+                counts[phrase] //= 2
+                if counts[phrase] == 0:
+                    del counts[phrase]
+
+
+def plan_phrases(
+    profile_id: int,
+    words: Sequence[str],
+    recorded: Sequence[bool],
+    audio_paths: Mapping[str, str],
+    noise_signature: Optional[tuple]
+) -> List[Tuple[int, int, Optional[np.ndarray]]]:
+    """
+    Chia câu thành các đơn vị ghép (start, end, audio đã ghép sẵn hoặc None):
+    tại mỗi vị trí ưu tiên cụm dài nhất đã có trong cache hoặc đủ tần suất để ghép và lưu lại.
+    Đơn vị nhiều từ với audio None cần được ghép rồi lưu bằng put_phrase.
+    noise_signature: noise_profile_signature() đọc trước mô hình nhiễu dùng cho câu này
+    """
+    plan = []
+    i = 0
+    n = len(words)
+    while i < n:
+        unit = (i, i + 1, None)
+        if recorded[i] and i + 1 < n and recorded[i + 1]:
+            for j in range(min(n, i + PHRASE_MAX_WORDS), i + 1, -1):
+                if not all(recorded[i:j]):
+                    continue
+                phrase = tuple(words[i:j])
+                audio = get_phrase(profile_id, phrase, audio_paths, noise_signature)
+                if audio is not None:
+                    unit = (i, j, audio)
+                    break
+                with _cache_lock:
+                    frequent = _counts.get(profile_id, {}).get(phrase, 0) >= PHRASE_MIN_COUNT
+                if frequent:
+                    unit = (i, j, None)
+                    break
+            inc("tts_cache_requests_total", cache="phrase", result="hit" if unit[2] is not None else "miss")
+        plan.append(unit)
+        i = unit[1]
+    return plan
+
+
+def get_phrase(
+    profile_id: int, phrase: Tuple[str, ...], audio_paths: Mapping[str, str], noise_signature: Optional[tuple]
+) -> Optional[np.ndarray]:
+    """Lấy bản sao audio đã ghép của cụm từ, None nếu chưa có, một từ trong cụm đã được ghi âm lại hoặc mô hình nhiễu đã đổi"""
+    key = (profile_id, phrase)
+    with _cache_lock:
+        entry = _phrases.get(key)
+    if entry is None:
+        return None
+    if _signature(phrase, audio_paths, noise_signature) != entry["signature"]:
+        with _cache_lock:
+            if _phrases.get(key) is entry:
+                _drop(key)
+                _stats["stale"] += 1
+        return None
+    with _cache_lock:
+        if key in _phrases:
+            _phrases.move_to_end(key)
+        _stats["hits"] += 1
+    # Bước ghép câu có thể sửa mảng tại chỗ nên luôn trả về bản sao
+    return entry["audio"].copy()
+
+
+def put_phrase(
+    profile_id: int,
+    phrase: Tuple[str, ...],
+    audio: np.ndarray,
+    audio_paths: Mapping[str, str],
+    noise_signature: Optional[tuple]
+) -> None:
+    signature = _signature(phrase, audio_paths, noise_signature)
+    if signature is None or audio.nbytes > PHRASE_CACHE_MAX_BYTES:
+        return
+    key = (profile_id, tuple(phrase))
+    with _cache_lock:
+        _drop(key)
+        _phrases[key] = {"audio": audio.copy(), "signature": signature}
+        _stats["bytes"] += audio.nbytes
+        _stats["builds"] += 1
+        while _stats["bytes"] > PHRASE_CACHE_MAX_BYTES and _phrases:
+            _drop(next(iter(_phrases)))
+            _stats["evictions"] += 1
+
+
+def seed_phrase_counts(profile_id: int, phrases: Sequence[Tuple[str, ...]]) -> None:
+    """Đánh dấu các cụm từ là đủ tần suất (vd: từ thống kê lưu trong database) để lần ghép sau được ghép và lưu lại ngay"""
+    with _cache_lock:
+        counts = _counts.setdefault(profile_id, Counter())
+        for phrase in phrases:
+            counts[tuple(phrase)] = max(counts[tuple(phrase)], PHRASE_MIN_COUNT)
+
+
+def discard_phrases(profile_id: int, word: Optional[str] = None) -> None:
+    """Xóa các cụm từ chứa `word` (hoặc toàn bộ cụm từ của profile nếu không truyền word)"""
+    with _cache_lock:
+        for key in [key for key in _phrases if key[0] == profile_id and (word is None or word in key[1])]:
+            _drop(key)
+        if word is None:
+            _counts.pop(profile_id, None)
+
+
+def phrase_cache_stats() -> dict:
+    with _cache_lock:
+        return dict(_stats, entries=len(_phrases), profiles_tracked=len(_counts))
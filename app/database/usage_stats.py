@@ -0,0 +1,164 @@
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.connection import SessionLocal
+from app.models.usage_stat import UsageStat
+from app.models.voice_library.vocabulary import VoiceProfile
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Độ dài tối đa của cột entry, mục dài hơn không được thống kê
+MAX_ENTRY_LENGTH = 191
+# Ngăn cách các mục từ vựng trong một cụm từ (mục từ vựng có thể chứa khoảng trắng)
+PHRASE_SEPARATOR = "|"
+
+# (voice_profile_id, kind, entry) -> số lần dùng chưa ghi xuống database
+_pending: Counter = Counter()
+_pending_lock = threading.Lock()
+# Giới hạn số khóa trong bộ đệm khi database lỗi kéo dài
+_MAX_PENDING_KEYS = 200000
+
+_flush_event = threading.Event()
+_stop_event = threading.Event()
+_flusher_thread: Optional[threading.Thread] = None
+
+
+def phrase_entry(phrase: Sequence[str]) -> str:
+    return PHRASE_SEPARATOR.join(phrase)
+
+
+def track_usage(profile_id: int, words: Sequence[str], phrases: Sequence[Tuple[str, ...]] = ()) -> None:
+    """Ghi nhận một câu đã ghép của profile: các mục từ vựng đã ghi âm và cụm từ ghép sẵn đã dùng (không truy vấn database)"""
+    with _pending_lock:
+        _pending[(profile_id, "profile", "")] += 1
+        for word in words:
+            if len(word) <= MAX_ENTRY_LENGTH:
+                _pending[(profile_id, "word", word)] += 1
+        for phrase in phrases:
+            entry = phrase_entry(phrase)
+            if len(entry) <= MAX_ENTRY_LENGTH:
+                _pending[(profile_id, "phrase", entry)] += 1
+
+
+def pending_usage_keys() -> int:
+    return len(_pending)
+
+
+def _write_counts(db: Session, counts: dict) -> None:
+    table = UsageStat.__table__
+    now = datetime.now(timezone.utc)
+    profile_ids = {key[0] for key in counts}
+    existing = set(
+        db.query(UsageStat.voice_profile_id, UsageStat.kind, UsageStat.entry)
+        .filter(UsageStat.voice_profile_id.in_(profile_ids))
+        .all()
+    )
+    missing = [key for key in counts if key not in existing]
+    if missing:
+        db.execute(insert(table), [
+            {"voice_profile_id": pid, "kind": kind, "entry": entry, "count": 0} for pid, kind, entry in missing
+        ])
+    # Cộng dồn bằng một câu UPDATE cho nhiều dòng để các worker cùng ghi không ghi đè nhau
+    db.execute(
+        update(table)
+        .where(and_(
+            table.c.voice_profile_id == bindparam("p_id"),
+            table.c.kind == bindparam("p_kind"),
+            table.c.entry == bindparam("p_entry"),
+        ))
+        .values(count=table.c.count + bindparam("p_count"), last_used=bindparam("p_now")),
+        [
+            {"p_id": pid, "p_kind": kind, "p_entry": entry, "p_count": count, "p_now": now}
+            for (pid, kind, entry), count in counts.items()
+        ],
+    )
+
+
+def flush_usage() -> int:
+    """Cộng dồn bộ đệm thống kê xuống bảng usage_stats, trả về số khóa đã ghi"""
+    global _pending
+    with _pending_lock:
+        if not _pending:
+            return 0
+        counts = _pending
+        _pending = Counter()
+
+    db = SessionLocal()
+    try:
+        for attempt in range(3):
+            try:
+                _write_counts(db, counts)
+                db.commit()
+                return len(counts)
+            except IntegrityError:
+                # Worker khác vừa thêm cùng dòng, thử lại (dòng đã có sẽ chỉ được cộng dồn)
+                db.rollback()
+        raise RuntimeError("Không ghi được thống kê sau 3 lần thử")
+    except Exception as e:
+        db.rollback()
+        logger.error("Lỗi khi ghi thống kê sử dụng: %s", e)
+        # Trả lại bộ đệm để ghi ở lần sau
+        with _pending_lock:
+            counts.update(_pending)
+            _pending = counts if len(counts) <= _MAX_PENDING_KEYS else Counter(dict(counts.most_common(_MAX_PENDING_KEYS)))
+        return 0
+    finally:
+        db.close()
+
+
+def _flusher_loop() -> None:
+    while not _stop_event.is_set():
+        _flush_event.wait(settings.USAGE_FLUSH_INTERVAL_SECONDS)
+        _flush_event.clear()
+        flush_usage()
+    # Ghi nốt phần còn lại khi dừng
+    flush_usage()
+
+
+def start_usage_flusher() -> None:
+    global _flusher_thread
+    if _flusher_thread is not None and _flusher_thread.is_alive():
+        return
+    _stop_event.clear()
+    _flusher_thread = threading.Thread(target=_flusher_loop, name="usage-stats-flusher", daemon=True)
+    _flusher_thread.start()
+
+
+def stop_usage_flusher(timeout: float = 5.0) -> None:
+    global _flusher_thread
+    _stop_event.set()
+    _flush_event.set()
+    if _flusher_thread is not None:
+        _flusher_thread.join(timeout)
+        _flusher_thread = None
+
+
+def top_profiles(db: Session, limit: int) -> List[Tuple[int, int, int]]:
+    """Các profile còn tồn tại được dùng nhiều nhất: (profile_id, user_id, số câu đã ghép)"""
+    return db.query(UsageStat.voice_profile_id, VoiceProfile.user_id, UsageStat.count).join(
+        VoiceProfile, VoiceProfile.id == UsageStat.voice_profile_id
+    ).filter(UsageStat.kind == "profile").order_by(UsageStat.count.desc()).limit(limit).all()
+
+
+def top_entries(db: Session, profile_id: int, kind: str, limit: int) -> List[Tuple[str, int]]:
+    """Các từ (kind="word") hoặc cụm từ (kind="phrase") của profile được dùng nhiều nhất: (entry, số lần)"""
+    return db.query(UsageStat.entry, UsageStat.count).filter(
+        UsageStat.voice_profile_id == profile_id, UsageStat.kind == kind
+    ).order_by(UsageStat.count.desc()).limit(limit).all()
+
+
+def discard_usage(db: Session, profile_id: int) -> None:
+    """Xóa thống kê của profile đã bị xóa"""
+    with _pending_lock:
+        for key in [key for key in _pending if key[0] == profile_id]:
+            del _pending[key]
+    db.query(UsageStat).filter(UsageStat.voice_profile_id == profile_id).delete(synchronize_session=False)
+    db.commit()
@@ -0,0 +1,49 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.models.user import CurrentUser, User
+
+# Cache thông tin user đã xác thực trong bộ nhớ của process
+# Key: user_id, Value: (thời điểm hết hạn, CurrentUser)
+_user_cache: Dict[int, Tuple[float, CurrentUser]] = {}
+_user_cache_lock = threading.Lock()
+
+# Lấy user từ cache, trả về None nếu không có hoặc đã hết hạn
+def get_cached_user(user_id: int) -> Optional[CurrentUser]:
+    entry = _user_cache.get(user_id)
+    if entry is None:
+        return None
+    expires_at, principal = entry
+    if expires_at < time.monotonic():
+        with _user_cache_lock:
+            # Chỉ xóa nếu entry chưa bị thay thế bởi thread khác
+            if _user_cache.get(user_id) is entry:
+                del _user_cache[user_id]
+        return None
+    return principal
+
+# Lưu thông tin user vào cache
+def cache_user(user: User) -> CurrentUser:
+    principal = CurrentUser(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        usertype=user.usertype or "user",
+        active=bool(user.active),
+    )
+    expires_at = time.monotonic() + settings.USER_CACHE_TTL_SECONDS
+    with _user_cache_lock:
+        _user_cache[user.id] = (expires_at, principal)
+    return principal
+
+# Xóa user khỏi cache (gọi khi trạng thái/loại tài khoản thay đổi)
+def invalidate_user_cache(user_id: int) -> None:
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+# Xóa toàn bộ cache
+def clear_user_cache() -> None:
+    with _user_cache_lock:
+        _user_cache.clear()
@@ -1,6 +1,9 @@
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from app.models.user import User, UserCreate, UserUpdate
+from app.database.user_cache import invalidate_user_cache
+from app.config import settings
 from typing import List, Optional
 import random
 import string
@@ -62,6 +65,7 @@ def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[
     
     db.commit()
     db.refresh(db_user)
+    invalidate_user_cache(user_id)
     return db_user
 
 # Thay đổi trạng thái user (active/inactive)
@@ -73,6 +77,7 @@ def change_user_status(db: Session, user_id: int, is_active: bool) -> Optional[U
     db_user.active = is_active
     db.commit()
     db.refresh(db_user)
+    invalidate_user_cache(user_id)
     return db_user
 
 # Xóa user
@@ -83,32 +88,38 @@ def delete_user(db: Session, user_id: int) -> bool:
     
     db.delete(db_user)
     db.commit()
+    invalidate_user_cache(user_id)
     return True
 
+# Cộng credits nguyên tử: UPDATE users SET credits = credits + :n WHERE id = :id
+def add_credits_atomic(db: Session, user_id: int, amount: int) -> bool:
+    updated = db.query(User).filter(User.id == user_id).update(
+        {User.credits: User.credits + amount}, synchronize_session=False
+    )
+    db.commit()
+    return updated == 1
+
+# Trừ credits nguyên tử: UPDATE users SET credits = credits - :n WHERE id = :id AND credits >= :n
+# Không cần khóa dòng, các request đồng thời không làm mất cập nhật của nhau
+def deduct_credits_atomic(db: Session, user_id: int, amount: int) -> bool:
+    updated = db.query(User).filter(
+        User.id == user_id,
+        User.credits >= amount
+    ).update({User.credits: User.credits - amount}, synchronize_session=False)
+    db.commit()
+    return updated == 1
+
 # Nạp tiền cho user
 def add_credits(db: Session, user_id: int, amount: int) -> Optional[User]:
-    db_user = get_user_by_id(db, user_id)
-    if not db_user:
+    if not add_credits_atomic(db, user_id, amount):
         return None
-    
-    db_user.credits += amount
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return get_user_by_id(db, user_id)
 
 # Trừ tiền của user
 def deduct_credits(db: Session, user_id: int, amount: int) -> Optional[User]:
-    db_user = get_user_by_id(db, user_id)
-    if not db_user:
-        return None
-    
-    if db_user.credits < amount:
-        return None  # Không đủ số dư
-    
-    db_user.credits -= amount
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    if not deduct_credits_atomic(db, user_id, amount):
+        return None  # Không tìm thấy user hoặc không đủ số dư
+    return get_user_by_id(db, user_id)
 
 # Thay đổi loại tài khoản
 def change_user_type(db: Session, user_id: int, usertype: str) -> Optional[User]:
@@ -119,14 +130,57 @@ def change_user_type(db: Session, user_id: int, usertype: str) -> Optional[User]
     db_user.usertype = usertype
     db.commit()
     db.refresh(db_user)
+    invalidate_user_cache(user_id)
     return db_user
 
+# Escape các ký tự đặc biệt của LIKE để từ khóa được so khớp nguyên văn
+def _escape_like(keyword: str) -> str:
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 # Tìm kiếm user
-def search_users(db: Session, keyword: str, skip: int = 0, limit: int = 100) -> List[User]:
-    return db.query(User).filter(
-        (User.username.ilike(f"%{keyword}%")) | 
-        (User.email.ilike(f"%{keyword}%"))
-    ).offset(skip).limit(limit).all()
+# - mode="prefix": username/email bắt đầu bằng từ khóa (LIKE 'kw%', so sánh theo collation của cột
+#   như ILIKE cũ), MySQL dùng chỉ mục B-tree để quét theo khoảng
+# - mode="substring": chứa từ khóa, dùng chỉ mục FULLTEXT ngram nếu được bật trên MySQL
+# - after_id: phân trang keyset (WHERE id > after_id ORDER BY id), không cần OFFSET
+def search_users(
+    db: Session,
+    keyword: str,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    mode: str = "substring"
+) -> List[User]:
+    keyword = keyword.strip()
+    query = db.query(User)
+
+    if mode == "prefix" and keyword:
+        # Tiền tố cố định: CSDL tự chuyển thành quét khoảng trên chỉ mục. Không tự tính cận trên [kw, kw+1)
+        # vì thứ tự ký tự theo collation (vd utf8mb4_0900_ai_ci xếp dấu câu trước chữ số) khác thứ tự mã ký tự
+        pattern = f"{_escape_like(keyword)}%"
+        query = query.filter(
+            User.username.like(pattern, escape="\\") |
+            User.email.like(pattern, escape="\\")
+        )
+    elif (
+        settings.USER_SEARCH_FULLTEXT
+        and db.get_bind().dialect.name == "mysql"
+        and len(keyword) >= 2
+    ):
+        # Tìm theo cụm từ trong chỉ mục ngram (mặc định ngram_token_size = 2)
+        phrase = '"' + keyword.replace('"', " ") + '"'
+        query = query.filter(
+            text("MATCH (users.username, users.email) AGAINST (:phrase IN BOOLEAN MODE)")
+        ).params(phrase=phrase)
+    else:
+        pattern = f"%{_escape_like(keyword)}%"
+        query = query.filter(
+            User.username.ilike(pattern, escape="\\") |
+            User.email.ilike(pattern, escape="\\")
+        )
+
+    if after_id is not None:
+        return query.filter(User.id > after_id).order_by(User.id).limit(limit).all()
+    return query.order_by(User.id).offset(skip).limit(limit).all()
 
 # Reset mật khẩu người dùng với mật khẩu được cung cấp
 def reset_user_password(db: Session, user_id: int, new_password: str = None):
@@ -9,7 +9,10 @@ from app.database.user_crud import (
     change_user_status, add_credits, deduct_credits, change_user_type,
     search_users
 )
-from app.database.auth import authenticate_user
+from app.database.auth import authenticate_user, create_access_token
+from app.database.credit_ledger import record_usage
+from app.database.user_cache import cache_user
+from app.config import settings
 
 # Service đăng ký tài khoản
 def register_user_service(user: UserCreate, db: Session):
@@ -42,8 +45,15 @@ def login_service(username: str, password: str, db: Session):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Trả về thông tin của user
+    # Tạo access token và nạp sẵn user vào cache để các request tiếp theo không cần truy vấn database
+    access_token = create_access_token(user)
+    cache_user(user)
+    
+    # Trả về thông tin của user kèm token
     return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
         "id": user.id,
         "username": user.username,
         "email": user.email,
@@ -132,6 +142,7 @@ def add_credits_service(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy tài khoản"
         )
+    record_usage(user_id, amount, "topup")
     return updated_user
 
 # Service trừ tiền
@@ -154,6 +165,7 @@ def deduct_credits_service(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Không tìm thấy tài khoản hoặc số dư không đủ"
         )
+    record_usage(user_id, -amount, "deduct")
     return updated_user
 
 # Service thay đổi loại tài khoản
@@ -186,9 +198,17 @@ def search_users_service(
     keyword: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = None
+    db: Session = None,
+    after_id: Optional[int] = None,
+    mode: str = "substring"
 ) -> List[User]:
-    return search_users(db, keyword, skip=skip, limit=limit)
+    valid_modes = ["prefix", "substring"]
+    if mode not in valid_modes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chế độ tìm kiếm không hợp lệ. Chỉ chấp nhận: {', '.join(valid_modes)}"
+        )
+    return search_users(db, keyword, skip=skip, limit=limit, after_id=after_id, mode=mode)
 
 # Hàm helper để lấy user theo id hoặc trả về 404
 def get_user_by_id_or_404(user_id: int, db: Session) -> User:
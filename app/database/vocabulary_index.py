@@ -0,0 +1,123 @@
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database.cache_version_crud import get_cache_version, bump_cache_version
+from app.models.voice_library.vocabulary import Vocabulary
+from app.utils.metrics import inc
+
+# Dấu câu được tách thành token riêng (giống cách tách từ trước đây)
+PUNCTUATION = [',', '.', '?', '!', ':', ';']
+# Khóa đánh dấu điểm kết thúc một mục từ vựng trong trie (âm tiết không bao giờ rỗng)
+_END = ""
+# Số profile tối đa giữ chỉ mục trong bộ nhớ của worker
+MAX_CACHED_PROFILES = 256
+
+# Cache chỉ mục: profile_id -> {"version", "audio_paths", "trie"}
+_index_cache: "OrderedDict[int, dict]" = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def vocabulary_cache_name(profile_id: int) -> str:
+    # Tên bộ đếm phiên bản trong bảng cache_versions
+    return f"vocabulary:{profile_id}"
+
+
+def normalize_entry(word: str) -> str:
+    """Chuẩn hóa mục từ vựng: Unicode NFC, chữ thường, gộp khoảng trắng giữa các âm tiết"""
+    return " ".join(unicodedata.normalize("NFC", word).lower().split())
+
+
+def split_tokens(text: str) -> List[str]:
+    """Tách văn bản thành các âm tiết và dấu câu"""
+    text = text.lower().strip()
+    # Xử lý dấu câu - thêm khoảng trắng trước dấu câu để tách riêng
+    for punct in PUNCTUATION:
+        text = text.replace(punct, f' {punct} ')
+    return text.split()
+
+
+def build_trie(entries: Iterable[str]) -> dict:
+    """Trie theo âm tiết: mỗi nút là dict âm tiết -> nút con, _END -> mục từ vựng"""
+    trie: dict = {}
+    for entry in entries:
+        node = trie
+        for token in split_tokens(entry):
+            node = node.setdefault(token, {})
+        if node is not trie:
+            node[_END] = entry
+    return trie
+
+
+def segment(tokens: List[str], trie: dict) -> List[Tuple[str, bool]]:
+    """
+    Tách câu theo kiểu tham lam, ưu tiên mục dài nhất (cụm từ đã ghi âm) tại mỗi vị trí.
+    Trả về danh sách (mục từ vựng hoặc token, có trong từ vựng hay không)
+    """
+    segments = []
+    i = 0
+    n = len(tokens)
+    while i < n:
+        node = trie
+        match = None
+        match_end = i
+        j = i
+        while j < n:
+            node = node.get(tokens[j])
+            if node is None:
+                break
+            j += 1
+            if _END in node:
+                match = node[_END]
+                match_end = j
+        if match is not None:
+            segments.append((match, True))
+            i = match_end
+        else:
+            segments.append((tokens[i], False))
+            i += 1
+    return segments
+
+
+def get_vocabulary_index(db: Session, profile_id: int) -> dict:
+    """
+    Lấy chỉ mục từ vựng của profile (map mục -> đường dẫn audio và trie).
+    Chỉ đọc lại bảng vocabularies khi phiên bản trong cache_versions thay đổi.
+    """
+    version = get_cache_version(db, vocabulary_cache_name(profile_id))
+    with _index_lock:
+        cached = _index_cache.get(profile_id)
+        if cached is not None and cached["version"] == version:
+            _index_cache.move_to_end(profile_id)
+            inc("tts_cache_requests_total", cache="vocabulary_index", result="hit")
+            return cached
+    inc("tts_cache_requests_total", cache="vocabulary_index", result="miss")
+
+    rows = db.query(Vocabulary.word, Vocabulary.audio_path).filter(
+        Vocabulary.voice_profile_id == profile_id
+    ).all()
+    audio_paths: Dict[str, str] = {}
+    for word, audio_path in rows:
+        audio_paths[normalize_entry(word)] = audio_path
+    index = {"version": version, "audio_paths": audio_paths, "trie": build_trie(audio_paths)}
+
+    with _index_lock:
+        _index_cache[profile_id] = index
+        _index_cache.move_to_end(profile_id)
+        while len(_index_cache) > MAX_CACHED_PROFILES:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def cached_vocabulary_profiles() -> int:
+    return len(_index_cache)
+
+
+def invalidate_vocabulary_index(db: Session, profile_id: int) -> None:
+    """Gọi sau khi thêm/xóa/sửa từ vựng để mọi worker nạp lại chỉ mục"""
+    with _index_lock:
+        _index_cache.pop(profile_id, None)
+    bump_cache_version(db, vocabulary_cache_name(profile_id))
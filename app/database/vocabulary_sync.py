@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.voice_library.vocabulary import Vocabulary
+from app.database.phrase_cache import discard_phrases
+from app.database.vocabulary_index import invalidate_vocabulary_index
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Định dạng file audio được đồng bộ
+SUPPORTED_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.m4a', '.aac', '.flac')
+# Manifest của lần đồng bộ trước: tên file -> [kích thước, mtime_ns, sha256]
+MANIFEST_FILENAME = ".vocabulary_manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def manifest_path(profile_dir) -> Path:
+    return Path(profile_dir) / MANIFEST_FILENAME
+
+
+def _load_manifest(profile_dir) -> Dict[str, list]:
+    try:
+        with open(manifest_path(profile_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Manifest đồng bộ của %s bị lỗi, đọc lại toàn bộ file: %s", profile_dir, e)
+        return {}
+
+
+def _save_manifest(profile_dir, manifest: Dict[str, list]) -> None:
+    path = manifest_path(profile_dir)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _file_hash(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _scan(profile_dir) -> Tuple[List[str], Dict[str, Tuple[int, int]]]:
+    """Đọc thư mục một lần: (tên mọi file, file audio -> (kích thước, mtime_ns))"""
+    all_files = []
+    audio_files = {}
+    try:
+        with os.scandir(profile_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                all_files.append(entry.name)
+                if entry.name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    stat_result = entry.stat()
+                    audio_files[entry.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+    except PermissionError:
+        logger.warning("Lỗi quyền truy cập: Không thể đọc thư mục %s", profile_dir)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Không thể đọc thư mục {profile_dir} do không đủ quyền truy cập"
+        )
+    except OSError as e:
+        logger.error("Lỗi khi đọc thư mục: %s", e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Không thể đọc thư mục: {str(e)}"
+        )
+    return all_files, audio_files
+
+
+def _word_of(filename: str) -> str:
+    return os.path.splitext(filename)[0].lower().strip()
+
+
+def sync_profile_vocabulary(
+    db: Session,
+    user_id: int,
+    profile_id: int,
+    profile_dir,
+    remove_missing: bool = False,
+    include_debug: bool = True
+) -> dict:
+    """
+    Đồng bộ từ vựng của profile với file audio trong thư mục
+    - Chỉ file mới hoặc đã đổi (kích thước/mtime khác manifest lần trước) mới được đọc để tính hash
+    - File chưa có bản ghi được thêm bằng một câu INSERT nhiều dòng
+    - remove_missing=True: xóa (một câu DELETE) các bản ghi không còn file audio, mặc định chỉ báo cáo
+    - include_debug=False: không trả về danh sách file trong debug_info
+    """
+    profile_dir = Path(profile_dir)
+    rows = db.query(Vocabulary.id, Vocabulary.word).filter(Vocabulary.voice_profile_id == profile_id).all()
+    vocab_words: Dict[str, List[int]] = {}
+    for vocab_id, word in rows:
+        vocab_words.setdefault(word.lower().strip(), []).append(vocab_id)
+
+    if not profile_dir.exists():
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        result = {
+            "status": "success",
+            "message": "Thư mục không tồn tại, đã tạo mới",
+            "total_files": 0,
+            "total_records": len(rows),
+            "missing_files": [],
+            "missing_records": []
+        }
+        if include_debug:
+            result["debug_info"] = []
+        return result
+
+    all_files, audio_files = _scan(profile_dir)
+    logger.debug("Đọc được %s file trong thư mục %s", len(all_files), profile_dir)
+
+    # So với manifest: chỉ tính lại hash của file mới hoặc có kích thước/mtime thay đổi
+    previous = _load_manifest(profile_dir)
+    manifest: Dict[str, list] = {}
+    changed_files = []
+    examined = 0
+    for name, (size, mtime_ns) in audio_files.items():
+        entry = previous.get(name)
+        if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+            manifest[name] = entry
+            continue
+        try:
+            digest = _file_hash(str(profile_dir / name))
+        except OSError as e:
+            # File vừa bị xóa/đổi tên trong lúc đồng bộ
+            logger.warning("Không đọc được file %s: %s", name, e)
+            continue
+        examined += 1
+        manifest[name] = [size, mtime_ns, digest]
+        if entry is not None and entry[2] != digest:
+            changed_files.append(name)
+
+    # Mỗi từ ứng với file đầu tiên theo thứ tự tên, các file cùng từ còn lại là trùng lặp
+    word_files: Dict[str, str] = {}
+    duplicate_files = []
+    for name in sorted(manifest):
+        word = _word_of(name)
+        if word in word_files:
+            duplicate_files.append(name)
+        else:
+            word_files[word] = name
+
+    missing_records = [word for word in word_files if word not in vocab_words]
+    missing_files = [word for word in vocab_words if word not in word_files]
+    if missing_records:
+        db.execute(insert(Vocabulary), [
+            {"voice_profile_id": profile_id, "word": word, "audio_path": str(profile_dir / word_files[word])}
+            for word in missing_records
+        ])
+    removed_records = []
+    if remove_missing and missing_files:
+        ids = [vocab_id for word in missing_files for vocab_id in vocab_words[word]]
+        db.query(Vocabulary).filter(Vocabulary.id.in_(ids)).delete(synchronize_session=False)
+        removed_records = missing_files
+    db.commit()
+
+    changed_words = sorted({_word_of(name) for name in changed_files if word_files.get(_word_of(name)) == name})
+    if missing_records or removed_records or changed_words:
+        invalidate_vocabulary_index(db, profile_id)
+    # Cụm từ ghép sẵn chứa từ đã đổi file hoặc đã bị xóa
+    for word in changed_words + removed_records:
+        discard_phrases(profile_id, word)
+    # Chỉ ghi manifest sau khi database đã cập nhật để lần sau không bỏ sót
+    if manifest != previous:
+        _save_manifest(profile_dir, manifest)
+
+    result = {
+        "status": "success",
+        "message": "Đã đồng bộ hóa dữ liệu",
+        "total_files": len(audio_files),
+        "unique_files": len(word_files),
+        "duplicate_files": len(duplicate_files),
+        "examined_files": examined,
+        "changed_files": changed_words,
+        "total_records": len(rows) + len(missing_records) - sum(len(vocab_words[w]) for w in removed_records),
+        "added_records": missing_records,
+        "removed_records": removed_records,
+        "missing_files": missing_files,
+    }
+    if include_debug:
+        result["debug_info"] = {
+            "all_files": all_files,
+            "filtered_audio_files": list(audio_files),
+            "db_words": list(vocab_words),
+        }
+    return result
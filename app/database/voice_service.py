@@ -4,19 +4,15 @@ import math
 import json
 import base64
 import hashlib
-import subprocess
-import tempfile
 import shutil
 from pathlib import Path
 import numpy as np
 from scipy import signal
 import scipy.ndimage as ndimage
-import time
 
 # Thư viện xử lý audio
 import soundfile as sf
 import librosa
-import sounddevice as sd
 
 # Thư viện web
 from fastapi import HTTPException, UploadFile
@@ -27,11 +23,39 @@ from typing import List, Optional
 from app.models.voice_library.vocabulary import VoiceProfile, Vocabulary
 from app.models.voice_library.schemas import VoiceProfileCreate, VoiceProfileUpdate
 from app.database.user_service import get_user_by_id_or_404
+from app.database.noise_profile import (
+    load_noise_profile, noise_profile_signature, update_noise_profile, build_noise_profile, denoise_audio_batch
+)
+from app.database.audio_decoder import decode_audio
+from app.database.output_store import new_output_path
+from app.database.vocabulary_index import (
+    PUNCTUATION, normalize_entry, split_tokens, segment,
+    get_vocabulary_index, invalidate_vocabulary_index
+)
+from app.database.phrase_cache import record_phrases, plan_phrases, put_phrase, discard_phrases
+from app.database.generated_clips import get_generated_clip, discard_generated_clip
+from app.database.clip_store import shared_clips
+from app.database.usage_stats import discard_usage, track_usage
+from app.utils.text_normalizer import normalize_text
+from app.utils.metrics import stage
+from app.utils.tracing import traced
+from app.database.audio_format import (
+    CANONICAL_DTYPE, CANONICAL_SUBTYPE, ensure_profile_format, get_profile_sample_rate, to_canonical
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # Thư mục lưu trữ tạm cho các file âm thanh xử lý
 TEMP_DIR = os.environ.get('AUDIO_TEMP_DIR', 'app/temp/audio')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Từ nối, dùng crossfade ngắn hơn khi ghép
+CONJUNCTIONS = ['và', 'hay', 'hoặc', 'nhưng', 'của', 'thì', 'là', 'mà']
+
+# Khoảng lặng thay cho dấu câu chưa ghi âm ở chế độ hybrid (giây)
+HYBRID_PUNCTUATION_PAUSE = 0.15
+
 # Thay đổi định nghĩa này để khớp với router/voice_library.py
 VOICE_PROFILES_DIR = Path(os.environ.get('VOICE_PROFILES_DIR', 'data/voice_profiles'))
 os.makedirs(VOICE_PROFILES_DIR, exist_ok=True)
@@ -46,7 +70,7 @@ def ensure_directories_exist():
     for directory in directories:
         try:
             os.makedirs(directory, exist_ok=True)
-            print(f"Đảm bảo thư mục tồn tại: {directory}")
+            logger.debug("Đảm bảo thư mục tồn tại: %s", directory)
             
             # Kiểm tra quyền ghi
             test_file = os.path.join(directory, ".write_test")
@@ -54,7 +78,7 @@ def ensure_directories_exist():
                 f.write("test")
             os.remove(test_file)
         except Exception as e:
-            print(f"Lỗi khi tạo hoặc kiểm tra thư mục {directory}: {str(e)}")
+            logger.error("Lỗi khi tạo hoặc kiểm tra thư mục %s: %s", directory, e)
 
 # Gọi hàm đảm bảo thư mục khi module được import
 ensure_directories_exist()
@@ -125,6 +149,9 @@ def delete_voice_profile(profile_id: int, user_id: int, db: Session):
     # Xóa profile từ database
     db.delete(profile)
     db.commit()
+    invalidate_vocabulary_index(db, profile_id)
+    discard_phrases(profile_id)
+    discard_usage(db, profile_id)
     
     return True
 
@@ -142,20 +169,23 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
         if not profile:
             raise HTTPException(status_code=404, detail="Voice profile not found")
 
-        # Đảm bảo word được chuẩn hóa (lowercase và loại bỏ khoảng trắng)
-        word = word.lower().strip()
+        # Đảm bảo word được chuẩn hóa (lowercase, gộp khoảng trắng để lưu được cả cụm từ)
+        word = normalize_entry(word)
         
         # Kiểm tra nếu word chứa ký tự không hợp lệ cho tên file
         invalid_chars = r'[\\/*?:"<>|]'
         if re.search(invalid_chars, word):
             safe_word = re.sub(invalid_chars, '_', word)
-            print(f"Đã thay thế các ký tự không hợp lệ trong từ '{word}' thành '{safe_word}'")
+            logger.info("Đã thay thế các ký tự không hợp lệ trong từ '%s' thành '%s'", word, safe_word)
             word = safe_word
 
         # Lưu file audio
         file_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
         file_dir.mkdir(exist_ok=True, parents=True)
         
+        # Định dạng chuẩn của profile (sample rate cố định, mono)
+        target_sr = ensure_profile_format(file_dir)["sample_rate"]
+        
         # Đảm bảo file luôn có đuôi .wav
         filepath = file_dir / f"{word}.wav"
         temp_path = filepath.with_suffix('.temp')
@@ -164,7 +194,7 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
         if os.path.exists(filepath):
             backup_path = filepath.with_suffix('.backup')
             shutil.copy2(filepath, backup_path)
-            print(f"Đã tạo backup cho file: {filepath}")
+            logger.info("Đã tạo backup cho file: %s", filepath)
         
         # Lưu file tạm trước để kiểm tra
         try:
@@ -176,12 +206,12 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
                 raise HTTPException(status_code=400, detail="File âm thanh rỗng")
                 
         except Exception as e:
-            print(f"Lỗi khi lưu file tạm: {str(e)}")
+            logger.error("Lỗi khi lưu file tạm: %s", e)
             raise HTTPException(status_code=500, detail=f"Lỗi khi lưu file tạm: {str(e)}")
         
         # Sử dụng hàm validate_and_fix_audio_file để xử lý file audio
-        print(f"Kiểm tra và xử lý file: {temp_path}")
-        valid, error_msg = validate_and_fix_audio_file(str(temp_path), force_convert=True)
+        logger.debug("Kiểm tra và xử lý file: %s", temp_path)
+        valid, error_msg = validate_and_fix_audio_file(str(temp_path), force_convert=True, target_sr=target_sr)
         if not valid:
             raise HTTPException(
                 status_code=400,
@@ -191,17 +221,17 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
         # Nếu valid, di chuyển từ temp_path sang filepath
         try:
             os.replace(str(temp_path), str(filepath))
-            print(f"Đã lưu file audio: {filepath}")
+            logger.info("Đã lưu file audio: %s", filepath)
         except Exception as e:
-            print(f"Lỗi khi di chuyển file: {str(e)}")
+            logger.error("Lỗi khi di chuyển file: %s", e)
             raise HTTPException(status_code=500, detail=f"Lỗi khi di chuyển file: {str(e)}")
         
         # Xử lý nâng cao cho file âm thanh
-        print(f"Đang xử lý nâng cao cho file: {str(filepath)}")
+        logger.debug("Đang xử lý nâng cao cho file: %s", filepath)
         try:
             process_audio_for_vocabulary(str(filepath))
         except Exception as e:
-            print(f"Lỗi khi xử lý nâng cao âm thanh: {str(e)}")
+            logger.error("Lỗi khi xử lý nâng cao âm thanh: %s", e)
             # Khôi phục từ backup nếu có
             if backup_path and os.path.exists(str(backup_path)):
                 shutil.copy2(str(backup_path), str(filepath))
@@ -212,11 +242,24 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
         if backup_path and os.path.exists(str(backup_path)):
             os.remove(str(backup_path))
         
+        # Cập nhật dần mô hình nhiễu của profile với bản ghi âm mới
+        try:
+            y_new, sr_new = decode_audio(filepath)
+            update_noise_profile(file_dir, y_new, sr_new)
+        except Exception as e:
+            logger.error("Lỗi khi cập nhật mô hình nhiễu: %s", e)
+        
+        # Từ đã có bản ghi âm thật, bỏ clip tạo tự động (nếu có) của chế độ hybrid
+        discard_generated_clip(file_dir, word)
+        # và các cụm từ ghép sẵn có chứa từ này
+        discard_phrases(profile_id, word)
+        
         # Tạo hoặc cập nhật record trong database
         vocab = get_vocabulary_by_word(profile_id, user_id, word, db)
         if vocab:
             vocab.audio_path = str(filepath)
             db.commit()
+            invalidate_vocabulary_index(db, profile_id)
             return vocab
         else:
             db_vocab = Vocabulary(
@@ -227,6 +270,7 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
             db.add(db_vocab)
             db.commit()
             db.refresh(db_vocab)
+            invalidate_vocabulary_index(db, profile_id)
             return db_vocab
             
     except HTTPException as he:
@@ -260,7 +304,7 @@ def add_vocabulary(profile_id: int, user_id: int, word: str, audio_file: UploadF
             except:
                 pass
             
-        print(f"Lỗi khi thêm từ vựng: {str(e)}")
+        logger.error("Lỗi khi thêm từ vựng: %s", e)
         raise HTTPException(status_code=500, detail=f"Lỗi khi thêm từ vựng: {str(e)}")
 
 def get_vocabularies(profile_id: int, user_id: int, db: Session, skip: int = 0, limit: int = 100):
@@ -298,6 +342,8 @@ def delete_vocabulary(profile_id: int, user_id: int, word: str, db: Session):
     # Xóa record
     db.delete(vocab)
     db.commit()
+    invalidate_vocabulary_index(db, profile_id)
+    discard_phrases(profile_id, normalize_entry(word))
     
     return True
 
@@ -310,8 +356,56 @@ def count_vocabularies(profile_id: int, user_id: int, db: Session):
     total = db.query(Vocabulary).filter(Vocabulary.voice_profile_id == profile_id).count()
     return total
 
+def load_vocabulary_clip(word: str, audio_path: str, noise_profile: Optional[dict], sampling_rate: int) -> np.ndarray:
+    """
+    Đọc và xử lý file ghi âm của một từ (cắt khoảng lặng, khử nhiễu theo mô hình nhiễu của profile)
+    rồi chuyển về định dạng chuẩn của profile; raise HTTPException nếu file thiếu hoặc lỗi
+    """
+    logger.debug("Đang đọc file: %s", audio_path)
+    
+    # Kiểm tra file tồn tại
+    if not os.path.exists(audio_path):
+        raise HTTPException(
+            status_code=404,
+            detail=f"File audio cho từ '{word}' không tồn tại: {audio_path}"
+        )
+    
+    # Validate file
+    with stage("validation"):
+        valid, error_msg = validate_and_fix_audio_file(audio_path)
+    if not valid:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi với file audio cho từ '{word}': {error_msg}. Vui lòng ghi âm lại từ này."
+        )
+    
+    # Sử dụng hàm process_audio_for_vocabulary để xử lý audio với phương pháp cắt tối ưu
+    # Xử lý trong bộ nhớ, không ghi file tạm dùng chung tên giữa các request
+    data, rate = process_audio_for_vocabulary(audio_path, noise_profile=noise_profile)
+    
+    if data is None or rate is None:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Không thể xử lý audio cho từ '{word}'. Vui lòng ghi âm lại."
+        )
+    
+    if rate != sampling_rate:
+        # Clip cũ chưa được chuyển về định dạng chuẩn (xem app/scripts/normalize_audio_format.py)
+        logger.warning("File %s có sample rate %s, khác định dạng chuẩn %s", audio_path, rate, sampling_rate)
+    return to_canonical(data, rate, sampling_rate)
+
 # Text to Speech Service
-def text_to_speech(profile_id: int, user_id: int, text: str, db: Session):
+@traced()
+def synthesize_speech(
+    profile_id: int, user_id: int, text: str, db: Session, hybrid: bool = False, count_usage: bool = True
+):
+    """
+    Ghép câu từ các file audio từ vựng của profile
+    - hybrid=True: từ chưa có trong vocabulary được tạo bằng MMS-TTS (cache trong thư mục generated/)
+      thay vì trả lỗi 400; dấu câu chưa ghi âm được thay bằng khoảng lặng ngắn
+    - count_usage=False: không tính vào thống kê sử dụng (dùng khi làm nóng cache)
+    Trả về dict gồm audio (mảng float32 mono), sample_rate, duration và generated_words, không ghi file
+    """
     try:
         # Lấy voice profile
         profile = get_voice_profile_by_id(profile_id, user_id, db)
@@ -328,9 +422,10 @@ def text_to_speech(profile_id: int, user_id: int, text: str, db: Session):
                 detail="Bạn không có quyền sử dụng voice profile này"
             )
             
-        # Lấy vocabulary của profile
-        vocab_query = db.query(Vocabulary).filter(Vocabulary.voice_profile_id == profile_id)
-        vocabulary = {item.word: item.audio_path for item in vocab_query.all()}
+        # Chỉ mục từ vựng của profile (cache trong bộ nhớ, nạp lại khi từ vựng thay đổi)
+        with stage("vocab_query"):
+            vocabulary_index = get_vocabulary_index(db, profile_id)
+        vocabulary = vocabulary_index["audio_paths"]
         
         if not vocabulary:
             raise HTTPException(
@@ -338,82 +433,71 @@ def text_to_speech(profile_id: int, user_id: int, text: str, db: Session):
                 detail="Voice profile chưa có vocabulary nào"
             )
             
-        # Xử lý text, tách thành từng từ
-        # Cải thiện tách từ, hỗ trợ dấu câu và khoảng trắng đặc biệt
-        text = text.lower().strip()
-        # Xử lý dấu câu - thêm khoảng trắng trước dấu câu để tách riêng
-        for punct in [',', '.', '?', '!', ':', ';']:
-            text = text.replace(punct, f' {punct}')
-        words = [word for word in text.split() if word.strip()]
-        
-        # Kiểm tra và lọc ra các từ có sẵn trong vocabulary
-        available_vocabs = {}
-        missing_words = []
-        
-        for word in words:
-            word = word.strip()
-            if not word:
-                continue
-            
-            if word in vocabulary:
-                available_vocabs[word] = vocabulary[word]
-            else:
-                missing_words.append(word)
+        # Tách câu thành âm tiết và dấu câu, sau đó ghép theo mục từ vựng dài nhất
+        # (ưu tiên cụm từ đã ghi âm nguyên cụm như "xin chào" để giảm số lần nối)
+        with stage("normalize"):
+            tokens = split_tokens(normalize_text(text))
+        segments = segment(tokens, vocabulary_index["trie"])
+        words = [entry for entry, _ in segments]
+        missing_words = [entry for entry, found in segments if not found]
         
-        if missing_words:
+        if missing_words and not hybrid:
             raise HTTPException(
                 status_code=400,
                 detail=f"Các từ sau chưa có trong vocabulary: {', '.join(missing_words)}"
             )
+        available_vocabs = vocabulary
         
-        # Biến để lưu các từ đã xử lý
-        processed_words = []
-        sampling_rate = None
+        generated_words = []
+        
+        # Sample rate chuẩn và mô hình nhiễu chung của profile (đọc một lần cho cả câu)
+        profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
+        sampling_rate = get_profile_sample_rate(profile_dir)
+        # Dấu vết đọc trước mô hình nhiễu: cụm từ ghép từ mô hình cũ bị bỏ khi mô hình được lưu lại
+        noise_signature = noise_profile_signature(profile_dir)
+        noise_profile = load_noise_profile(profile_dir)
         
-        # Đọc tất cả các file audio trước, xử lý từng file để xóa khoảng trống
-        for i, word in enumerate(words):
+        # Đọc và xử lý file audio của từng từ để xóa khoảng trống
+        def load_word(i):
+            word = words[i]
             try:
-                audio_path = available_vocabs[word]
-                print(f"Đang đọc file: {audio_path}")
-                
-                # Kiểm tra file tồn tại
-                if not os.path.exists(audio_path):
-                    raise HTTPException(
-                        status_code=404,
-                        detail=f"File audio cho từ '{word}' không tồn tại: {audio_path}"
-                    )
-                
-                # Validate file
-                valid, error_msg = validate_and_fix_audio_file(audio_path)
-                if not valid:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Lỗi với file audio cho từ '{word}': {error_msg}. Vui lòng ghi âm lại từ này."
-                    )
-                
-                # Sử dụng hàm process_audio_for_vocabulary để xử lý audio với phương pháp cắt tối ưu
-                temp_output_path = os.path.join(tempfile.gettempdir(), f"proc_{os.path.basename(audio_path)}")
-                data, rate = process_audio_for_vocabulary(audio_path, output_path=temp_output_path)
+                if word not in available_vocabs:
+                    # Chế độ hybrid: dấu câu thành khoảng lặng, từ thiếu được tạo bằng model
+                    if word in PUNCTUATION:
+                        data = np.zeros(int(HYBRID_PUNCTUATION_PAUSE * sampling_rate), dtype=CANONICAL_DTYPE)
+                    else:
+                        try:
+                            with stage("generate"):
+                                data = get_generated_clip(profile_dir, word, available_vocabs.values())
+                        except RuntimeError as e:
+                            raise HTTPException(
+                                status_code=503,
+                                detail=f"Không thể tạo âm thanh cho từ '{word}': {str(e)}"
+                            )
+                        generated_words.append(word)
+                    return {
+                        'word': word,
+                        'data': data,
+                        'is_punctuation': word in PUNCTUATION,
+                        'is_short_word': len(word) <= 2 or len(data) < int(0.2 * sampling_rate),
+                        'is_conjunction': False,
+                        'position': i,
+                        'is_last': i == len(words) - 1
+                    }
                 
-                if data is None or rate is None:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Không thể xử lý audio cho từ '{word}'. Vui lòng ghi âm lại."
-                    )
-                
-                if sampling_rate is None:
-                    sampling_rate = rate
-                elif rate != sampling_rate:
-                    # Resampling để khớp tỷ lệ mẫu
-                    data = librosa.resample(data, orig_sr=rate, target_sr=sampling_rate)
+                audio_path = available_vocabs[word]
+                # Clip đã xử lý sẵn trong kho dùng chung giữa các worker, không có thì đọc và xử lý file
+                data = lookup_clip(word, audio_path)
+                if data is None:
+                    data = load_vocabulary_clip(word, audio_path, noise_profile, sampling_rate)
                 
                 # Phân tích từ để quyết định xử lý đặc biệt
-                is_punctuation = word in [',', '.', '?', '!', ':', ';']
+                is_punctuation = word in PUNCTUATION
                 is_short_word = len(word) <= 2 or len(data) < int(0.2 * sampling_rate)
-                is_conjunction = word in ['và', 'hay', 'hoặc', 'nhưng', 'của', 'thì', 'là', 'mà']
+                is_conjunction = word in CONJUNCTIONS
                 
                 # Lưu thông tin để xử lý nối từ
-                processed_words.append({
+                return {
                     'word': word,
                     'data': data,
                     'is_punctuation': is_punctuation,
@@ -421,88 +505,143 @@ def text_to_speech(profile_id: int, user_id: int, text: str, db: Session):
                     'is_conjunction': is_conjunction,
                     'position': i,  # Vị trí từ trong câu
                     'is_last': i == len(words) - 1  # Đánh dấu từ cuối
-                })
-                
-                # Xóa file tạm sau khi sử dụng
-                if os.path.exists(temp_output_path):
-                    os.remove(temp_output_path)
+                }
                 
+            except HTTPException:
+                raise
             except Exception as e:
-                print(f"Lỗi khi xử lý từ '{word}': {str(e)}")
+                logger.error("Lỗi khi xử lý từ '%s': %s", word, e)
                 raise HTTPException(
                     status_code=500,
                     detail=f"Lỗi khi xử lý từ '{word}': {str(e)}"
                 )
         
+        # Cụm từ hay gặp được ghép một lần rồi dùng lại như một đơn vị (xem app/database/phrase_cache.py)
+        recorded = [word in available_vocabs and word not in PUNCTUATION for word in words]
+        record_phrases(profile_id, words, recorded)
+        processed_words = []
+        used_phrases = []
+        # Clip đã xử lý sẵn dùng chung giữa các worker (xem app/database/clip_store.py)
+        with shared_clips(user_id, profile_id, profile_dir, sampling_rate) as lookup_clip:
+            for start, end, phrase_audio in plan_phrases(profile_id, words, recorded, available_vocabs, noise_signature):
+                if end - start == 1:
+                    processed_words.append(load_word(start))
+                    continue
+                phrase = tuple(words[start:end])
+                used_phrases.append(phrase)
+                if phrase_audio is None:
+                    parts = [load_word(k) for k in range(start, end)]
+                    with stage("crossfade"):
+                        phrase_audio = join_processed_words(parts, sampling_rate)
+                    put_phrase(profile_id, phrase, phrase_audio, available_vocabs, noise_signature)
+                processed_words.append({
+                    'word': " ".join(phrase),
+                    'data': phrase_audio,
+                    'is_punctuation': False,
+                    'is_short_word': len(phrase[0]) <= 2,
+                    'is_conjunction': phrase[0] in CONJUNCTIONS,
+                    'position': start,
+                    'is_last': end == len(words)
+                })
+        
+        if count_usage:
+            # Thống kê theo profile/từ/cụm từ để làm nóng cache sau khi khởi động lại (xem app/database/cache_warmup.py)
+            track_usage(profile_id, [word for word, is_recorded in zip(words, recorded) if is_recorded], used_phrases)
+        
         # Kết hợp các từ lại với chiến lược nối liền mạch
-        print("Đang kết hợp các từ...")
-        combined_audio = np.array([])
-        
-        for i, word_dict in enumerate(processed_words):
-            word_data = word_dict['data']
-            is_punctuation = word_dict['is_punctuation']
-            is_short_word = word_dict['is_short_word']
-            is_conjunction = word_dict['is_conjunction'] 
-            is_last = word_dict['is_last']
-            
-            # Xử lý điều kiện ghép từ đầu tiên
-            if len(combined_audio) == 0:
-                combined_audio = word_data
-                continue
-            
-            # Quyết định crossfade dựa trên loại từ
-            if is_punctuation:
-                # Thêm khoảng dừng nhỏ trước dấu câu (10ms)
-                pause = np.zeros(int(0.01 * sampling_rate))
-                combined_audio = np.concatenate([combined_audio, pause, word_data])
-            else:
-                # Điều chỉnh độ dài crossfade dựa trên loại từ
-                if is_short_word or is_conjunction:
-                    # Dùng crossfade ngắn hơn cho từ ngắn để tránh mất âm thanh
-                    crossfade_duration = 0.03  # 30ms
-                else:
-                    crossfade_duration = 0.05  # 50ms 
-                
-                # Sử dụng smooth_audio_transitions để tạo chuyển tiếp mượt mà
-                combined_audio = smooth_audio_transitions(
-                    combined_audio, 
-                    word_data, 
-                    sampling_rate, 
-                    crossfade_duration=crossfade_duration
-                )
-                
+        logger.debug("Đang kết hợp các từ...")
+        with stage("crossfade"):
+            combined_audio = join_processed_words(processed_words, sampling_rate)
+        
         # Thêm fade in/out cho toàn bộ câu
         # Dùng cửa sổ Hanning để tạo fade mượt mà ở đầu và cuối
         if len(combined_audio) > 0:
             fade_samples = min(int(0.02 * sampling_rate), len(combined_audio) // 10)
             if fade_samples > 1:
                 # Tạo fade in/out
-                fade_in = np.hanning(fade_samples * 2)[:fade_samples]
-                fade_out = np.hanning(fade_samples * 2)[-fade_samples:]
+                window = np.hanning(fade_samples * 2).astype(CANONICAL_DTYPE)
+                fade_in = window[:fade_samples]
+                fade_out = window[-fade_samples:]
                 combined_audio[:fade_samples] *= fade_in
                 combined_audio[-fade_samples:] *= fade_out
         
-        # Định dạng file output
-        output_path = os.path.join(TEMP_DIR, f"tts_{user_id}_{profile_id}_{int(time.time())}.wav")
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Ghi file
-        sf.write(output_path, combined_audio, sampling_rate)
-        
         return {
             "success": True,
-            "audio_path": output_path
+            "audio": combined_audio,
+            "sample_rate": sampling_rate,
+            "duration": len(combined_audio) / sampling_rate,
+            "generated_words": generated_words
         }
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"Text-to-speech error: {str(e)}")
+        logger.error("Text-to-speech error: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi khi thực hiện text-to-speech: {str(e)}"
         )
 
+def join_processed_words(processed_words, sampling_rate):
+    """Nối các đoạn audio đã xử lý (từ, dấu câu hoặc cụm từ ghép sẵn) với crossfade theo loại từ"""
+    combined_audio = np.array([], dtype=CANONICAL_DTYPE)
+    
+    for i, word_dict in enumerate(processed_words):
+        word_data = word_dict['data']
+        is_punctuation = word_dict['is_punctuation']
+        is_short_word = word_dict['is_short_word']
+        is_conjunction = word_dict['is_conjunction'] 
+        is_last = word_dict['is_last']
+        
+        # Xử lý điều kiện ghép từ đầu tiên
+        if len(combined_audio) == 0:
+            combined_audio = word_data
+            continue
+        
+        # Quyết định crossfade dựa trên loại từ
+        if is_punctuation:
+            # Thêm khoảng dừng nhỏ trước dấu câu (10ms)
+            pause = np.zeros(int(0.01 * sampling_rate), dtype=CANONICAL_DTYPE)
+            combined_audio = np.concatenate([combined_audio, pause, word_data])
+        else:
+            # Điều chỉnh độ dài crossfade dựa trên loại từ
+            if is_short_word or is_conjunction:
+                # Dùng crossfade ngắn hơn cho từ ngắn để tránh mất âm thanh
+                crossfade_duration = 0.03  # 30ms
+            else:
+                crossfade_duration = 0.05  # 50ms 
+            
+            # Sử dụng smooth_audio_transitions để tạo chuyển tiếp mượt mà
+            combined_audio = smooth_audio_transitions(
+                combined_audio, 
+                word_data, 
+                sampling_rate, 
+                crossfade_duration=crossfade_duration
+            )
+    
+    return combined_audio
+
+@traced()
+def text_to_speech(profile_id: int, user_id: int, text: str, db: Session, ttl_seconds: Optional[int] = None):
+    """
+    Ghép câu và ghi kết quả ra file WAV trong TEMP_DIR
+    File có tên duy nhất và được janitor xóa khi hết hạn (mặc định OUTPUT_MAX_AGE_SECONDS)
+    """
+    result = synthesize_speech(profile_id, user_id, text, db)
+    
+    # Định dạng file output
+    output_path = new_output_path(user_id, "wav", ttl_seconds)
+    
+    # Ghi file
+    with stage("write"):
+        sf.write(output_path, result["audio"], result["sample_rate"])
+    
+    return {
+        "success": True,
+        "audio_path": output_path,
+        "duration": result["duration"]
+    }
+
 # Hàm xử lý âm thanh
 def trim_silence(audio_path, threshold=0.025, min_silence_duration=0.1, pad_ms=50):
     """
@@ -512,7 +651,7 @@ def trim_silence(audio_path, threshold=0.025, min_silence_duration=0.1, pad_ms=5
     - pad_ms: khoảng đệm giữ lại ở đầu và cuối (millisecond)
     """
     try:
-        print(f"Đang cắt bỏ khoảng lặng cho file: {audio_path}")
+        logger.debug("Đang cắt bỏ khoảng lặng cho file: %s", audio_path)
         
         # Lưu một bản sao của file gốc để phòng trường hợp có lỗi
         backup_path = f"{audio_path}.backup"
@@ -580,13 +719,13 @@ def trim_silence(audio_path, threshold=0.025, min_silence_duration=0.1, pad_ms=5
             
             # Lưu file đã xử lý
             sf.write(audio_path, trimmed_data, rate)
-            print(f"Đã cắt giảm khoảng lặng thành công: {audio_path}")
+            logger.debug("Đã cắt giảm khoảng lặng thành công: %s", audio_path)
             
             # Xóa bản sao nếu thành công
             os.remove(backup_path)
             return True
         else:
-            print(f"Không tìm thấy khoảng không lặng trong file: {audio_path}")
+            logger.warning("Không tìm thấy khoảng không lặng trong file: %s", audio_path)
             # Khôi phục file gốc
             os.remove(audio_path)
             os.rename(backup_path, audio_path)
@@ -594,7 +733,7 @@ def trim_silence(audio_path, threshold=0.025, min_silence_duration=0.1, pad_ms=5
             
     except Exception as e:
         # Nếu có lỗi, khôi phục file gốc
-        print(f"Lỗi khi cắt giảm khoảng lặng: {e}")
+        logger.error("Lỗi khi cắt giảm khoảng lặng: %s", e)
         if os.path.exists(backup_path):
             if os.path.exists(audio_path):
                 os.remove(audio_path)
@@ -615,130 +754,83 @@ def get_vocabulary_by_word(profile_id: int, user_id: int, word: str, db: Session
     ).first()
 
 # Hàm kiểm tra và sửa file audio
-def validate_and_fix_audio_file(file_path, force_convert=False):
+def validate_and_fix_audio_file(file_path, force_convert=False, target_sr=None):
     """
     Kiểm tra và sửa file audio nếu cần
-    - Đọc file bằng librosa (hỗ trợ nhiều định dạng)
+    - Giải mã file bằng decode_audio (hỗ trợ nhiều định dạng)
     - Lưu lại dưới dạng WAV chuẩn
+    - target_sr: nếu có, chuyển file về mono với sample rate chuẩn của profile
     """
     file_path = str(file_path)
     if not os.path.exists(file_path):
-        print(f"File không tồn tại: {file_path}")
+        logger.warning("File không tồn tại: %s", file_path)
         return False, "File không tồn tại"
     
     # Kiểm tra kích thước file
     if os.path.getsize(file_path) == 0:
-        print(f"File rỗng: {file_path}")
+        logger.warning("File rỗng: %s", file_path)
         return False, "File rỗng"
     
     # Nếu không cần convert bắt buộc, thử đọc bằng soundfile trước
     if not force_convert:
         try:
-            data, rate = sf.read(file_path)
-            print(f"File đã ở định dạng phù hợp: {file_path}")
-            return True, None
+            info = sf.info(file_path)
+            if target_sr is None or (info.samplerate == target_sr and info.channels == 1):
+                logger.debug("File đã ở định dạng phù hợp: %s", file_path)
+                return True, None
+            logger.warning("File chưa đúng định dạng chuẩn (%sHz, %s kênh): %s", info.samplerate, info.channels, file_path)
         except Exception as e:
-            print(f"Không thể đọc file bằng soundfile: {str(e)}")
+            logger.warning("Không thể đọc file bằng soundfile: %s", e)
             # Tiếp tục với convert
     
     try:
-        print(f"Đang convert file: {file_path}")
+        logger.debug("Đang convert file: %s", file_path)
         # Tạo một file tạm để lưu kết quả
         temp_path = file_path + ".temp.wav"
         
-        # Thử đọc bằng librosa (hỗ trợ nhiều định dạng)
+        # Giải mã trong tiến trình (libsndfile/PyAV), chỉ dùng ffmpeg khi cần
         try:
-            # Đọc audio với librosa
-            y, sr = librosa.load(file_path, sr=None)
-            # Librosa đọc thành mảng numpy float -> cần chuyển về int16 cho WAV
-            y = (y * 32767).astype(np.int16)
-            # Lưu với định dạng WAV
-            sf.write(temp_path, y, sr, format='WAV')
+            y, sr = decode_audio(file_path, target_sr=target_sr)
+            sf.write(temp_path, y, sr, subtype=CANONICAL_SUBTYPE, format='WAV')
         except Exception as e1:
-            print(f"Không thể đọc file bằng librosa: {str(e1)}")
-            # Thử phương pháp khác - ví dụ sử dụng subprocess gọi ffmpeg
-            try:
-                # Danh sách các đường dẫn ffmpeg có thể có
-                ffmpeg_paths = [
-                    'ffmpeg',  # Nếu ffmpeg trong PATH
-                    os.path.join(os.environ.get('PROGRAMFILES', 'C:\\Program Files'), 'ffmpeg', 'bin', 'ffmpeg.exe'),
-                    os.path.join(os.environ.get('PROGRAMFILES(X86)', 'C:\\Program Files (x86)'), 'ffmpeg', 'bin', 'ffmpeg.exe'),
-                    'C:\\ffmpeg\\bin\\ffmpeg.exe',
-                    os.path.expanduser('~\\ffmpeg\\bin\\ffmpeg.exe')
-                ]
-                
-                # Thử từng đường dẫn cho đến khi tìm được ffmpeg
-                ffmpeg_found = False
-                error_messages = []
-                
-                for ffmpeg_path in ffmpeg_paths:
-                    try:
-                        print(f"Thử đường dẫn ffmpeg: {ffmpeg_path}")
-                        # Sử dụng ffmpeg để convert
-                        cmd = [ffmpeg_path, '-y', '-i', file_path, '-acodec', 'pcm_s16le', temp_path]
-                        subprocess.run(cmd, check=True, capture_output=True)
-                        ffmpeg_found = True
-                        print(f"Đã tìm thấy và sử dụng ffmpeg tại: {ffmpeg_path}")
-                        break
-                    except Exception as e:
-                        error_messages.append(f"{ffmpeg_path}: {str(e)}")
-                        continue
-                
-                if not ffmpeg_found:
-                    error_detail = " | ".join(error_messages)
-                    print(f"Không tìm thấy ffmpeg trực tiếp: {error_detail}")
-                    print("Thử sử dụng thư viện ffmpeg-python...")
-                    try:
-                        # Đường dẫn tuyệt đối
-                        file_path_abs = os.path.abspath(file_path)
-                        temp_path_abs = os.path.abspath(temp_path)
-                        # Sử dụng ffmpeg-python thay vì gọi subprocess
-                        import ffmpeg
-                        stream = ffmpeg.input(file_path_abs)
-                        stream = ffmpeg.output(stream, temp_path_abs, acodec='pcm_s16le', y=None)
-                        ffmpeg.run(stream, capture_stdout=True, capture_stderr=True)
-                        ffmpeg_found = True
-                        print(f"Đã chuyển đổi file bằng ffmpeg-python thành công")
-                    except Exception as e:
-                        print(f"Lỗi khi sử dụng ffmpeg-python: {str(e)}")
-                        raise ValueError(f"Không thể sử dụng ffmpeg: {error_detail} | ffmpeg-python: {str(e)}")
-                
-                # Kiểm tra file đã tạo
-                if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
-                    raise ValueError("Không thể convert file với ffmpeg")
-            except Exception as e2:
-                print(f"Không thể convert file bằng ffmpeg: {str(e2)}")
-                return False, f"Không thể convert file: {str(e1)} | {str(e2)}"
+            logger.error("Không thể giải mã file: %s", e1)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False, f"Không thể convert file: {str(e1)}"
         
         # Kiểm tra file đã convert
         try:
-            sf.read(temp_path)
+            sf.info(temp_path)
             # Convert thành công, thay thế file cũ
             os.replace(temp_path, file_path)
-            print(f"Đã convert thành công file: {file_path}")
+            logger.info("Đã convert thành công file: %s", file_path)
             return True, None
         except Exception as e3:
-            print(f"File đã convert vẫn không đọc được: {str(e3)}")
+            logger.error("File đã convert vẫn không đọc được: %s", e3)
             # Xóa file tạm
             if os.path.exists(temp_path):
                 os.remove(temp_path)
             return False, f"Không thể tạo file audio hợp lệ: {str(e3)}"
             
     except Exception as e:
-        print(f"Lỗi khi xử lý file: {str(e)}")
+        logger.error("Lỗi khi xử lý file: %s", e)
         return False, f"Lỗi khi xử lý file: {str(e)}" 
 
 # Các hàm xử lý âm thanh nâng cao
-def denoise_audio(audio_data, sr, reduction_factor=0.15):
+def denoise_audio(audio_data, sr, reduction_factor=0.15, noise_profile=None):
     """
     Giảm nhiễu cực kỳ nhẹ để giữ đặc tính giọng nói tự nhiên
     Chỉ giảm nhiễu ở những vùng có biên độ thấp, không ảnh hưởng đến âm thanh chính
+    - noise_profile: nếu có, dùng mô hình nhiễu của profile thay vì ước tính lại cho từng clip
     """
     try:
         # Nếu reduction_factor quá nhỏ, không cần xử lý
         if reduction_factor < 0.05:
             return audio_data
         
+        if noise_profile is not None:
+            return denoise_audio_batch([audio_data], sr, noise_profile, reduction_factor=reduction_factor)[0]
+        
         # Giới hạn mức độ giảm nhiễu để đảm bảo âm thanh không bị méo
         reduction_factor = min(reduction_factor, 0.2)
             
@@ -787,14 +879,14 @@ def denoise_audio(audio_data, sr, reduction_factor=0.15):
         
         return final_audio
     except Exception as e:
-        print(f"Lỗi khi xử lý giảm nhiễu: {e}")
+        logger.error("Lỗi khi xử lý giảm nhiễu: %s", e)
         return audio_data  # Trả về dữ liệu gốc nếu có lỗi
 
 def normalize_audio(audio_data, target_db=-20):
     """
     Chuẩn hóa âm lượng của file âm thanh
     """
-    print("Đang chuẩn hóa âm lượng...")
+    logger.debug("Đang chuẩn hóa âm lượng...")
     try:
         # Tránh chia cho 0
         if np.all(audio_data == 0):
@@ -814,14 +906,14 @@ def normalize_audio(audio_data, target_db=-20):
         
         return normalized_audio
     except Exception as e:
-        print(f"Lỗi khi chuẩn hóa âm lượng: {e}")
+        logger.error("Lỗi khi chuẩn hóa âm lượng: %s", e)
         return audio_data  # Trả về dữ liệu gốc nếu có lỗi
 
 def apply_compression(audio_data, threshold=-20, ratio=4, attack=0.005, release=0.15):
     """
     Áp dụng dynamic range compression để làm tín hiệu âm thanh đồng đều hơn
     """
-    print("Đang áp dụng compression...")
+    logger.debug("Đang áp dụng compression...")
     try:
         # Chuyển đổi threshold từ dB sang tuyến tính
         threshold_linear = 10 ** (threshold / 20)
@@ -842,7 +934,7 @@ def apply_compression(audio_data, threshold=-20, ratio=4, attack=0.005, release=
         
         return compressed_audio
     except Exception as e:
-        print(f"Lỗi khi áp dụng compression: {e}")
+        logger.error("Lỗi khi áp dụng compression: %s", e)
         return audio_data  # Trả về dữ liệu gốc nếu có lỗi
 
 def match_target_amplitude(audio_data, target_dBFS=-20):
@@ -862,9 +954,10 @@ def match_target_amplitude(audio_data, target_dBFS=-20):
         # Áp dụng gain
         return audio_data * gain
     except Exception as e:
-        print(f"Lỗi khi điều chỉnh biên độ: {e}")
+        logger.error("Lỗi khi điều chỉnh biên độ: %s", e)
         return audio_data
 
+@traced()
 def smooth_audio_transitions(audio1, audio2, sr, crossfade_duration=0.05):
     """
     Tạo chuyển tiếp mượt mà giữa hai đoạn audio với nhiều cải tiến.
@@ -922,7 +1015,7 @@ def smooth_audio_transitions(audio1, audio2, sr, crossfade_duration=0.05):
         else:
             # audio2 to hơn audio1
             normalized_audio1 = audio1.copy()
-            normalized_audio1[-crossfade_samples:] *= min(1.5, 1/energy_ratio * 0.8)
+            normalized_audio1[-crossfade_samples:] *= min(1.5, 1/max(energy_ratio, 1e-10) * 0.8)
             audio1 = normalized_audio1
     
     # Tìm điểm chuyển tiếp tối ưu bằng tương quan chéo
@@ -957,17 +1050,17 @@ def smooth_audio_transitions(audio1, audio2, sr, crossfade_duration=0.05):
         if best_shift < 0:
             # Cắt bớt audio1, thêm khoảng trống vào audio2
             audio1 = audio1[:len(audio1)+best_shift]
-            audio2 = np.concatenate([np.zeros(-best_shift), audio2])
+            audio2 = np.concatenate([np.zeros(-best_shift, dtype=audio2.dtype), audio2])
         else:
             # Cắt bớt audio2, thêm khoảng trống vào audio1
-            audio1 = np.concatenate([audio1, np.zeros(best_shift)])
+            audio1 = np.concatenate([audio1, np.zeros(best_shift, dtype=audio1.dtype)])
             audio2 = audio2[best_shift:]
         
         # Tính lại crossfade_samples
         crossfade_samples = min(crossfade_samples, len(audio1), len(audio2))
     
     # Tạo cửa sổ crossfade mượt mà với cửa sổ Hanning
-    fade_window = np.hanning(crossfade_samples * 2)[crossfade_samples:]
+    fade_window = np.hanning(crossfade_samples * 2)[crossfade_samples:].astype(audio1.dtype)
     # Cửa sổ cho audio1 (fade out)
     fade_out = fade_window[::-1]  # đảo ngược cửa sổ để tạo fade out
     # Cửa sổ cho audio2 (fade in)
@@ -1005,7 +1098,7 @@ def enhance_voice(audio_data, sr):
     - Tăng cường dải tần của giọng nói (thường 250Hz-3.5kHz)
     - Giảm các tần số cao gây chói tai
     """
-    print("Đang cải thiện chất lượng giọng nói...")
+    logger.debug("Đang cải thiện chất lượng giọng nói...")
     try:
         # Áp dụng bộ lọc EQ để tăng cường giọng nói
         # Tạo bộ lọc band-pass cho vùng giọng nói
@@ -1024,91 +1117,151 @@ def enhance_voice(audio_data, sr):
         
         return enhanced
     except Exception as e:
-        print(f"Lỗi khi cải thiện giọng nói: {e}")
+        logger.error("Lỗi khi cải thiện giọng nói: %s", e)
         return audio_data  # Trả về dữ liệu gốc nếu có lỗi
 
-def process_audio_for_vocabulary(audio_path, output_path=None):
+def trim_vocabulary_audio(y, sr):
+    """
+    Cắt khoảng lặng cực kỳ chặt chẽ đầu/cuối cho audio từ vựng
+    Trả về (audio đã cắt, True) hoặc (audio gốc, False) nếu không tìm thấy khoảng không lặng
+    """
+    # Cắt khoảng lặng đầu và cuối file với tham số hỗ trợ phát hiện tốt hơn
+    # Tăng top_db để nhạy hơn với âm thanh yếu và giảm hop_length để phân tích chi tiết hơn
+    intervals = librosa.effects.split(y, top_db=33, hop_length=64)
+    
+    if len(intervals) == 0:
+        return y, False
+    
+    # Lấy phần không lặng đầu tiên và cuối cùng 
+    first_start, first_end = intervals[0]
+    last_start, last_end = intervals[-1]
+    
+    # Thêm padding ngắn hơn để đảm bảo âm thanh không bị cắt mất
+    pad = int(0.012 * sr)  # Chỉ 12ms padding, ngắn hơn 30ms trước đây
+    
+    # Phân tích chi tiết hơn để xác định điểm bắt đầu/kết thúc thực sự của từ
+    # bằng cách phân tích 10% đầu/cuối để tìm điểm bắt đầu/kết thúc thực sự
+    
+    # Phân tích chi tiết điểm bắt đầu
+    start_region = y[first_start:first_start + int((first_end-first_start)*0.1)]
+    if len(start_region) > 0:
+        # Tính RMS của từng khung thời gian nhỏ (2ms)
+        frame_length = int(0.002 * sr)
+        if frame_length > 0:
+            start_rms = librosa.feature.rms(y=start_region, frame_length=frame_length, hop_length=frame_length)[0]
+            # Tìm điểm bắt đầu âm thanh thực sự (khi RMS vượt qua 10% giá trị lớn nhất)
+            threshold = 0.1 * np.max(start_rms)
+            actual_start_frames = np.where(start_rms > threshold)[0]
+            if len(actual_start_frames) > 0:
+                actual_start = first_start + actual_start_frames[0] * frame_length
+                # Chỉ dùng actual_start nếu nó sớm hơn first_start + 5ms
+                if actual_start < first_start + int(0.005 * sr):
+                    first_start = max(0, actual_start - pad//2)  # giảm pad thêm một nửa
+    
+    # Phân tích chi tiết điểm kết thúc
+    end_region = y[last_end - int((last_end-last_start)*0.1):last_end]
+    if len(end_region) > 0:
+        frame_length = int(0.002 * sr)
+        if frame_length > 0:
+            end_rms = librosa.feature.rms(y=end_region, frame_length=frame_length, hop_length=frame_length)[0]
+            # Tìm điểm kết thúc âm thanh thực sự (khi RMS giảm xuống dưới 10% giá trị lớn nhất)
+            threshold = 0.1 * np.max(end_rms)
+            actual_end_frames = np.where(end_rms > threshold)[0]
+            if len(actual_end_frames) > 0:
+                relative_end = actual_end_frames[-1] * frame_length
+                actual_end = (last_end - len(end_region)) + relative_end
+                # Chỉ dùng actual_end nếu nó muộn hơn last_end - 5ms
+                if actual_end > last_end - int(0.005 * sr):
+                    last_end = min(len(y), actual_end + pad//2)  # giảm pad thêm một nửa
+    
+    # Áp dụng fade in/out nhẹ để tránh click
+    y_trimmed = y[max(0, first_start - pad):min(len(y), last_end + pad)]
+    
+    # Áp dụng fade in và fade out nhẹ (8ms)
+    fade_samples = min(int(0.008 * sr), len(y_trimmed) // 4)
+    if fade_samples > 0:
+        fade_in = np.linspace(0, 1, fade_samples)
+        fade_out = np.linspace(1, 0, fade_samples)
+        
+        # Áp dụng fade
+        y_trimmed[:fade_samples] *= fade_in
+        y_trimmed[-fade_samples:] *= fade_out
+    
+    return y_trimmed, True
+
+@traced()
+def process_audio_for_vocabulary(audio_path, output_path=None, noise_profile=None):
     """
     Xử lý file âm thanh từ vựng, cắt khoảng lặng cực kỳ chặt chẽ đầu/cuối 
     và tạo smooth transitions cho phần ghép nối từ
+    - noise_profile: mô hình nhiễu của profile (nếu có) để giảm nhiễu đồng nhất giữa các từ
     """
     try:
         # Đọc file âm thanh
-        y, sr = librosa.load(audio_path, sr=None)
+        with stage("decode"):
+            y, sr = decode_audio(audio_path)
         
-        # Cắt khoảng lặng đầu và cuối file với tham số hỗ trợ phát hiện tốt hơn
-        # Tăng top_db để nhạy hơn với âm thanh yếu và giảm hop_length để phân tích chi tiết hơn
-        intervals = librosa.effects.split(y, top_db=33, hop_length=64)
+        with stage("trim"):
+            y_trimmed, found = trim_vocabulary_audio(y, sr)
         
-        if len(intervals) > 0:
-            # Lấy phần không lặng đầu tiên và cuối cùng 
-            first_start, first_end = intervals[0]
-            last_start, last_end = intervals[-1]
-            
-            # Thêm padding ngắn hơn để đảm bảo âm thanh không bị cắt mất
-            pad = int(0.012 * sr)  # Chỉ 12ms padding, ngắn hơn 30ms trước đây
-            
-            # Phân tích chi tiết hơn để xác định điểm bắt đầu/kết thúc thực sự của từ
-            # bằng cách phân tích 10% đầu/cuối để tìm điểm bắt đầu/kết thúc thực sự
-            
-            # Phân tích chi tiết điểm bắt đầu
-            start_region = y[first_start:first_start + int((first_end-first_start)*0.1)]
-            if len(start_region) > 0:
-                # Tính RMS của từng khung thời gian nhỏ (2ms)
-                frame_length = int(0.002 * sr)
-                if frame_length > 0:
-                    start_rms = librosa.feature.rms(y=start_region, frame_length=frame_length, hop_length=frame_length)[0]
-                    # Tìm điểm bắt đầu âm thanh thực sự (khi RMS vượt qua 10% giá trị lớn nhất)
-                    threshold = 0.1 * np.max(start_rms)
-                    actual_start_frames = np.where(start_rms > threshold)[0]
-                    if len(actual_start_frames) > 0:
-                        actual_start = first_start + actual_start_frames[0] * frame_length
-                        # Chỉ dùng actual_start nếu nó sớm hơn first_start + 5ms
-                        if actual_start < first_start + int(0.005 * sr):
-                            first_start = max(0, actual_start - pad//2)  # giảm pad thêm một nửa
-            
-            # Phân tích chi tiết điểm kết thúc
-            end_region = y[last_end - int((last_end-last_start)*0.1):last_end]
-            if len(end_region) > 0:
-                frame_length = int(0.002 * sr)
-                if frame_length > 0:
-                    end_rms = librosa.feature.rms(y=end_region, frame_length=frame_length, hop_length=frame_length)[0]
-                    # Tìm điểm kết thúc âm thanh thực sự (khi RMS giảm xuống dưới 10% giá trị lớn nhất)
-                    threshold = 0.1 * np.max(end_rms)
-                    actual_end_frames = np.where(end_rms > threshold)[0]
-                    if len(actual_end_frames) > 0:
-                        relative_end = actual_end_frames[-1] * frame_length
-                        actual_end = (last_end - len(end_region)) + relative_end
-                        # Chỉ dùng actual_end nếu nó muộn hơn last_end - 5ms
-                        if actual_end > last_end - int(0.005 * sr):
-                            last_end = min(len(y), actual_end + pad//2)  # giảm pad thêm một nửa
-            
-            # Áp dụng fade in/out nhẹ để tránh click
-            y_trimmed = y[max(0, first_start - pad):min(len(y), last_end + pad)]
-            
-            # Áp dụng fade in và fade out nhẹ (8ms)
-            fade_samples = min(int(0.008 * sr), len(y_trimmed) // 4)
-            if fade_samples > 0:
-                fade_in = np.linspace(0, 1, fade_samples)
-                fade_out = np.linspace(1, 0, fade_samples)
-                
-                # Áp dụng fade
-                y_trimmed[:fade_samples] *= fade_in
-                y_trimmed[-fade_samples:] *= fade_out
-            
+        if found:
             # Chỉ áp dụng khử nhiễu rất nhẹ để đảm bảo giữ được chất lượng âm thanh gốc
-            y_trimmed = denoise_audio(y_trimmed, sr, reduction_factor=0.15)
-            
-            if output_path:
-                sf.write(output_path, y_trimmed, sr)
-            
-            return y_trimmed, sr
-        else:
-            # Nếu không tìm thấy khoảng không lặng, giữ nguyên file gốc
-            if output_path:
-                sf.write(output_path, y, sr)
-            return y, sr
+            with stage("denoise"):
+                y_trimmed = denoise_audio(y_trimmed, sr, reduction_factor=0.15, noise_profile=noise_profile)
+        
+        # Nếu không tìm thấy khoảng không lặng, giữ nguyên file gốc
+        if output_path:
+            sf.write(output_path, y_trimmed, sr)
+        
+        return y_trimmed, sr
     except Exception as e:
-        print(f"Lỗi khi xử lý file âm thanh {audio_path}: {e}")
+        logger.error("Lỗi khi xử lý file âm thanh %s: %s", audio_path, e)
         # Trả về None để xử lý lỗi bên ngoài
-        return None, None 
\ No newline at end of file
+        return None, None
+
+def reprocess_vocabulary_batch(audio_paths, profile_dir, rebuild_noise_profile=True):
+    """
+    Xử lý lại nhiều file âm thanh từ vựng của cùng một profile:
+    - Tính lại mô hình nhiễu từ toàn bộ bản ghi âm của profile (nếu rebuild_noise_profile)
+    - Cắt khoảng lặng từng file, sau đó giảm nhiễu tất cả trong một lần xử lý theo lô
+    - Ghi đè kết quả vào file gốc với định dạng chuẩn của profile
+    Trả về dict {audio_path: (thành công, thông báo)}
+    """
+    results = {}
+    loaded = []
+    # Mọi clip được đọc về sample rate chuẩn của profile nên xử lý chung một lô
+    sr = ensure_profile_format(profile_dir)["sample_rate"]
+    for audio_path in audio_paths:
+        try:
+            y, _ = decode_audio(audio_path, target_sr=sr)
+            loaded.append((audio_path, y))
+        except Exception as e:
+            results[audio_path] = (False, f"Không thể đọc file: {str(e)}")
+    
+    if not loaded:
+        return results
+    
+    if rebuild_noise_profile:
+        noise_profile = build_noise_profile(profile_dir, [y for _, y in loaded], sr)
+    else:
+        noise_profile = load_noise_profile(profile_dir)
+    
+    trimmed = []
+    for audio_path, y in loaded:
+        y_trimmed, found = trim_vocabulary_audio(y, sr)
+        trimmed.append((audio_path, y_trimmed, found))
+    
+    to_denoise = [y_trimmed for _, y_trimmed, found in trimmed if found]
+    if noise_profile is not None:
+        denoised = iter(denoise_audio_batch(to_denoise, sr, noise_profile, reduction_factor=0.15))
+    else:
+        denoised = iter([denoise_audio(y_trimmed, sr, reduction_factor=0.15) for y_trimmed in to_denoise])
+    
+    for audio_path, y_trimmed, found in trimmed:
+        try:
+            sf.write(audio_path, next(denoised) if found else y_trimmed, sr, subtype=CANONICAL_SUBTYPE)
+            results[audio_path] = (True, None)
+        except Exception as e:
+            results[audio_path] = (False, f"Không thể ghi file: {str(e)}")
+    
+    return results
@@ -1,11 +1,34 @@
 from fastapi import FastAPI, Depends
-from app.routers import base, file_upload, users, config
+from app.utils.logger import setup_logging, shutdown_logging
+
+# Cấu hình logging trước khi import các module khác để log lúc khởi tạo cũng đi qua hàng đợi
+setup_logging()
+
+from app.routers import base, file_upload, users, config, admin
 # Khôi phục import tts_facebook
 from app.routers import tts_facebook, voice_library
 from fastapi.middleware.cors import CORSMiddleware
 from app.database.init_db import init_db
+from app.config import settings
+from app.database.credit_ledger import start_ledger_flusher, stop_ledger_flusher
+from app.database.audio_decoder import resolve_ffmpeg, shutdown_decoder
+from app.database.output_store import start_output_janitor, stop_output_janitor
+from app.database.model_registry import model_registry_stats, start_model_reaper, stop_model_reaper
+from app.database.clip_store import clip_store_stats, start_clip_store, stop_clip_store
+from app.database.usage_stats import pending_usage_keys, start_usage_flusher, stop_usage_flusher
+from app.database.cache_warmup import start_warmup, stop_warmup, wait_for_warmup
 from app.database.connection import get_db
+from app.database.credit_ledger import pending_ledger_entries
+from app.database.audio_decoder import pending_ffmpeg_jobs
+from app.database.phrase_cache import phrase_cache_stats
+from app.database.vocabulary_index import cached_vocabulary_profiles
+from app.utils.single_flight import single_flight_stats
+from app.utils.text_normalizer import normalizer_cache_info
+from app.utils.metrics import describe, register_collector, render_metrics, set_gauge, metrics_middleware
+from app.utils.tracing import start_trace_writer, stop_trace_writer, tracing_middleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
+import anyio
 
 
 # Tạo instance của FastAPI
@@ -20,11 +43,95 @@ app.add_middleware(
     allow_headers=["*"],  # Cho phép tất cả headers
 )
 
+# Đếm request và đo thời gian theo route cho /metrics
+app.middleware("http")(metrics_middleware)
+# Trace từng request khi bật TRACING_ENABLED (header Server-Timing, file TRACE_SINK_PATH)
+app.middleware("http")(tracing_middleware)
+
+# Số liệu tức thời đọc lúc scrape: hàng đợi, cache, mức sử dụng threadpool
+describe("tts_coalescing_requests_total", "counter", "Số request đi qua lớp gộp request trùng nhau theo kết quả")
+describe("tts_coalescing_inflight", "gauge", "Số lần tổng hợp đang chạy trong lớp gộp request")
+describe("tts_phrase_cache_bytes", "gauge", "Dung lượng cache cụm từ ghép sẵn")
+describe("tts_phrase_cache_entries", "gauge", "Số cụm từ trong cache")
+describe("tts_vocabulary_index_profiles", "gauge", "Số profile đang có chỉ mục từ vựng trong bộ nhớ")
+describe("tts_text_normalizer_cache_total", "counter", "Số lần tra cache chuẩn hóa văn bản theo kết quả")
+describe("tts_ledger_pending_entries", "gauge", "Số bản ghi sổ cái credits chờ ghi xuống database")
+describe("tts_ffmpeg_pending_jobs", "gauge", "Số lần giải mã ffmpeg đang chạy hoặc chờ")
+describe("tts_model_loaded", "gauge", "Model đã được tải trong worker (1) hay chưa (0)")
+describe("tts_model_parameter_bytes", "gauge", "Dung lượng tham số của model đã tải")
+describe("tts_clip_store_attached_bytes", "gauge", "Dung lượng segment clip dùng chung worker đang mmap")
+describe("tts_clip_store_leader", "gauge", "Worker đang quản lý kho clip dùng chung (1) hay không (0)")
+describe("tts_usage_pending_keys", "gauge", "Số khóa thống kê sử dụng chờ ghi xuống database")
+describe("tts_threadpool_busy_threads", "gauge", "Số thread đang bận trong threadpool của worker")
+describe("tts_threadpool_max_threads", "gauge", "Số thread tối đa của threadpool")
+
+def runtime_samples():
+    coalescing = single_flight_stats()
+    yield "tts_coalescing_requests_total", {"result": "executed"}, coalescing["executions"]
+    yield "tts_coalescing_requests_total", {"result": "coalesced"}, coalescing["coalesced"]
+    yield "tts_coalescing_requests_total", {"result": "error"}, coalescing["errors"]
+    yield "tts_coalescing_inflight", {}, coalescing["inflight"]
+    phrases = phrase_cache_stats()
+    yield "tts_phrase_cache_bytes", {}, phrases["bytes"]
+    yield "tts_phrase_cache_entries", {}, phrases["entries"]
+    yield "tts_vocabulary_index_profiles", {}, cached_vocabulary_profiles()
+    normalizer = normalizer_cache_info()
+    yield "tts_text_normalizer_cache_total", {"result": "hit"}, normalizer.hits
+    yield "tts_text_normalizer_cache_total", {"result": "miss"}, normalizer.misses
+    yield "tts_ledger_pending_entries", {}, pending_ledger_entries()
+    yield "tts_ffmpeg_pending_jobs", {}, pending_ffmpeg_jobs()
+    yield "tts_usage_pending_keys", {}, pending_usage_keys()
+    clip_store = clip_store_stats()
+    yield "tts_clip_store_attached_bytes", {}, clip_store["attached_bytes"]
+    yield "tts_clip_store_leader", {}, int(clip_store["leader"])
+    for model in model_registry_stats():
+        yield "tts_model_loaded", {"model": model["model_id"]}, int(model["loaded"])
+        if model["parameter_bytes"] is not None:
+            yield "tts_model_parameter_bytes", {"model": model["model_id"]}, model["parameter_bytes"]
+
+register_collector(runtime_samples)
+
 # Khởi tạo database khi ứng dụng khởi động
 @app.on_event("startup")
 async def startup_event():
+    # Khởi động lại thread ghi log nếu ứng dụng được khởi động lại sau shutdown (vd: trong test)
+    setup_logging()
     # Tạo các bảng nếu chưa tồn tại
-    init_db()
+    if settings.INIT_DB_ON_STARTUP:
+        init_db()
+    # Thread nền ghi sổ cái credits theo lô
+    start_ledger_flusher()
+    # Tìm ffmpeg một lần thay vì dò đường dẫn ở mỗi lần convert
+    resolve_ffmpeg()
+    # Thread nền xóa file kết quả hết hạn trong thư mục tạm
+    start_output_janitor()
+    # Thread nền giải phóng model lâu không dùng (MODEL_IDLE_UNLOAD_SECONDS > 0)
+    start_model_reaper()
+    # Kho clip đã xử lý dùng chung giữa các worker (một worker giữ file lock tạo/giải phóng segment)
+    start_clip_store()
+    # Thread nền cộng dồn thống kê sử dụng xuống database
+    start_usage_flusher()
+    # Thread nền ghi trace ra TRACE_SINK_PATH
+    start_trace_writer()
+    # Làm nóng cache theo thống kê, chỉ chờ tối đa WARMUP_READY_BUDGET_SECONDS rồi để chạy tiếp ở nền
+    start_warmup()
+    await anyio.to_thread.run_sync(wait_for_warmup, settings.WARMUP_READY_BUDGET_SECONDS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ghi nốt các bản ghi sổ cái còn trong bộ đệm
+    stop_ledger_flusher()
+    shutdown_decoder()
+    stop_output_janitor()
+    stop_model_reaper()
+    stop_clip_store()
+    stop_warmup()
+    # Ghi nốt thống kê sử dụng còn trong bộ đệm
+    stop_usage_flusher()
+    # Ghi nốt các trace còn trong bộ đệm
+    stop_trace_writer()
+    # Ghi nốt các bản ghi log còn trong hàng đợi
+    shutdown_logging()
 
 # Include các router vào ứng dụng chính
 # app.include_router(base.router)
@@ -35,6 +142,7 @@ app.include_router(users.router)
 app.include_router(tts_facebook.router)
 app.include_router(config.router)
 app.include_router(voice_library.router)
+app.include_router(admin.router)
 
 
 # @app.route("/favicon.ico")
@@ -45,3 +153,22 @@ app.include_router(voice_library.router)
 @app.get("/")
 def read_root():
     return {"message": "Welcome to my FastAPI application"}
+
+# Số liệu vận hành theo định dạng Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Threadpool của anyio chỉ đọc được trong event loop nên cập nhật ở đây thay vì trong collector
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    set_gauge("tts_threadpool_busy_threads", limiter.borrowed_tokens)
+    set_gauge("tts_threadpool_max_threads", limiter.total_tokens)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Thống kê gộp request trùng nhau (số request, số lần tổng hợp thực sự, số request dùng lại kết quả)
+@app.get("/stats/coalescing")
+def coalescing_stats():
+    return single_flight_stats()
+
+# Thống kê cache cụm từ ghép sẵn của voice library
+@app.get("/stats/phrase-cache")
+def phrase_stats():
+    return phrase_cache_stats()
@@ -0,0 +1,50 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+# Đổi mức log lúc đang chạy
+class LogLevelUpdate(BaseModel):
+    # Tên logger, vd "app" hoặc "app.database.voice_service"
+    logger: str = "app"
+    # DEBUG/INFO/WARNING/ERROR/CRITICAL, để trống để dùng lại mức của logger cha
+    level: Optional[str] = None
+
+class LogSamplingUpdate(BaseModel):
+    # Tỉ lệ giữ lại bản ghi DEBUG (0..1)
+    debug_sample_rate: float = Field(..., ge=0.0, le=1.0)
+
+class LoggingStatus(BaseModel):
+    levels: Dict[str, str]
+    debug_sample_rate: float
+    # Số bản ghi bị bỏ do hàng đợi log đầy
+    dropped: int
+
+# Model đang được registry quản lý trong worker
+class LoadedModel(BaseModel):
+    model_id: str
+    loaded: bool
+    # Số request đang dùng model (model chỉ được giải phóng khi bằng 0)
+    refs: int
+    idle_seconds: Optional[float] = None
+    loaded_at: Optional[float] = None
+    load_seconds: Optional[float] = None
+    # Tổng kích thước tham số và buffer của model (cần torch)
+    parameter_bytes: Optional[int] = None
+    # RSS của worker tăng thêm khi tải model
+    rss_delta_bytes: Optional[int] = None
+    error: Optional[str] = None
+
+class ModelRegistryStatus(BaseModel):
+    # Số giây không dùng trước khi model bị giải phóng (0 = không tự giải phóng)
+    idle_unload_seconds: float
+    models: List[LoadedModel]
+
+# Thống kê sử dụng và kết quả làm nóng cache lần gần nhất của worker
+class ProfileUsage(BaseModel):
+    voice_profile_id: int
+    user_id: int
+    count: int
+
+class UsageStatus(BaseModel):
+    profiles: List[ProfileUsage]
+    # state (idle/running/done), profiles, phrases, errors, seconds
+    warmup: Dict[str, object]
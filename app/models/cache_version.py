@@ -0,0 +1,9 @@
+from sqlalchemy import Column, String, BigInteger
+from app.database.connection import Base
+
+# Bộ đếm phiên bản dùng để báo cho các worker khác biết cache đã cũ
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
@@ -31,6 +31,8 @@ class ConfigUpdate(ConfigBase):
 
 class ConfigResponse(ConfigBase):
     id: int
+    # Đường dẫn tải logo dạng nhị phân (có thể cache lâu dài ở client)
+    logo_url: Optional[str] = None
 
     class Config:
         orm_mode = True 
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime
+from sqlalchemy.sql import func
+from app.database.connection import Base
+
+# Sổ cái ghi nhận biến động credits (chỉ thêm, không sửa/xóa)
+class CreditLedger(Base):
+    __tablename__ = "credit_ledger"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id = Column(Integer, index=True, nullable=False)
+    # Số credits thay đổi: dương là nạp, âm là trừ
+    amount = Column(BigInteger, nullable=False)
+    # Lý do: topup, deduct, tts_characters, tts_audio_seconds, refund
+    reason = Column(String(50), nullable=False)
+    route = Column(String(100), nullable=True)
+    # Số đơn vị tính phí (số ký tự hoặc số giây âm thanh)
+    units = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -3,3 +3,8 @@ from typing import Optional
 
 class TTSRequest(BaseModel):
     text: str
+    # Các trường dưới chỉ dùng cho router /tts: mien-nam (MMS-TTS) hoặc mien-bac (VietTTS)
+    model_type: str = "mien-nam"
+    # Giọng đọc của VietTTS (mặc định "cdteam")
+    voice: Optional[str] = None
+    speed: float = 1.0
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from app.database.connection import Base
+
+# Số lần dùng theo profile, từ vựng và cụm từ ghép sẵn (cộng dồn theo lô từ mọi worker), dùng để làm nóng cache khi khởi động
+class UsageStat(Base):
+    __tablename__ = "usage_stats"
+
+    voice_profile_id = Column(Integer, primary_key=True)
+    # profile (số câu đã ghép), word (mục từ vựng), phrase (cụm từ ghép sẵn, các mục cách nhau bởi "|")
+    kind = Column(String(10), primary_key=True)
+    # Rỗng với kind="profile". So sánh nhị phân trên MySQL: collation mặc định của utf8mb4 bỏ qua dấu
+    # nên "má", "mà" và "ma" sẽ trùng khóa chính
+    entry = Column(
+        String(191).with_variant(String(191, collation="utf8mb4_bin"), "mysql", "mariadb"),
+        primary_key=True,
+        default="",
+    )
+    count = Column(BigInteger, nullable=False, default=0)
+    last_used = Column(DateTime(timezone=True), nullable=True)
@@ -8,7 +8,7 @@ class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    username = Column(String(50), nullable=False)
+    username = Column(String(50), nullable=False, index=True)
     password = Column(String(255), nullable=False)
     email = Column(String(100), unique=True, nullable=False)
     credits = Column(BigInteger, default=0)
@@ -47,6 +47,19 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+# Thông tin user đã xác thực (lấy từ token, không gắn với session database)
+class CurrentUser(BaseModel):
+    id: int
+    username: str
+    email: str
+    usertype: str
+    active: bool
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 class ChangeStatusRequest(BaseModel):
     active: bool
 
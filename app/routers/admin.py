@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.database.auth import require_admin
+from app.database.cache_warmup import warmup_summary
+from app.database.connection import get_db
+from app.database.usage_stats import flush_usage, top_profiles
+from app.database.model_registry import MODEL_IDLE_UNLOAD_SECONDS, model_registry_stats, unload_model
+from app.models.admin import LoggingStatus, LogLevelUpdate, LogSamplingUpdate, ModelRegistryStatus, UsageStatus
+from app.utils.logger import get_log_levels, set_debug_sample_rate, set_log_level
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+# API xem mức log hiện tại
+@router.get("/logging", response_model=LoggingStatus)
+def get_logging():
+    """
+    API trả về mức log của logger "app" và các module đã đặt mức riêng,
+    tỉ lệ lấy mẫu bản ghi DEBUG và số bản ghi bị bỏ do hàng đợi đầy
+    """
+    return get_log_levels()
+
+# API đổi mức log của một module
+@router.put("/logging/level", response_model=LoggingStatus)
+def update_log_level(request: LogLevelUpdate):
+    """
+    API đổi mức log lúc đang chạy, không cần khởi động lại worker
+    - `level` để trống: module dùng lại mức của logger cha
+    - Chỉ áp dụng cho worker nhận request (mỗi worker có cấu hình log riêng)
+    """
+    try:
+        set_log_level(request.logger, request.level)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return get_log_levels()
+
+# API đổi tỉ lệ lấy mẫu bản ghi DEBUG
+@router.put("/logging/sampling", response_model=LoggingStatus)
+def update_log_sampling(request: LogSamplingUpdate):
+    set_debug_sample_rate(request.debug_sample_rate)
+    return get_log_levels()
+
+# API xem các model đang được tải trong worker
+@router.get("/models", response_model=ModelRegistryStatus)
+def get_models():
+    """
+    API trả về các model trong registry của worker nhận request: đã tải hay chưa, số request đang dùng,
+    thời gian không dùng, thời gian tải và dung lượng bộ nhớ
+    """
+    return {"idle_unload_seconds": MODEL_IDLE_UNLOAD_SECONDS, "models": model_registry_stats()}
+
+# API giải phóng một model (lần dùng sau sẽ tải lại, kể cả khi lần tải trước bị lỗi)
+@router.delete("/models/{model_id:path}", response_model=ModelRegistryStatus)
+def delete_model(model_id: str):
+    try:
+        unloaded = unload_model(model_id)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Không có model {model_id}")
+    if not unloaded:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Model {model_id} đang được sử dụng")
+    return {"idle_unload_seconds": MODEL_IDLE_UNLOAD_SECONDS, "models": model_registry_stats()}
+
+# API xem các profile dùng nhiều nhất (thứ tự làm nóng cache khi khởi động)
+@router.get("/usage", response_model=UsageStatus)
+def get_usage(limit: int = 20, db: Session = Depends(get_db)):
+    """
+    API trả về các profile được dùng nhiều nhất theo bảng usage_stats (ghi bộ đệm của worker xuống trước)
+    và kết quả làm nóng cache lần gần nhất của worker nhận request
+    """
+    flush_usage()
+    profiles = [
+        {"voice_profile_id": profile_id, "user_id": user_id, "count": count}
+        for profile_id, user_id, count in top_profiles(db, limit)
+    ]
+    return {"profiles": profiles, "warmup": warmup_summary()}
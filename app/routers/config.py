@@ -1,27 +1,87 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from typing import Optional
 
+from app.config import settings
 from app.database.connection import get_db
 from app.models.config import ConfigResponse, ConfigUpdate
-from app.database.config_service import get_config_service, update_config_service
+from app.database.config_service import get_cached_config, update_config_service
 
 router = APIRouter(prefix="/config", tags=["config"])
 
+# Logo có tham số phiên bản (?v=) không bao giờ thay đổi nội dung
+LOGO_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
 # API Lấy cấu hình hiện tại
 @router.get("/", response_model=ConfigResponse)
-async def get_config(db: Session = Depends(get_db)):
+async def get_config(
+    request: Request,
+    include_logo: bool = True,
+    db: Session = Depends(get_db)
+):
     """
     API lấy thông tin cấu hình hệ thống
+    - `include_logo=false`: bỏ trường logo_base64, dùng `logo_url` để tải logo riêng
+    - Hỗ trợ ETag/If-None-Match, trả về 304 nếu cấu hình không đổi
+    """
+    cached = get_cached_config(db)
+    if include_logo:
+        data, etag = cached["data"], cached["etag"]
+    else:
+        data, etag = cached["data_without_logo"], cached["etag_without_logo"]
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.CONFIG_CACHE_MAX_AGE}",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=data, headers=headers)
+
+# API Lấy logo dạng nhị phân
+@router.get("/logo")
+async def get_logo(
+    request: Request,
+    v: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    return get_config_service(db)
+    API trả về logo đã giải mã từ base64, cho phép trình duyệt cache lâu dài
+    """
+    cached = get_cached_config(db)
+    if not cached["logo_bytes"]:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    etag = f'"{cached["logo_hash"]}"'
+    if v == cached["logo_hash"]:
+        cache_control = LOGO_IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f"public, max-age={settings.CONFIG_CACHE_MAX_AGE}"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=cached["logo_bytes"],
+        media_type=cached["logo_media_type"],
+        headers=headers
+    )
 
 # API Cập nhật cấu hình
 @router.put("/", response_model=ConfigResponse)
 async def update_config(
-    config_update: ConfigUpdate, 
+    config_update: ConfigUpdate,
     db: Session = Depends(get_db)
 ):
     """
     API cập nhật thông tin cấu hình hệ thống
     """
-    return update_config_service(config_update, db) 
\ No newline at end of file
+    return update_config_service(config_update, db)
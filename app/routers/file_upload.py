@@ -1,22 +1,104 @@
 from fastapi import APIRouter
-from fastapi import FastAPI, File, UploadFile, Header, HTTPException, Request, Form  # noqa: E402, F401
-from fastapi.responses import FileResponse  # noqa: E402
+from fastapi import FastAPI, File, UploadFile, Header, HTTPException, Request, Form, Response  # noqa: E402, F401
+from starlette.concurrency import run_in_threadpool
 
 from uuid import uuid4
 
 from app.models.file_upload import FileUpload
 from app.security.security import get_api_key
+from app.utils.responses import ZeroCopyFileResponse
 # from app.service.gmail import Gmail
 from app.config import settings
 # from app.models.mail import Mail
 
 
+import hashlib
 import os
-import shutil
+import re
 
 # Tạo router cho người dùng
 router = APIRouter(prefix="/upload-file", tags=["file-upload"])
 
+# Thư mục lưu file upload
+DOWNLOAD_DIR = os.path.join(settings.DIR_ROOT, "utils", "download")
+# Kích thước mỗi khối khi ghi file (1 MiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Kích thước file upload tối đa (mặc định 200 MiB)
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(200 * 1024 * 1024)))
+# Tên file được đặt theo SHA-256 của nội dung nên nội dung không bao giờ thay đổi
+CONTENT_ADDRESSED_NAME = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]{1,10})?$")
+
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    # hashlib nhả GIL với khối lớn nên chạy trong threadpool không chặn event loop
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def _finalize_upload(temp_path: str, digest: str, file_extension: str) -> str:
+    """Đổi tên file tạm theo SHA-256, bỏ file tạm nếu đã có file trùng nội dung"""
+    unique_filename = f"{digest}{file_extension}"
+    file_path = os.path.join(DOWNLOAD_DIR, unique_filename)
+    if os.path.exists(file_path):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, file_path)
+    return unique_filename
+
+
+async def _store_chunks(chunks, file_extension: str) -> str:
+    """
+    Ghi lần lượt các khối dữ liệu xuống file tạm, đồng thời tính SHA-256 và
+    kiểm tra giới hạn kích thước. Trả về tên file cuối cùng.
+    """
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    temp_path = os.path.join(DOWNLOAD_DIR, f".{uuid4()}.part")
+    hasher = hashlib.sha256()
+    total_size = 0
+    try:
+        buffer = await run_in_threadpool(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                total_size += len(chunk)
+                if total_size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File vượt quá kích thước cho phép ({MAX_UPLOAD_SIZE} bytes)"
+                    )
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+        finally:
+            await run_in_threadpool(buffer.close)
+        return await run_in_threadpool(_finalize_upload, temp_path, hasher.hexdigest(), file_extension)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+async def _iter_upload_file(file: UploadFile):
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _check_content_length(request: Request) -> None:
+    # Từ chối sớm nếu client khai báo kích thước quá lớn
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + 64 * 1024:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File vượt quá kích thước cho phép ({MAX_UPLOAD_SIZE} bytes)"
+        )
+
+
+def _safe_extension(filename: str) -> str:
+    file_extension = os.path.splitext(filename or "")[1].lower()
+    return file_extension if re.fullmatch(r"\.[a-z0-9]{1,10}", file_extension) else ""
+
 
 @router.post("/upload/", response_model=FileUpload)
 async def upload_file(
@@ -42,16 +124,11 @@ async def upload_file(
     - `download_url`: URL để tải xuống tệp.
     - `mail`: Địa chỉ email người nhận (nếu đã gửi email).
 
+    Tệp được lưu theo SHA-256 của nội dung, upload trùng nội dung sẽ dùng lại tệp đã có.
     Nếu `mail_to` được cung cấp, email sẽ được gửi đến địa chỉ đó với liên kết tải xuống tệp.
     """
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid4()}{file_extension}"
-    folder_path = os.path.join(os.path.join(settings.DIR_ROOT, "utils","download"))
-    os.makedirs(folder_path) if not os.path.exists(folder_path) else folder_path
-    file_path = os.path.join(folder_path, unique_filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    _check_content_length(request)
+    unique_filename = await _store_chunks(_iter_upload_file(file), _safe_extension(file.filename))
 
     download_url = f"{router.prefix}/download/{unique_filename}"
 
@@ -66,8 +143,27 @@ async def upload_file(
     return FileUpload(filename=file.filename, download_url=download_url, mail=mail_to)
 
 
+@router.put("/upload-stream/{filename}", response_model=FileUpload)
+async def upload_file_stream(
+    filename: str,
+    request: Request,
+    api_key: str = get_api_key,  # Khóa API để xác thực
+):
+    """
+    API upload tệp bằng body thô (không multipart), dữ liệu được ghi xuống đĩa
+    ngay khi nhận từ socket nên không cần bộ đệm tạm cho toàn bộ tệp.
+
+    Tham số:
+    - `filename`: Tên tệp gốc (dùng để lấy phần mở rộng).
+    """
+    _check_content_length(request)
+    unique_filename = await _store_chunks(request.stream(), _safe_extension(filename))
+    download_url = f"{router.prefix}/download/{unique_filename}"
+    return FileUpload(filename=filename, download_url=download_url, mail="")
+
+
 @router.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     """
     API để tải xuống tệp.
 
@@ -76,11 +172,35 @@ async def download_file(filename: str):
 
     Trả về:
     - Nếu tệp tồn tại, trả về tệp dưới dạng phản hồi tải xuống.
+    - Hỗ trợ Range/If-Range để tải tiếp, ETag/If-None-Match để trả về 304.
     - Nếu tệp không tồn tại, trả về lỗi 404 với thông báo "File not found".
     """
-    file_path = os.path.join(os.path.join(settings.DIR_ROOT, "utils","download"), filename)
-    if os.path.exists(file_path):
-        return FileResponse(
-            path=file_path, filename=filename, media_type="application/octet-stream"
-        )
-    raise HTTPException(status_code=404, detail="File not found")
\ No newline at end of file
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    file_path = os.path.join(DOWNLOAD_DIR, filename)
+    try:
+        stat_result = await run_in_threadpool(os.stat, file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if CONTENT_ADDRESSED_NAME.match(filename):
+        # Tên file chính là hash nội dung: dùng làm strong ETag và cho phép cache lâu dài
+        etag = f'"{filename.split(".")[0]}"'
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        cache_control = "public, max-age=3600"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    return ZeroCopyFileResponse(
+        path=file_path,
+        filename=filename,
+        media_type="application/octet-stream",
+        stat_result=stat_result,
+        headers=headers,
+    )
@@ -6,27 +6,30 @@ import tempfile
 import os
 import requests
 import soundfile as sf
-import torch
-from transformers import AutoTokenizer, AutoModelForTextToWaveform
 from starlette.background import BackgroundTask
+from app.database.mms_model import load_mms_model, synthesize_mms
+from app.utils.text_normalizer import normalize_text
+from app.utils.tracing import span
+from app.utils.logger import get_logger
+from app.config import settings
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/tts", tags=["text-to-speech"])
 
 # URL của VietTTS API
-VIETTTS_URL = "http://localhost:8298"
+VIETTTS_URL = settings.VIETTTS_URL
 
 # Khởi tạo model Facebook MMS-TTS
 try:
-    tokenizer_mien_nam = AutoTokenizer.from_pretrained("facebook/mms-tts-vie")
-    model_mien_nam = AutoModelForTextToWaveform.from_pretrained("facebook/mms-tts-vie")
+    load_mms_model()
     mien_nam_available = True
-except Exception as e:
-    print(f"Lỗi khi tải model miền Nam: {str(e)}")
+except RuntimeError:
     mien_nam_available = False
 
 # Kiểm tra kết nối đến VietTTS API
 try:
-    response = requests.get(f"{VIETTTS_URL}/v1/voices")
+    response = requests.get(f"{VIETTTS_URL}/v1/voices", timeout=settings.VIETTTS_TIMEOUT_SECONDS)
     if response.status_code == 200:
         viettts_available = True
         viettts_voices = response.json()
@@ -34,7 +37,7 @@ try:
         viettts_available = False
         viettts_voices = []
 except Exception as e:
-    print(f"Lỗi khi kết nối VietTTS API: {str(e)}")
+    logger.error("Lỗi khi kết nối VietTTS API: %s", e)
     viettts_available = False
     viettts_voices = []
 
@@ -64,6 +67,11 @@ async def generate_speech(
     background_tasks: BackgroundTasks
 ):
     """Tạo giọng nói từ văn bản với model được chọn mà không cần xác thực"""
+    # Chuẩn hóa số, ngày giờ, từ viết tắt trước khi gửi cho model
+    text = normalize_text(request.text)
+    if not text:
+        raise HTTPException(status_code=400, detail="Văn bản không có nội dung để đọc")
+    
     try:
         # Tạo file tạm để lưu âm thanh
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
@@ -72,11 +80,7 @@ async def generate_speech(
             # Xử lý theo model được chọn
             if request.model_type == "mien-nam" and mien_nam_available:
                 # Sử dụng model Facebook MMS-TTS (miền Nam)
-                inputs = tokenizer_mien_nam(request.text, return_tensors="pt")
-                with torch.no_grad():
-                    output = model_mien_nam(**inputs).waveform
-                audio = output.squeeze().cpu().numpy()
-                sampling_rate = model_mien_nam.config.sampling_rate
+                audio, sampling_rate = synthesize_mms(text)
                 sf.write(audio_file, audio, sampling_rate)
                 
             elif request.model_type == "mien-bac" and viettts_available:
@@ -86,27 +90,29 @@ async def generate_speech(
                 # Gọi API VietTTS
                 data = {
                     "model": "tts-1",
-                    "input": request.text,
+                    "input": text,
                     "voice": voice,
                     "speed": request.speed
                 }
                 
                 try:
                     # Debug - ghi log request
-                    print(f"Gửi request tới {VIETTTS_URL}/v1/audio/speech với data: {data}")
+                    logger.debug("Gửi request tới %s/v1/audio/speech với data: %s", VIETTTS_URL, data)
                     
-                    response = requests.post(
-                        f"{VIETTTS_URL}/v1/audio/speech",
-                        headers={
-                            "Authorization": "Bearer viet-tts",
-                            "Content-Type": "application/json"
-                        },
-                        json=data
-                    )
+                    with span("viettts_request", voice=voice):
+                        response = requests.post(
+                            f"{VIETTTS_URL}/v1/audio/speech",
+                            headers={
+                                "Authorization": "Bearer viet-tts",
+                                "Content-Type": "application/json"
+                            },
+                            json=data,
+                            timeout=settings.VIETTTS_TIMEOUT_SECONDS
+                        )
                     
                     # Debug - ghi log response status
-                    print(f"Status code: {response.status_code}")
-                    print(f"Headers: {response.headers}")
+                    logger.debug("Status code: %s", response.status_code)
+                    logger.debug("Headers: %s", response.headers)
                     
                     if response.status_code != 200:
                         raise HTTPException(
@@ -119,7 +125,7 @@ async def generate_speech(
                         f.write(response.content)
                     
                 except Exception as e:
-                    print(f"Lỗi khi gọi VietTTS API: {str(e)}")
+                    logger.error("Lỗi khi gọi VietTTS API: %s", e)
                     raise HTTPException(status_code=500, detail=f"Lỗi khi gọi VietTTS API: {str(e)}")
             else:
                 raise HTTPException(
@@ -150,7 +156,7 @@ async def generate_speech(
 async def test_viettts():
     """API test - Kiểm tra kết nối đến VietTTS API"""
     try:
-        response = requests.get(f"{VIETTTS_URL}/v1/voices")
+        response = requests.get(f"{VIETTTS_URL}/v1/voices", timeout=settings.VIETTTS_TIMEOUT_SECONDS)
         if response.status_code == 200:
             return {
                 "status": "success",
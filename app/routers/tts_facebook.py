@@ -1,72 +1,96 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-import tempfile
-import os
-import soundfile as sf
-import torch
-from transformers import AutoTokenizer, AutoModelForTextToWaveform
-from starlette.background import BackgroundTask
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
 from app.models.text_to_speech import TTSRequest
+from app.models.user import CurrentUser
+from app.database.connection import get_db
+from app.database.auth import get_current_user
+from app.database.credit_ledger import metered_synthesis
+from app.database.mms_model import MMS_MODEL_NAME, load_mms_model, synthesize_mms
+from app.utils.audio_encoder import (
+    OUTPUT_FORMATS, negotiate_output_format, encode_audio_stream, output_headers
+)
+from app.utils.single_flight import single_flight
+from app.utils.metrics import staged_iter
+from app.utils.text_normalizer import normalize_text
 
 router = APIRouter(prefix="/tts-facebook", tags=["tts-facebook"])
 
-# Khởi tạo model Facebook MMS-TTS
+# Khởi tạo model Facebook MMS-TTS (dùng chung một bản với chế độ hybrid của voice library)
 try:
-    tokenizer = AutoTokenizer.from_pretrained("facebook/mms-tts-vie")
-    model = AutoModelForTextToWaveform.from_pretrained("facebook/mms-tts-vie")
+    load_mms_model()
     model_available = True
-except Exception as e:
-    print(f"Lỗi khi tải model Facebook MMS-TTS: {str(e)}")
+except RuntimeError:
     model_available = False
 
 @router.get("/info")
 async def get_model_info():
     """Lấy thông tin về model Facebook MMS-TTS"""
     return {
-        "model": "facebook/mms-tts-vie",
+        "model": MMS_MODEL_NAME,
         "name": "Facebook MMS-TTS",
         "region": "Miền Nam",
         "available": model_available
     }
 
+def _render_speech(text: str) -> dict:
+    """Chạy model (trong threadpool, dùng chung cho các request trùng nhau; mỗi request tự mã hóa theo định dạng của mình)"""
+    audio, sampling_rate = synthesize_mms(text)
+    return {
+        "audio": audio,
+        "sample_rate": sampling_rate,
+        "duration": len(audio) / sampling_rate
+    }
+
 @router.post("/generate")
-async def generate_speech(request: TTSRequest, background_tasks: BackgroundTasks):
-    """Tạo giọng nói từ văn bản với model Facebook MMS-TTS"""
+async def generate_speech(
+    request: TTSRequest,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Tạo giọng nói từ văn bản với model Facebook MMS-TTS
+    Bắt buộc có Bearer token vì route này tính phí
+    - `format`: wav, flac, opus hoặc mp3 (nếu không có thì chọn theo header Accept, mặc định WAV)
+    """
     if not model_available:
         raise HTTPException(
             status_code=503,
             detail="Model Facebook MMS-TTS không khả dụng"
         )
+    
+    output_format = negotiate_output_format(format, accept)
+    
+    # Chuẩn hóa số, ngày giờ, từ viết tắt trước khi đưa vào model
+    text = normalize_text(request.text)
+    if not text:
+        raise HTTPException(status_code=400, detail="Văn bản không có nội dung để đọc")
+    
+    # Giữ trước phí theo số ký tự, hoàn lại nếu tạo âm thanh lỗi hoặc không đủ credits cho số giây âm thanh
+    async with metered_synthesis(db, current_user.id, request.text, "/tts-facebook/generate") as settle:
+        try:
+            # Các request cùng văn bản đến cùng lúc chỉ chạy model một lần
+            rendered = await single_flight(("tts-facebook", text), _render_speech, text)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Lỗi khi tạo âm thanh: {str(e)}")
+        await settle(rendered["duration"])
         
-    try:
-        # Tạo file tạm để lưu âm thanh
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-            audio_file = temp_file.name
-            
-            # Sử dụng model Facebook MMS-TTS
-            inputs = tokenizer(request.text, return_tensors="pt")
-            with torch.no_grad():
-                output = model(**inputs).waveform
-            
-            audio = output.squeeze().cpu().numpy()
-            sampling_rate = model.config.sampling_rate
-            sf.write(audio_file, audio, sampling_rate)
-
-        # Hàm dọn dẹp để xóa file tạm
-        def cleanup():
-            if os.path.exists(audio_file):
-                os.remove(audio_file)
-
-        # Trả về file âm thanh
-        return FileResponse(
-            audio_file,
-            media_type="audio/wav",
-            filename="speech.wav",
-            background=BackgroundTask(cleanup)
+        # Mã hóa và gửi dần từng khối; encoder được mở trước khi gửi header
+        # nên lỗi cấu hình vẫn trả mã lỗi và được hoàn credits
+        body = await run_in_threadpool(
+            staged_iter, "encode",
+            lambda: encode_audio_stream(rendered["audio"], rendered["sample_rate"], output_format),
+            "mms"
         )
     
-    except Exception as e:
-        # Xóa file tạm nếu có lỗi
-        if 'audio_file' in locals() and os.path.exists(audio_file):
-            os.remove(audio_file)
-        raise HTTPException(status_code=500, detail=f"Lỗi khi tạo âm thanh: {str(e)}")
+    return StreamingResponse(
+        body,
+        media_type=OUTPUT_FORMATS[output_format]["media_type"],
+        headers=output_headers(output_format)
+    )
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.database.connection import get_db
-from app.models.user import UserCreate, UserResponse, UserUpdate, ChangeStatusRequest, User, AddCreditsRequest, DeductCreditsRequest, ChangeUserTypeRequest, SearchUserRequest, UserLogin, ResetPasswordRequest
+from app.models.user import UserCreate, UserResponse, UserUpdate, ChangeStatusRequest, User, AddCreditsRequest, DeductCreditsRequest, ChangeUserTypeRequest, SearchUserRequest, UserLogin, ResetPasswordRequest, CurrentUser
+from app.database.auth import get_current_user
 from app.database.user_service import (
     register_user_service, login_service, get_users_service,
     get_user_by_id_service, update_user_service, delete_user_service,
@@ -30,6 +31,17 @@ async def login_for_access_token(user_login: UserLogin, db: Session = Depends(ge
     """
     return login_service(user_login.username, user_login.password, db)
 
+# API Lấy thông tin tài khoản hiện tại từ token
+@router.get("/me", response_model=UserResponse)
+async def read_current_user(
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    API lấy thông tin tài khoản đang đăng nhập (header Authorization: Bearer {token})
+    """
+    return get_user_by_id_service(current_user.id, db)
+
 # API Lấy danh sách tất cả tài khoản
 @router.get("/", response_model=List[UserResponse])
 async def read_users(
@@ -166,11 +178,21 @@ async def reset_password(
 @router.post("/search", response_model=List[UserResponse])
 async def search_users(
     search_request: SearchUserRequest,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
+    mode: str = "substring",
     db: Session = Depends(get_db)
 ):
     """
     API tìm kiếm tài khoản theo từ khóa (username hoặc email)
-    """
-    return search_users_service(search_request.keyword, skip, limit, db) 
\ No newline at end of file
+    - `mode=prefix`: tìm theo tiền tố (nhanh, dùng chỉ mục)
+    - `mode=substring`: tìm chuỗi con (dùng FULLTEXT nếu bật USER_SEARCH_FULLTEXT)
+    - `after_id`: phân trang keyset, truyền giá trị header X-Next-After-Id của trang trước
+    """
+    users = search_users_service(search_request.keyword, skip, limit, db, after_id=after_id, mode=mode)
+    if len(users) == limit and users:
+        response.headers["X-Next-After-Id"] = str(users[-1].id)
+        response.headers["Access-Control-Expose-Headers"] = "X-Next-After-Id"
+    return users 
\ No newline at end of file
@@ -1,15 +1,30 @@
 import os
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pathlib import Path
 import shutil
 import json
-from datetime import datetime
+from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
 
-from app.database.connection import get_db
+from app.database.connection import get_db, SessionLocal
+from app.database.auth import CurrentUser, require_user_access, verify_user_access
+from app.database.credit_ledger import metered_synthesis
+from app.database.audio_format import ensure_profile_format
+from app.database.vocabulary_sync import sync_profile_vocabulary
+from app.database.output_store import (
+    OutputExpiredError, retention_seconds, save_output, resolve_output
+)
+from app.utils.audio_encoder import (
+    OUTPUT_FORMATS, negotiate_output_format, encode_audio, encode_audio_stream, output_headers
+)
+from app.utils.responses import ZeroCopyFileResponse
+from app.utils.single_flight import single_flight
+from app.utils.metrics import stage, staged_iter
+from app.utils.text_normalizer import normalize_text
 from app.models.voice_library.schemas import (
     VoiceProfileCreate, VoiceProfileUpdate, VoiceProfileResponse,
     VocabularyResponse, VocabularyCreate, VocabularyDelete,
@@ -19,14 +34,23 @@ from app.models.voice_library.vocabulary import Vocabulary, VoiceProfile
 from app.database.voice_service import (
     create_voice_profile, get_voice_profiles_by_user_id, get_voice_profile_by_id,
     update_voice_profile, delete_voice_profile, add_vocabulary,
-    get_vocabularies, get_vocabulary, delete_vocabulary, text_to_speech,
-    validate_and_fix_audio_file, process_audio_for_vocabulary, count_vocabularies
+    get_vocabularies, get_vocabulary, delete_vocabulary, synthesize_speech,
+    validate_and_fix_audio_file, count_vocabularies,
+    reprocess_vocabulary_batch
 )
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 # Định nghĩa đường dẫn thư mục lưu trữ profile
 VOICE_PROFILES_DIR = Path(os.environ.get('VOICE_PROFILES_DIR', 'data/voice_profiles'))
 
-router = APIRouter(prefix="/voice-library", tags=["voice-library"])
+# Nếu request có Bearer token thì user_id phải khớp với user của token (admin được phép truy cập tất cả)
+router = APIRouter(
+    prefix="/voice-library",
+    tags=["voice-library"],
+    dependencies=[Depends(verify_user_access)]
+)
 
 # Voice Profile endpoints
 @router.post("/profiles", response_model=VoiceProfileResponse, status_code=status.HTTP_201_CREATED)
@@ -85,7 +109,7 @@ async def get_profile(
         return response
     except Exception as e:
         # Log và xử lý nếu có lỗi
-        print(f"Lỗi khi chuyển đổi dữ liệu: {str(e)}")
+        logger.error("Lỗi khi chuyển đổi dữ liệu: %s", e)
         # Trả về profile mà không có từ vựng trong trường hợp lỗi
         return VoiceProfileWithVocabularies(
             id=profile.id,
@@ -152,7 +176,7 @@ async def add_vocab(
                 "message": f"Từ vựng '{word}' đã tồn tại. Đặt overwrite=true để ghi đè."
             }
     except Exception as e:
-        print(f"Lỗi khi kiểm tra từ vựng tồn tại: {str(e)}")
+        logger.error("Lỗi khi kiểm tra từ vựng tồn tại: %s", e)
     
     # Nếu từ chưa tồn tại hoặc yêu cầu ghi đè, thêm hoặc cập nhật từ vựng
     vocab = add_vocabulary(profile_id, user_id, word, audio_file, db)
@@ -208,7 +232,7 @@ async def get_vocabs(
         response.headers["Content-Range"] = f"items {skip}-{skip+len(result)}/{total_count}"
         return response
     except Exception as e:
-        print(f"Lỗi khi lấy danh sách từ vựng: {str(e)}")
+        logger.error("Lỗi khi lấy danh sách từ vựng: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi khi lấy danh sách từ vựng: {str(e)}"
@@ -240,7 +264,7 @@ async def get_vocab(
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        print(f"Lỗi khi lấy từ vựng: {str(e)}")
+        logger.error("Lỗi khi lấy từ vựng: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi khi lấy từ vựng: {str(e)}"
@@ -274,22 +298,110 @@ async def get_vocab_audio(
     return FileResponse(audio_path)
 
 # Text to Speech endpoints
+def _encode_speech(audio, sample_rate: int, output_format: str) -> bytes:
+    with stage("encode"):
+        return encode_audio(audio, sample_rate, output_format)
+
+def _render_speech(profile_id: int, user_id: int, text: str, hybrid: bool) -> dict:
+    """
+    Ghép câu, chạy trong threadpool và dùng chung cho các request trùng nhau; mỗi request tự mã hóa
+    theo định dạng của mình (mở session riêng vì request khởi tạo có thể kết thúc trước các request đang chờ kết quả)
+    """
+    db = SessionLocal()
+    try:
+        result = synthesize_speech(profile_id, user_id, text, db, hybrid=hybrid)
+    finally:
+        db.close()
+    
+    if result.get("audio") is None or len(result["audio"]) == 0:
+        raise HTTPException(status_code=500, detail="Không thể tạo file âm thanh")
+    
+    return {
+        "audio": result["audio"],
+        "sample_rate": result["sample_rate"],
+        "duration": result.get("duration", 0.0),
+        "generated_words": len(result.get("generated_words", []))
+    }
+
 @router.post("/text-to-speech")
 async def convert_text_to_speech(
     request: TextToSpeechRequest,
     user_id: int,
+    format: Optional[str] = None,
+    retain: bool = False,
+    retain_seconds: Optional[int] = None,
+    hybrid: bool = False,
+    accept: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(require_user_access),
     db: Session = Depends(get_db)
 ):
-    """Chuyển đổi văn bản thành giọng nói sử dụng từ điển âm thanh"""
-    result = text_to_speech(request.voice_profile_id, user_id, request.text, db)
-    
-    # Lấy đường dẫn audio từ kết quả trả về dạng dict
-    output_path = result.get("audio_path")
+    """
+    Chuyển đổi văn bản thành giọng nói sử dụng từ điển âm thanh
+    Bắt buộc có Bearer token của chính user_id (hoặc admin) vì route này tính phí
+    - `hybrid`: từ chưa có trong vocabulary được tạo bằng model MMS-TTS (khớp độ lớn và sample rate
+      với giọng đã ghi âm, lưu lại để dùng cho các request sau) thay vì trả lỗi 400.
+      Số từ được tạo tự động nằm trong header `X-Generated-Words`
+    - `format`: wav, flac, opus hoặc mp3 (nếu không có thì chọn theo header Accept, mặc định WAV)
+    - `retain`: giữ lại file kết quả để tải về sau qua URL trong header `X-Download-Url`
+      (hết hạn sau `retain_seconds`, thời điểm hết hạn trong header `X-Expires-At`)
+    Mặc định kết quả được mã hóa và gửi dần từng khối, không lưu lại trên server.
+    Các request giống hệt nhau (cùng profile, văn bản sau chuẩn hóa và chế độ) đến cùng lúc
+    chỉ được tổng hợp một lần và dùng chung kết quả; mỗi request vẫn được tính phí riêng.
+    """
+    # Chọn định dạng trước khi tính phí (406 nếu định dạng không được hỗ trợ)
+    output_format = negotiate_output_format(format, accept)
     
-    if not output_path or not os.path.exists(output_path):
-        raise HTTPException(status_code=500, detail="Không thể tạo file âm thanh")
+    # Giữ trước phí theo số ký tự (402 nếu không đủ credits), hoàn lại nếu tổng hợp lỗi
+    async with metered_synthesis(db, user_id, request.text, "/voice-library/text-to-speech") as settle:
+        key = ("voice-library", user_id, request.voice_profile_id, normalize_text(request.text), hybrid)
+        rendered = await single_flight(
+            key, _render_speech, request.voice_profile_id, user_id, request.text, hybrid
+        )
+        
+        # Tính phí theo số giây âm thanh đã tạo
+        await settle(rendered["duration"])
+        
+        media_type = OUTPUT_FORMATS[output_format]["media_type"]
+        headers = output_headers(output_format)
+        if hybrid:
+            headers["X-Generated-Words"] = str(rendered["generated_words"])
+        if retain:
+            # Cần toàn bộ nội dung để lưu vào output store nên mã hóa một lần rồi trả về
+            content = await run_in_threadpool(
+                _encode_speech, rendered["audio"], rendered["sample_rate"], output_format
+            )
+            with stage("write"):
+                saved = save_output(
+                    content, user_id, OUTPUT_FORMATS[output_format]["extension"], retention_seconds(retain_seconds)
+                )
+            headers["X-Download-Url"] = f"{router.prefix}/outputs/{saved['name']}?user_id={user_id}"
+            headers["X-Expires-At"] = datetime.fromtimestamp(saved["expires_at"], tz=timezone.utc).isoformat()
+            return Response(content=content, media_type=media_type, headers=headers)
+        
+        # Mã hóa và gửi dần từng khối; encoder được mở trước khi gửi header
+        # nên lỗi cấu hình vẫn trả mã lỗi và được hoàn credits
+        body = await run_in_threadpool(
+            staged_iter, "encode",
+            lambda: encode_audio_stream(rendered["audio"], rendered["sample_rate"], output_format)
+        )
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@router.get("/outputs/{name}")
+async def download_output(name: str, user_id: int):
+    """Tải lại file kết quả đã được giữ lại (410 nếu đã hết hạn)"""
+    try:
+        path = resolve_output(name, user_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Output not found")
+    except OutputExpiredError:
+        raise HTTPException(status_code=410, detail="File kết quả đã hết hạn")
     
-    return FileResponse(output_path)
+    extension = name.rsplit(".", 1)[-1]
+    media_type = next(
+        (info["media_type"] for info in OUTPUT_FORMATS.values() if info["extension"] == extension),
+        "application/octet-stream"
+    )
+    return ZeroCopyFileResponse(path, media_type=media_type, filename=f"speech.{extension}")
 
 @router.post("/repair-audio")
 def repair_audio(
@@ -314,11 +426,15 @@ def repair_audio(
         # Kết quả
         results = []
         
+        # Sửa file về định dạng chuẩn của profile
+        profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
+        target_sr = ensure_profile_format(profile_dir)["sample_rate"]
+        
         # Kiểm tra và sửa từng file
         for vocab in vocabs:
             audio_path = vocab.audio_path
             try:
-                valid, error_msg = validate_and_fix_audio_file(audio_path, force_convert=True)
+                valid, error_msg = validate_and_fix_audio_file(audio_path, force_convert=True, target_sr=target_sr)
                 results.append({
                     "word": vocab.word,
                     "path": audio_path,
@@ -371,62 +487,56 @@ def reprocess_audio(
         # Kết quả
         results = []
         
-        # Xử lý từng file
+        # Kiểm tra file tồn tại và tạo bản sao để khôi phục nếu xử lý thất bại
+        pending = []
         for vocab in vocabs:
             audio_path = vocab.audio_path
-            try:
-                # Kiểm tra file tồn tại
-                if not os.path.exists(audio_path):
-                    results.append({
-                        "word": vocab.word,
-                        "path": audio_path,
-                        "success": False,
-                        "message": "File không tồn tại"
-                    })
-                    continue
-                
-                # Tạo bản sao để xử lý
-                backup_path = f"{audio_path}.backup"
-                shutil.copy2(audio_path, backup_path)
-                
-                # Xử lý nâng cao
-                success = process_audio_for_vocabulary(audio_path)
-                
-                if success:
-                    results.append({
-                        "word": vocab.word,
-                        "path": audio_path,
-                        "success": True,
-                        "message": "Đã xử lý thành công"
-                    })
-                    # Xóa file backup nếu thành công
-                    if os.path.exists(backup_path):
-                        os.remove(backup_path)
-                else:
-                    # Khôi phục từ backup nếu thất bại
-                    if os.path.exists(backup_path):
-                        shutil.copy2(backup_path, audio_path)
-                        os.remove(backup_path)
-                    
-                    results.append({
-                        "word": vocab.word,
-                        "path": audio_path,
-                        "success": False,
-                        "message": "Xử lý thất bại, đã khôi phục bản gốc"
-                    })
-                    
-            except Exception as e:
-                # Khôi phục từ backup nếu có lỗi
-                if 'backup_path' in locals() and os.path.exists(backup_path):
-                    shutil.copy2(backup_path, audio_path)
-                    os.remove(backup_path)
-                
+            if not os.path.exists(audio_path):
                 results.append({
                     "word": vocab.word,
                     "path": audio_path,
                     "success": False,
-                    "message": f"Lỗi: {str(e)}"
+                    "message": "File không tồn tại"
                 })
+                continue
+            shutil.copy2(audio_path, f"{audio_path}.backup")
+            pending.append(vocab)
+        
+        # Xử lý tất cả file theo lô: khi xử lý cả profile thì tính lại mô hình nhiễu
+        # từ toàn bộ bản ghi âm, khi chỉ xử lý một từ thì dùng mô hình nhiễu hiện có
+        profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
+        try:
+            batch_results = reprocess_vocabulary_batch(
+                [vocab.audio_path for vocab in pending],
+                profile_dir,
+                rebuild_noise_profile=word is None
+            )
+        except Exception as e:
+            batch_results = {vocab.audio_path: (False, f"Lỗi: {str(e)}") for vocab in pending}
+        
+        for vocab in pending:
+            audio_path = vocab.audio_path
+            backup_path = f"{audio_path}.backup"
+            success, error_msg = batch_results.get(audio_path, (False, None))
+            
+            if success:
+                # Xóa file backup nếu thành công
+                if os.path.exists(backup_path):
+                    os.remove(backup_path)
+                message = "Đã xử lý thành công"
+            else:
+                # Khôi phục từ backup nếu thất bại
+                if os.path.exists(backup_path):
+                    shutil.copy2(backup_path, audio_path)
+                    os.remove(backup_path)
+                message = error_msg or "Xử lý thất bại, đã khôi phục bản gốc"
+            
+            results.append({
+                "word": vocab.word,
+                "path": audio_path,
+                "success": success,
+                "message": message
+            })
         
         # Thống kê
         success_count = sum(1 for r in results if r["success"])
@@ -440,143 +550,61 @@ def reprocess_audio(
             detail=f"Lỗi khi xử lý lại file audio: {str(e)}"
         )
 
-@router.post("/profiles/{profile_id}/sync-vocabulary", response_model=dict)
-async def sync_vocabulary(
-    profile_id: int,
-    user_id: int,
-    db: Session = Depends(get_db)
-):
-    """Đồng bộ hóa từ vựng với file audio trong thư mục"""
-    import os
-    from pathlib import Path
-    
+def _sync_profile(profile_id: int, user_id: int, db: Session, remove_missing: bool, debug: bool) -> dict:
+    profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
+    logger.debug("Đang tìm kiếm file audio trong thư mục: %s", profile_dir)
     try:
-        # Kiểm tra profile tồn tại
-        profile = get_voice_profile_by_id(profile_id, user_id, db)
-        
-        # Lấy tất cả từ vựng trong database
-        vocab_db = db.query(Vocabulary).filter(Vocabulary.voice_profile_id == profile_id).all()
-        vocab_words = {vocab.word.lower().strip(): vocab for vocab in vocab_db}
-        
-        # Tìm thư mục chứa file audio
-        profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{profile_id}"
-        
-        # In ra đường dẫn thư mục để debug
-        print(f"Đang tìm kiếm file audio trong thư mục: {profile_dir}")
-        
-        # Nếu thư mục không tồn tại, tạo mới
-        if not profile_dir.exists():
-            profile_dir.mkdir(parents=True, exist_ok=True)
-            return {
-                "status": "success",
-                "message": "Thư mục không tồn tại, đã tạo mới",
-                "total_files": 0,
-                "total_records": len(vocab_db),
-                "missing_files": [],
-                "missing_records": [],
-                "debug_info": []
-            }
-        
-        # Kiểm tra thư mục có thể truy cập được không
-        try:
-            all_files = os.listdir(profile_dir)
-            print(f"Đọc được {len(all_files)} file trong thư mục")
-        except PermissionError:
-            print(f"Lỗi quyền truy cập: Không thể đọc thư mục {profile_dir}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Không thể đọc thư mục {profile_dir} do không đủ quyền truy cập"
-            )
-        except Exception as e:
-            print(f"Lỗi khi đọc thư mục: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Không thể đọc thư mục: {str(e)}"
-            )
-        
-        # Lấy danh sách file audio (mở rộng danh sách định dạng hỗ trợ)
-        supported_extensions = ('.wav', '.mp3', '.ogg', '.m4a', '.aac', '.flac')
-        audio_files = [f for f in os.listdir(profile_dir) if f.lower().endswith(supported_extensions)]
-        
-        # Thông tin debug
-        debug_info = {
-            "all_files": os.listdir(profile_dir),
-            "filtered_audio_files": audio_files,
-            "db_words": list(vocab_words.keys())
-        }
-        
-        # Lưu trữ các file trùng lặp
-        duplicate_check = {}
-        duplicate_files = []
-        
-        # Tìm các file audio trùng lặp
-        for audio_file in audio_files:
-            word = os.path.splitext(audio_file)[0].lower().strip()
-            
-            if word in duplicate_check:
-                duplicate_check[word].append(audio_file)
-                duplicate_files.append(audio_file)
-            else:
-                duplicate_check[word] = [audio_file]
-        
-        # Tìm các file không có bản ghi database
-        missing_records = []
-        unique_words = set()
-        
-        for audio_file in audio_files:
-            # Bỏ qua file trùng lặp thứ 2 trở đi
-            if audio_file in duplicate_files and duplicate_check[os.path.splitext(audio_file)[0].lower().strip()][0] != audio_file:
-                continue
-                
-            word = os.path.splitext(audio_file)[0].lower().strip()
-            unique_words.add(word)
-            
-            if word not in vocab_words:
-                # Tạo bản ghi mới
-                file_path = str(profile_dir / audio_file)
-                new_vocab = Vocabulary(
-                    voice_profile_id=profile_id,
-                    word=word,
-                    audio_path=file_path
-                )
-                db.add(new_vocab)
-                missing_records.append(word)
-        
-        # Tìm các bản ghi không có file audio
-        missing_files = []
-        for word, vocab in vocab_words.items():
-            normalized_word = word.lower().strip()
-            if normalized_word not in unique_words:
-                missing_files.append(word)
-        
-        # Lưu thay đổi
-        db.commit()
-        
-        # Cập nhật lại vocab_db sau khi thêm bản ghi mới
-        vocab_db = db.query(Vocabulary).filter(Vocabulary.voice_profile_id == profile_id).all()
-        
-        return {
-            "status": "success",
-            "message": "Đã đồng bộ hóa dữ liệu",
-            "total_files": len(audio_files),
-            "unique_files": len(unique_words),
-            "duplicate_files": len(duplicate_files),
-            "total_records": len(vocab_db),
-            "added_records": missing_records,
-            "missing_files": missing_files,
-            "debug_info": debug_info
-        }
-        
+        return sync_profile_vocabulary(
+            db, user_id, profile_id, profile_dir, remove_missing=remove_missing, include_debug=debug
+        )
     except HTTPException:
-        # Re-raise HTTP exceptions
         raise
     except Exception as e:
         db.rollback()
-        print(f"Lỗi khi đồng bộ từ vựng: {str(e)}")
-        import traceback
-        traceback.print_exc()  # In ra stack trace đầy đủ
-        
+        logger.exception("Lỗi khi đồng bộ từ vựng: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Lỗi khi đồng bộ từ vựng: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/profiles/sync-vocabulary", response_model=dict)
+def sync_all_vocabulary(
+    user_id: int,
+    remove_missing: bool = False,
+    debug: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Đồng bộ từ vựng của mọi profile của user trong một request
+    (tham số như API đồng bộ một profile, mặc định không trả về debug_info)
+    """
+    profiles = get_voice_profiles_by_user_id(user_id, db)
+    results = {
+        profile.id: _sync_profile(profile.id, user_id, db, remove_missing, debug)
+        for profile in profiles
+    }
+    return {
+        "status": "success",
+        "message": f"Đã đồng bộ hóa {len(results)} profile",
+        "added_records": sum(len(result.get("added_records", [])) for result in results.values()),
+        "removed_records": sum(len(result.get("removed_records", [])) for result in results.values()),
+        "profiles": results
+    }
+
+@router.post("/profiles/{profile_id}/sync-vocabulary", response_model=dict)
+def sync_vocabulary(
+    profile_id: int,
+    user_id: int,
+    remove_missing: bool = False,
+    debug: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Đồng bộ hóa từ vựng với file audio trong thư mục
+    - Chỉ đọc lại file mới hoặc đã thay đổi so với lần đồng bộ trước (manifest trong thư mục profile)
+    - `remove_missing=true`: xóa các bản ghi không còn file audio (mặc định chỉ liệt kê trong missing_files)
+    - `debug=false`: không trả về danh sách file trong debug_info
+    """
+    # Kiểm tra profile tồn tại
+    get_voice_profile_by_id(profile_id, user_id, db)
+    return _sync_profile(profile_id, user_id, db, remove_missing, debug)
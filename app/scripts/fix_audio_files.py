@@ -21,6 +21,7 @@ from app.database.voice_service import (
     validate_and_fix_audio_file, VOICE_PROFILES_DIR,
     process_audio_for_vocabulary
 )
+from app.database.audio_format import ensure_profile_format
 from app.database.database import SessionLocal
 from app.models.voice_library.vocabulary import Vocabulary
 
@@ -88,8 +89,9 @@ def main():
             backup_path = f"{audio_file}.backup"
             shutil.copy2(audio_file, backup_path)
             
-            # Đảm bảo định dạng file hợp lệ
-            valid, message = validate_and_fix_audio_file(audio_file)
+            # Đảm bảo định dạng file hợp lệ và đúng sample rate chuẩn của profile
+            target_sr = ensure_profile_format(Path(audio_file).parent)["sample_rate"]
+            valid, message = validate_and_fix_audio_file(audio_file, target_sr=target_sr)
             if not valid:
                 print(f"✗ Không thể validate file: {audio_file}, Lỗi: {message}")
                 # Khôi phục từ backup
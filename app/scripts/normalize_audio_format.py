@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Script chuyển các file audio từ vựng đã lưu về định dạng chuẩn của profile
+(WAV PCM 16-bit, mono, sample rate cố định) để text-to-speech không phải resample khi ghép câu
+Sử dụng: python -m app.scripts.normalize_audio_format [--sample-rate 24000] [--user-id 1] [--profile-id 2] [--dry-run]
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+# Thêm thư mục gốc vào PATH để import các module
+script_dir = Path(__file__).resolve().parent
+root_dir = script_dir.parent.parent
+sys.path.insert(0, str(root_dir))
+
+import librosa
+
+from app.database.voice_service import VOICE_PROFILES_DIR
+from app.database.audio_format import (
+    get_profile_format, set_profile_format, is_canonical_file, normalize_clip_file,
+    profile_format_path
+)
+from app.database.noise_profile import build_noise_profile, load_noise_profile
+
+def find_profile_dirs(user_id=None, profile_id=None):
+    """Liệt kê các thư mục profile cần chuyển đổi"""
+    user_pattern = f"user_{user_id}" if user_id else "user_*"
+    profile_pattern = f"profile_{profile_id}" if profile_id else "profile_*"
+    return sorted(p for p in VOICE_PROFILES_DIR.glob(f"{user_pattern}/{profile_pattern}") if p.is_dir())
+
+def migrate_profile(profile_dir, sample_rate=None, dry_run=False):
+    """Chuyển toàn bộ clip của một profile, trả về (số file đã chuyển, số file lỗi)"""
+    if sample_rate is None:
+        sample_rate = get_profile_format(profile_dir)["sample_rate"]
+
+    audio_files = sorted(
+        f for f in os.listdir(profile_dir)
+        if f.lower().endswith('.wav') and not f.startswith('.')
+    )
+    converted = 0
+    failed = 0
+    for audio_file in audio_files:
+        file_path = profile_dir / audio_file
+        if is_canonical_file(file_path, sample_rate):
+            continue
+        if dry_run:
+            print(f"  [dry-run] Cần chuyển đổi: {file_path}")
+            converted += 1
+            continue
+        try:
+            normalize_clip_file(file_path, sample_rate)
+            converted += 1
+        except Exception as e:
+            print(f"  ✗ Lỗi khi chuyển đổi {file_path}: {e}")
+            failed += 1
+
+    if dry_run:
+        return converted, failed
+
+    set_profile_format(profile_dir, sample_rate)
+
+    # Mô hình nhiễu phải tính lại theo sample rate mới
+    noise_profile = load_noise_profile(profile_dir)
+    if converted and (noise_profile is None or noise_profile["sr"] != sample_rate):
+        clips = []
+        for audio_file in audio_files:
+            try:
+                y, _ = librosa.load(str(profile_dir / audio_file), sr=None)
+                clips.append(y)
+            except Exception as e:
+                print(f"  Bỏ qua {audio_file} khi tính mô hình nhiễu: {e}")
+        build_noise_profile(profile_dir, clips, sample_rate)
+
+    return converted, failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Chuyển audio từ vựng về định dạng chuẩn của profile')
+    parser.add_argument('--sample-rate', type=int, help='Sample rate chuẩn mới (mặc định giữ định dạng hiện tại của profile)')
+    parser.add_argument('--user-id', type=int, help='Chỉ xử lý profile của user này')
+    parser.add_argument('--profile-id', type=int, help='Chỉ xử lý profile này')
+    parser.add_argument('--dry-run', action='store_true', help='Chỉ liệt kê các file cần chuyển đổi')
+    args = parser.parse_args()
+
+    profile_dirs = find_profile_dirs(args.user_id, args.profile_id)
+    print(f"Tìm thấy {len(profile_dirs)} profile")
+
+    total_converted = 0
+    total_failed = 0
+    for profile_dir in profile_dirs:
+        has_format = profile_format_path(profile_dir).exists()
+        sample_rate = args.sample_rate or get_profile_format(profile_dir)["sample_rate"]
+        print(f"\nProfile {profile_dir} -> {sample_rate}Hz mono" + ("" if has_format else " (chưa có định dạng)"))
+        converted, failed = migrate_profile(profile_dir, sample_rate, dry_run=args.dry_run)
+        print(f"  Đã chuyển đổi: {converted}, lỗi: {failed}")
+        total_converted += converted
+        total_failed += failed
+
+    print("\n=== KẾT QUẢ ===")
+    print(f"Tổng số file đã chuyển đổi: {total_converted}")
+    print(f"Thất bại: {total_failed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# Mã hóa audio đầu ra (WAV/FLAC/Opus/MP3) theo từng khối để gửi dần cho client
+
+import inspect
+import struct
+from functools import lru_cache
+from typing import Iterator, List, Optional
+
+import numpy as np
+import librosa
+import soundfile as sf
+from fastapi import HTTPException
+
+from app.config import settings
+
+# Thông tin các định dạng đầu ra được hỗ trợ
+OUTPUT_FORMATS = {
+    "wav": {
+        "media_type": "audio/wav",
+        "extension": "wav",
+        "format": "WAV",
+        "subtype": "PCM_16",
+        "samplerates": None,
+    },
+    "flac": {
+        "media_type": "audio/flac",
+        "extension": "flac",
+        "format": "FLAC",
+        "subtype": "PCM_16",
+        "samplerates": None,
+    },
+    "opus": {
+        "media_type": "audio/ogg",
+        "extension": "ogg",
+        "format": "OGG",
+        "subtype": "OPUS",
+        # Opus chỉ hỗ trợ các sample rate này
+        "samplerates": (8000, 12000, 16000, 24000, 48000),
+    },
+    "mp3": {
+        "media_type": "audio/mpeg",
+        "extension": "mp3",
+        "format": "MP3",
+        "subtype": "MPEG_LAYER_III",
+        "samplerates": (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000),
+    },
+}
+
+# Tên định dạng / media type trong tham số `format` và header Accept
+FORMAT_ALIASES = {
+    "wav": "wav", "wave": "wav", "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav",
+    "flac": "flac", "audio/flac": "flac", "audio/x-flac": "flac",
+    "opus": "opus", "ogg": "opus", "audio/ogg": "opus", "audio/opus": "opus",
+    "mp3": "mp3", "mpeg": "mp3", "audio/mpeg": "mp3", "audio/mp3": "mp3",
+}
+
+# Độ dài mỗi khối mã hóa (giây)
+ENCODE_BLOCK_SECONDS = 0.5
+
+
+@lru_cache(maxsize=None)
+def available_formats() -> List[str]:
+    """Các định dạng mà libsndfile trên máy hiện tại mã hóa được"""
+    return [
+        name for name, info in OUTPUT_FORMATS.items()
+        if sf.check_format(info["format"], info["subtype"])
+    ]
+
+
+def _parse_accept(accept: str) -> List[str]:
+    """Tách header Accept thành danh sách media type, sắp xếp theo q giảm dần"""
+    entries = []
+    for position, part in enumerate(accept.split(",")):
+        pieces = [p.strip() for p in part.split(";")]
+        media_type = pieces[0].lower()
+        quality = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            entries.append((-quality, position, media_type))
+    return [media_type for _, _, media_type in sorted(entries)]
+
+
+def negotiate_output_format(requested: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """
+    Chọn định dạng đầu ra:
+    - Ưu tiên tham số `format` (406 nếu không hỗ trợ)
+    - Sau đó là header Accept, nếu không khớp định dạng nào thì dùng định dạng mặc định
+    """
+    supported = available_formats()
+    if requested:
+        name = FORMAT_ALIASES.get(requested.strip().lower())
+        if name not in supported:
+            raise HTTPException(
+                status_code=406,
+                detail=f"Định dạng '{requested}' không được hỗ trợ. Các định dạng hỗ trợ: {', '.join(supported)}"
+            )
+        return name
+
+    if accept:
+        for media_type in _parse_accept(accept):
+            name = FORMAT_ALIASES.get(media_type)
+            if name in supported:
+                return name
+            if media_type in ("*/*", "audio/*"):
+                break
+
+    default = FORMAT_ALIASES.get(settings.AUDIO_OUTPUT_DEFAULT_FORMAT.lower(), "wav")
+    return default if default in supported else "wav"
+
+
+def output_headers(format_name: str, filename: str = "speech") -> dict:
+    extension = OUTPUT_FORMATS[format_name]["extension"]
+    return {
+        "Content-Disposition": f'inline; filename="{filename}.{extension}"',
+        "Vary": "Accept",
+    }
+
+
+def _output_samplerate(format_name: str, sr: int) -> int:
+    samplerates = OUTPUT_FORMATS[format_name]["samplerates"]
+    if not samplerates or sr in samplerates:
+        return sr
+    higher = [rate for rate in samplerates if rate >= sr]
+    return min(higher) if higher else max(samplerates)
+
+
+class _StreamBuffer:
+    """
+    File ảo cho libsndfile: dữ liệu đã ghi được lấy ra dần bằng drain().
+    Nếu encoder quay lại sửa phần đầu file khi đóng (header FLAC, tag Xing của MP3 VBR)
+    thì phần đã gửi không sửa được nữa, xem _patch_flac_total_samples và AUDIO_MP3_BITRATE_MODE.
+    """
+
+    def __init__(self):
+        self._base = 0
+        self._buffer = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        written = len(data)
+        offset = self._pos - self._base
+        self._pos += written
+        if offset < 0:
+            data = data[-offset:]
+            offset = 0
+        if data:
+            end = offset + len(data)
+            if end > len(self._buffer):
+                self._buffer.extend(b"\0" * (end - len(self._buffer)))
+            self._buffer[offset:end] = data
+        return written
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 0:
+            self._pos = offset
+        elif whence == 1:
+            self._pos += offset
+        else:
+            self._pos = self._base + len(self._buffer) + offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        return b""
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._base += len(self._buffer)
+        self._buffer = bytearray()
+        return data
+
+
+def _wav_header(frames: int, sr: int) -> bytes:
+    # Độ dài đã biết trước nên ghi header WAV PCM 16-bit mono chính xác ngay từ đầu
+    data_size = frames * 2
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sr, sr * 2, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def _patch_flac_total_samples(data: bytes, frames: int) -> bytes:
+    """
+    libsndfile chỉ ghi tổng số mẫu vào STREAMINFO khi đóng file (quay lại đầu file),
+    lúc đó header đã được gửi đi. Độ dài đã biết trước nên ghi luôn vào header đầu tiên.
+    """
+    # "fLaC" (4) + block header (4) + block size min/max (4) + frame size min/max (6)
+    offset = 18
+    if len(data) < offset + 8 or data[:4] != b"fLaC":
+        return data
+    packed = int.from_bytes(data[offset:offset + 8], "big")
+    # 36 bit cuối: tổng số mẫu (sau sample rate 20 bit, số kênh 3 bit, số bit 5 bit)
+    packed = (packed & ~((1 << 36) - 1)) | (frames & ((1 << 36) - 1))
+    return data[:offset] + packed.to_bytes(8, "big") + data[offset + 8:]
+
+
+def _bitrate_to_compression_level(kbps: float, low_kbps: float, high_kbps: float) -> float:
+    # libsndfile ánh xạ gần tuyến tính: 0.0 -> bitrate cao nhất, 1.0 -> thấp nhất (1.0 bị từ chối với MP3)
+    return min(max((high_kbps - kbps) / (high_kbps - low_kbps), 0.0), 0.99)
+
+
+@lru_cache(maxsize=None)
+def _supported_encoder_options() -> frozenset:
+    # compression_level/bitrate_mode chỉ có từ soundfile 0.13, bản cũ hơn dùng mặc định của libsndfile
+    return frozenset(inspect.signature(sf.SoundFile.__init__).parameters)
+
+
+def _encoder_options(format_name: str, sr: int) -> dict:
+    if format_name == "flac":
+        options = {"compression_level": settings.AUDIO_FLAC_COMPRESSION_LEVEL}
+    elif format_name == "opus":
+        # libsndfile chưa hỗ trợ chọn bitrate mode cho Opus
+        options = {"compression_level": _bitrate_to_compression_level(settings.AUDIO_OPUS_BITRATE_KBPS, 6, 256)}
+    elif format_name == "mp3":
+        # MPEG-1 (>= 32kHz): 32-320 kbps, MPEG-2/2.5: 8-160 kbps
+        low_kbps, high_kbps = (32, 320) if sr >= 32000 else (8, 160)
+        options = {
+            "compression_level": _bitrate_to_compression_level(settings.AUDIO_MP3_BITRATE_KBPS, low_kbps, high_kbps),
+            "bitrate_mode": settings.AUDIO_MP3_BITRATE_MODE,
+        }
+    else:
+        options = {}
+    supported = _supported_encoder_options()
+    return {name: value for name, value in options.items() if name in supported}
+
+
+def _encode_blocks(audio: np.ndarray, out_sr: int, format_name: str, output, buffer) -> Iterator[bytes]:
+    block = max(1, int(ENCODE_BLOCK_SECONDS * out_sr))
+    first_chunk = True
+    with output:
+        for start in range(0, len(audio), block):
+            output.write(audio[start:start + block])
+            data = buffer.drain()
+            if data:
+                if first_chunk and format_name == "flac":
+                    data = _patch_flac_total_samples(data, len(audio))
+                first_chunk = False
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def _wav_blocks(audio: np.ndarray, out_sr: int) -> Iterator[bytes]:
+    block = max(1, int(ENCODE_BLOCK_SECONDS * out_sr))
+    yield _wav_header(len(audio), out_sr)
+    for start in range(0, len(audio), block):
+        yield (audio[start:start + block] * 32767).astype("<i2").tobytes()
+
+
+def encode_audio_stream(audio: np.ndarray, sr: int, format_name: str) -> Iterator[bytes]:
+    """
+    Mã hóa audio mono theo từng khối ENCODE_BLOCK_SECONDS và trả về dần các byte đã mã hóa
+    (dùng trực tiếp với StreamingResponse)
+    Encoder được mở ngay khi gọi hàm nên lỗi cấu hình (định dạng, tùy chọn encoder) được raise
+    trước khi response bắt đầu gửi, không phải bên trong body
+    """
+    info = OUTPUT_FORMATS[format_name]
+    audio = np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0)
+    out_sr = _output_samplerate(format_name, sr)
+    if out_sr != sr:
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=out_sr)
+
+    if format_name == "wav":
+        return _wav_blocks(audio, out_sr)
+
+    buffer = _StreamBuffer()
+    output = sf.SoundFile(
+        buffer, mode="w", samplerate=out_sr, channels=1,
+        format=info["format"], subtype=info["subtype"], **_encoder_options(format_name, out_sr)
+    )
+    return _encode_blocks(audio, out_sr, format_name, output, buffer)
+
+
+def encode_audio(audio: np.ndarray, sr: int, format_name: str) -> bytes:
+    """Mã hóa toàn bộ audio thành bytes"""
+    return b"".join(encode_audio_stream(audio, sr, format_name))
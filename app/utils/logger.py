@@ -0,0 +1,170 @@
+# Logging có cấu trúc cho ứng dụng: thread gọi log chỉ đưa bản ghi vào hàng đợi,
+# thread nền (QueueListener) mới định dạng và ghi ra stdout
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Logger gốc của ứng dụng, logger của từng module là con của logger này (app.database.voice_service...)
+APP_LOGGER_NAME = "app"
+
+# LOG_LEVEL: mức log mặc định; LOG_LEVELS: mức theo module, vd "app.database.voice_service=DEBUG,app.routers=WARNING"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+# json (mặc định, một bản ghi mỗi dòng) hoặc text
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Tỉ lệ giữ lại các bản ghi DEBUG (log theo từng từ/từng file trong vòng lặp nóng)
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+# Số bản ghi tối đa chờ trong hàng đợi, vượt quá thì bỏ bớt thay vì chặn request
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+_sample_rate = LOG_DEBUG_SAMPLE_RATE
+_dropped = 0
+
+_RESERVED_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi là một dòng JSON: thời gian, mức, logger, nội dung và các trường truyền qua extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _SamplingFilter(logging.Filter):
+    # Chỉ lấy mẫu bản ghi DEBUG, các mức cao hơn luôn được giữ
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or _sample_rate >= 1.0:
+            return True
+        return random.random() < _sample_rate
+
+
+class _DroppingQueueHandler(QueueHandler):
+    # Hàng đợi đầy (stdout bị nghẽn) thì bỏ bản ghi, không chặn thread đang xử lý request
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Hàng đợi nằm trong cùng tiến trình nên không cần định dạng và sao chép bản ghi như QueueHandler gốc,
+        # chỉ ghép nội dung để tham số thay đổi sau đó không ảnh hưởng; định dạng để thread nền làm
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+class _Listener(QueueListener):
+    # Hàng đợi có thể đang đầy lúc tắt: chờ thread nền ghi bớt rồi mới đưa tín hiệu dừng vào
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> None:
+    """Gắn handler hàng đợi cho logger "app" và khởi động thread ghi log (gọi nhiều lần cũng chỉ chạy một lần)"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "text":
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        else:
+            output.setFormatter(JsonFormatter())
+
+        handler = _DroppingQueueHandler(log_queue)
+        handler.addFilter(_SamplingFilter())
+        app_logger = logging.getLogger(APP_LOGGER_NAME)
+        app_logger.handlers = [handler]
+        app_logger.propagate = False
+        app_logger.setLevel(LOG_LEVEL)
+        for name, level in _parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = _Listener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Ghi nốt các bản ghi còn trong hàng đợi rồi dừng thread ghi log"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_log_levels() -> dict:
+    """Mức log hiện tại của logger "app" và các logger con đã đặt mức riêng"""
+    levels = {APP_LOGGER_NAME: logging.getLevelName(logging.getLogger(APP_LOGGER_NAME).level)}
+    for name, item in logging.root.manager.loggerDict.items():
+        if (
+            name.startswith(APP_LOGGER_NAME + ".")
+            and isinstance(item, logging.Logger)
+            and item.level != logging.NOTSET
+        ):
+            levels[name] = logging.getLevelName(item.level)
+    return {
+        "levels": levels,
+        "debug_sample_rate": _sample_rate,
+        "dropped": _dropped,
+    }
+
+
+def set_log_level(name: str, level: Optional[str]) -> None:
+    """
+    Đổi mức log của một module lúc đang chạy (level=None để dùng lại mức của logger cha)
+    Raise ValueError nếu tên logger hoặc mức log không hợp lệ
+    """
+    if name != APP_LOGGER_NAME and not name.startswith(APP_LOGGER_NAME + "."):
+        raise ValueError(f"Chỉ đổi được mức log của logger '{APP_LOGGER_NAME}' và các module con")
+    if level is None:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+        return
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Mức log không hợp lệ: {level}")
+    logging.getLogger(name).setLevel(level)
+
+
+def set_debug_sample_rate(rate: float) -> None:
+    global _sample_rate
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError("Tỉ lệ lấy mẫu phải nằm trong khoảng 0..1")
+    _sample_rate = rate
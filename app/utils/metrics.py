@@ -0,0 +1,200 @@
+# Số liệu vận hành theo định dạng text của Prometheus (counter, gauge, histogram có nhãn)
+# Không phụ thuộc thư viện ngoài; mỗi lần ghi chỉ giữ khóa trong vài phép cộng nên an toàn giữa các thread
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.utils.tracing import span
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Biên histogram mặc định (giây)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+# name -> (type, help, buckets)
+_metadata: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {}
+# (name, nhãn) -> giá trị
+_values: Dict[Tuple[str, tuple], float] = {}
+# (name, nhãn) -> [số đếm theo bucket..., tổng, số lần]
+_histograms: Dict[Tuple[str, tuple], list] = {}
+# Hàm trả về các mẫu (name, nhãn, giá trị) được đọc tại thời điểm scrape
+_collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+_started_at = time.time()
+
+
+def describe(name: str, metric_type: str, help_text: str, buckets: Optional[Sequence[float]] = None) -> None:
+    """Khai báo metric (counter, gauge hoặc histogram) để có dòng HELP/TYPE khi xuất"""
+    with _lock:
+        _metadata[name] = (metric_type, help_text, tuple(buckets or DEFAULT_BUCKETS) if metric_type == "histogram" else None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Tăng counter (hoặc gauge)"""
+    key = (name, _label_key(labels))
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = (name, _label_key(labels))
+    with _lock:
+        _values[key] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Ghi một giá trị vào histogram"""
+    buckets = _metadata.get(name, ("histogram", "", DEFAULT_BUCKETS))[2] or DEFAULT_BUCKETS
+    index = bisect.bisect_left(buckets, value)
+    key = (name, _label_key(labels))
+    with _lock:
+        state = _histograms.get(key)
+        if state is None:
+            state = _histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+
+@contextmanager
+def stage(name: str, pipeline: str = "voice-library"):
+    """Đo thời gian một bước xử lý: with stage("decode"): ... (đồng thời mở span nếu request được trace)"""
+    started = time.perf_counter()
+    try:
+        with span(name, pipeline=pipeline):
+            yield
+    finally:
+        observe("tts_stage_duration_seconds", time.perf_counter() - started, pipeline=pipeline, stage=name)
+
+
+def staged_iter(name: str, factory: Callable[[], Iterable], pipeline: str = "voice-library") -> Iterator:
+    """
+    Như stage() cho dữ liệu được tạo dần (vd body của StreamingResponse): gọi factory() ngay (lỗi được raise
+    trước khi trả về), cộng thời gian tạo iterator và từng phần tử rồi ghi vào histogram khi đọc hết hoặc bị đóng
+    """
+    started = time.perf_counter()
+    iterator = iter(factory())
+    return _timed_items(iterator, time.perf_counter() - started, name, pipeline)
+
+
+def _timed_items(iterator: Iterator, elapsed: float, name: str, pipeline: str) -> Iterator:
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        observe("tts_stage_duration_seconds", elapsed, pipeline=pipeline, stage=name)
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, dict, float]]]) -> None:
+    """Đăng ký hàm đọc số liệu tức thời (độ dài hàng đợi, kích thước cache...) khi scrape"""
+    _collectors.append(collector)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_metrics() -> str:
+    """Xuất toàn bộ metric theo định dạng text exposition 0.0.4"""
+    samples: Dict[str, List[Tuple[tuple, float]]] = {}
+    with _lock:
+        metadata = dict(_metadata)
+        for (name, labels), value in _values.items():
+            samples.setdefault(name, []).append((labels, value))
+        histograms = {key: list(state) for key, state in _histograms.items()}
+
+    for collector in list(_collectors):
+        try:
+            for name, labels, value in collector():
+                samples.setdefault(name, []).append((_label_key(labels), value))
+        except Exception as e:
+            logger.error("Lỗi khi đọc số liệu từ %s: %s", getattr(collector, '__name__', collector), e)
+
+    lines = []
+    names = sorted(set(samples) | {name for name, _ in histograms})
+    for name in names:
+        metric_type, help_text, buckets = metadata.get(name, ("untyped", "", None))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in sorted(samples.get(name, [])):
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (hist_name, labels), state in sorted(histograms.items()):
+            if hist_name != name:
+                continue
+            bounds = buckets or DEFAULT_BUCKETS
+            cumulative = 0
+            for bound, count in zip(list(bounds) + [float("inf")], state[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(state[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _process_samples():
+    yield "process_uptime_seconds", {}, time.time() - _started_at
+    yield "process_cpu_seconds_total", {}, time.process_time()
+
+
+describe("http_requests_total", "counter", "Số request HTTP theo route, method và mã trạng thái")
+describe("http_request_duration_seconds", "histogram", "Thời gian xử lý request HTTP theo route")
+describe("http_requests_in_flight", "gauge", "Số request HTTP đang xử lý")
+describe("tts_stage_duration_seconds", "histogram", "Thời gian từng bước của pipeline tổng hợp giọng nói")
+describe("tts_cache_requests_total", "counter", "Số lần tra cache theo loại cache và kết quả (hit/miss)")
+describe("process_uptime_seconds", "gauge", "Thời gian worker đã chạy")
+describe("process_cpu_seconds_total", "counter", "Thời gian CPU worker đã dùng")
+register_collector(_process_samples)
+
+
+def route_label(scope: dict) -> str:
+    # Dùng mẫu route (vd: /voice-library/outputs/{name}) để số nhãn không tăng theo từng URL
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def metrics_middleware(request, call_next):
+    """Middleware HTTP: đếm request, đo thời gian theo route và số request đang xử lý"""
+    started = time.perf_counter()
+    inc("http_requests_in_flight")
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        inc("http_requests_in_flight", -1)
+        route = route_label(request.scope)
+        inc("http_requests_total", method=request.method, route=route, status=str(status_code))
+        observe("http_request_duration_seconds", time.perf_counter() - started, method=request.method, route=route)
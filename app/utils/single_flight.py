@@ -0,0 +1,66 @@
+# Gộp các request giống hệt nhau đang chạy đồng thời thành một lần tính toán (single-flight)
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.tracing import span
+
+# Các tính toán đang chạy: khóa -> task (mỗi worker có một event loop nên không cần khóa)
+_inflight: Dict[Hashable, asyncio.Task] = {}
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,    # Tổng số request đi qua single-flight
+    "executions": 0,  # Số lần thực sự tính toán
+    "coalesced": 0,   # Số request dùng lại kết quả của request khác
+    "errors": 0,      # Số lần tính toán bị lỗi
+    "inflight": 0,    # Số tính toán đang chạy
+}
+
+
+def _count(name: str, value: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += value
+
+
+def _finished(key: Hashable, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    _count("inflight", -1)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        # Đọc exception để asyncio không cảnh báo khi không còn ai chờ task
+        _count("errors")
+
+
+async def single_flight(key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Chạy func(*args, **kwargs) trong threadpool, các request cùng khóa đến trong lúc đang chạy
+    sẽ chờ và nhận chung kết quả (hoặc chung exception) thay vì tính lại.
+    Task không bị hủy khi request khởi tạo nó ngắt kết nối, các request đang chờ vẫn nhận được kết quả.
+    """
+    _count("requests")
+    task = _inflight.get(key)
+    coalesced = task is not None
+    if coalesced:
+        _count("coalesced")
+    else:
+        _count("executions")
+        _count("inflight")
+        task = asyncio.ensure_future(run_in_threadpool(func, *args, **kwargs))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _finished(key, done))
+    # Span của request dùng lại kết quả chỉ gồm thời gian chờ, các span con nằm trong trace của request khởi tạo
+    with span("single_flight", coalesced=coalesced):
+        return await asyncio.shield(task)
+
+
+def single_flight_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["coalesce_ratio"] = stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
@@ -0,0 +1,286 @@
+# Chuẩn hóa văn bản tiếng Việt trước khi tổng hợp giọng nói
+# (Unicode NFC, đọc số/ngày/giờ/tiền tệ thành chữ, mở rộng từ viết tắt, gộp khoảng trắng)
+
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+# Số chuỗi đã chuẩn hóa được giữ lại để dùng lại cho các request lặp lại
+NORMALIZER_CACHE_SIZE = int(os.environ.get("NORMALIZER_CACHE_SIZE", "4096"))
+# Chuỗi dài hơn giới hạn này không được cache (ít khi lặp lại, tốn bộ nhớ)
+NORMALIZER_CACHE_MAX_LENGTH = 1000
+
+_DIGITS = ["không", "một", "hai", "ba", "bốn", "năm", "sáu", "bảy", "tám", "chín"]
+_MONTHS = {4: "tư"}
+_ORDINALS = {1: "nhất", 4: "tư"}
+
+# Từ viết tắt thường gặp (khóa viết thường)
+ABBREVIATIONS = {
+    "tp.hcm": "thành phố hồ chí minh",
+    "tphcm": "thành phố hồ chí minh",
+    "tp hcm": "thành phố hồ chí minh",
+    "hcm": "hồ chí minh",
+    "tp.": "thành phố",
+    "tp": "thành phố",
+    "ubnd": "ủy ban nhân dân",
+    "hđnd": "hội đồng nhân dân",
+    "thpt": "trung học phổ thông",
+    "thcs": "trung học cơ sở",
+    "đh": "đại học",
+    "pgs.ts": "phó giáo sư tiến sĩ",
+    "pgs": "phó giáo sư",
+    "vn": "việt nam",
+    "sđt": "số điện thoại",
+    "stk": "số tài khoản",
+    "cmnd": "chứng minh nhân dân",
+    "cccd": "căn cước công dân",
+    "vd": "ví dụ",
+    "v.v": "vân vân",
+    "ko": "không",
+}
+
+# Học hàm, học vị: chỉ mở rộng khi viết hoa (TS, Ts, ThS) hoặc có dấu chấm (ts.),
+# dạng viết thường có thể là từ đã ghi âm trong vocabulary
+TITLE_ABBREVIATIONS = {
+    "gs": "giáo sư",
+    "ts": "tiến sĩ",
+    "ths": "thạc sĩ",
+    "bs": "bác sĩ",
+}
+
+# Đơn vị đo đi sau số
+UNITS = {
+    "km": "ki lô mét",
+    "kg": "ki lô gam",
+    "cm": "xen ti mét",
+    "mm": "mi li mét",
+    "ml": "mi li lít",
+    "m": "mét",
+    "g": "gam",
+    "l": "lít",
+}
+
+# Ký tự thay thế trước khi chuẩn hóa (khoảng trắng đặc biệt, dấu ngoặc, nháy...)
+_TRANSLATION = str.maketrans({
+    " ": " ", "​": " ", "\t": " ", "\n": " ", "\r": " ",
+    "…": ".", "–": " ", "—": " ",
+    "“": " ", "”": " ", "‘": " ", "’": " ", '"': " ", "«": " ", "»": " ",
+    "(": ",", ")": ",", "[": ",", "]": ",", "{": ",", "}": ",",
+    "*": " ", "_": " ", "#": " ", "~": " ", "^": " ", "|": " ", "\\": " ", "<": " ", ">": " ",
+})
+
+_NUMBER = r"\d+(?:[.,]\d+)*"
+
+# Các biểu thức chính quy được biên dịch sẵn một lần khi import module
+# "pgs.ts" được giữ nguyên để bảng ABBREVIATIONS đọc cả cụm
+_TITLE_ABBREVIATION_PATTERN = re.compile(
+    r"(?<!\w)(pgs\.ts|" + "|".join(sorted(TITLE_ABBREVIATIONS, key=len, reverse=True)) + r")(?:(\.)|(?!\w))",
+    re.IGNORECASE,
+)
+_ABBREVIATION_PATTERN = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(key) for key in sorted(ABBREVIATIONS, key=len, reverse=True)) + r")(?!\w)"
+)
+_FULL_DATE_PATTERN = re.compile(r"\b(?:(ngày|mùng|hôm)\s+)?(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4})\b")
+_SHORT_DATE_PATTERN = re.compile(r"\b(ngày|mùng|hôm|sáng|chiều|tối)\s+(\d{1,2})[/\-](\d{1,2})\b")
+_MONTH_PATTERN = re.compile(r"\btháng\s+(\d{1,2})\b")
+_TIME_PATTERN = re.compile(r"\b(\d{1,2})\s*(?:h|g|:)\s*(\d{2})(?:\s*(?:p|phút))?(?!\w)")
+_HOUR_PATTERN = re.compile(r"\b(\d{1,2})\s*h(?!\w)")
+# 5k, 2 k: nghìn (đọc trước khi mở rộng số)
+_THOUSAND_PATTERN = re.compile(r"(" + _NUMBER + r")\s?k(?!\w)")
+_VND_PATTERN = re.compile(r"(" + _NUMBER + r")\s*(?:đ|₫|vnđ|vnd|đồng)(?!\w)")
+_USD_PATTERN = re.compile(r"\$\s*(" + _NUMBER + r")|(" + _NUMBER + r")\s*(?:\$|usd)(?!\w)")
+_PERCENT_PATTERN = re.compile(r"(" + _NUMBER + r")\s*%")
+_UNIT_PATTERN = re.compile(
+    r"(" + _NUMBER + r")\s*(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")(?!\w)"
+)
+_ORDINAL_PATTERN = re.compile(r"\bthứ\s+(\d+)\b")
+_RANGE_PATTERN = re.compile(r"(\d)\s*-\s*(\d)")
+_NUMBER_PATTERN = re.compile(_NUMBER)
+_THOUSANDS_PATTERN = re.compile(r"\d{1,3}(?:\.\d{3})+")
+_DECIMAL_PATTERN = re.compile(r"(\d+)([.,])(\d+)")
+_SEPARATOR_PATTERN = re.compile(r"[.,]")
+_SYMBOL_PATTERN = re.compile(r"\s*([&+=])\s*")
+_SYMBOLS = {"&": " và ", "+": " cộng ", "=": " bằng "}
+_PUNCTUATION_PATTERN = re.compile(r"\s*([,.?!:;])(?:\s*[,.?!:;])*")
+_HYPHEN_PATTERN = re.compile(r"[-/]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _read_hundreds(n: int, full: bool) -> list:
+    """Đọc số 0-999; full=True khi đứng sau một nhóm lớn hơn (đọc cả 'không trăm', 'linh')"""
+    hundreds, tens, units = n // 100, n // 10 % 10, n % 10
+    words = []
+    if full or hundreds:
+        words += [_DIGITS[hundreds], "trăm"]
+    if tens == 0:
+        if units and (full or hundreds):
+            words.append("linh")
+    elif tens == 1:
+        words.append("mười")
+    else:
+        words += [_DIGITS[tens], "mươi"]
+    if units:
+        if units == 1 and tens >= 2:
+            words.append("mốt")
+        elif units == 4 and tens >= 2:
+            words.append("tư")
+        elif units == 5 and tens >= 1:
+            words.append("lăm")
+        else:
+            words.append(_DIGITS[units])
+    return words
+
+
+def _read_below_billion(n: int, full: bool) -> str:
+    words = []
+    for group, scale in (((n // 1000000) % 1000, "triệu"), ((n // 1000) % 1000, "nghìn"), (n % 1000, "")):
+        if group == 0:
+            continue
+        words += _read_hundreds(group, full=full or bool(words))
+        if scale:
+            words.append(scale)
+    return " ".join(words)
+
+
+def number_to_words(n: int) -> str:
+    """Đọc số nguyên thành chữ tiếng Việt, vd: 2025 -> 'hai nghìn không trăm hai mươi lăm'"""
+    if n < 0:
+        return "âm " + number_to_words(-n)
+    if n == 0:
+        return "không"
+    if n >= 1000000000:
+        high, low = divmod(n, 1000000000)
+        words = number_to_words(high) + " tỷ"
+        if low:
+            words += " " + _read_below_billion(low, full=True)
+        return words
+    return _read_below_billion(n, full=False)
+
+
+def digits_to_words(digits: str) -> str:
+    """Đọc từng chữ số (số điện thoại, mã số...)"""
+    return " ".join(_DIGITS[int(d)] for d in digits)
+
+
+def _expand_number(text: str) -> str:
+    # Dấu chấm ngăn cách hàng nghìn: 1.000.000
+    if _THOUSANDS_PATTERN.fullmatch(text):
+        return number_to_words(int(text.replace(".", "")))
+    # Phần thập phân dùng dấu phẩy (hoặc dấu chấm): 3,5 / 3.5
+    match = _DECIMAL_PATTERN.fullmatch(text)
+    if match:
+        integer, separator, fraction = match.groups()
+        fraction_words = digits_to_words(fraction) if fraction.startswith("0") or len(fraction) > 3 \
+            else number_to_words(int(fraction))
+        return f"{_expand_number(integer)} {'phẩy' if separator == ',' else 'chấm'} {fraction_words}"
+    if not text.isdigit():
+        return " ".join(_expand_number(part) for part in _SEPARATOR_PATTERN.split(text) if part)
+    # Số bắt đầu bằng 0 hoặc quá dài (số điện thoại, mã số) đọc từng chữ số
+    if (len(text) > 1 and text.startswith("0")) or len(text) > 12:
+        return digits_to_words(text)
+    return number_to_words(int(text))
+
+
+def _month_words(month: int) -> str:
+    return _MONTHS.get(month, number_to_words(month))
+
+
+def _replace_full_date(match) -> str:
+    prefix = match.group(1) or "ngày"
+    day, month, year = int(match.group(2)), int(match.group(3)), int(match.group(4))
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return match.group(0)
+    return f" {prefix} {number_to_words(day)} tháng {_month_words(month)} năm {number_to_words(year)} "
+
+
+def _replace_short_date(match) -> str:
+    prefix, day, month = match.group(1), int(match.group(2)), int(match.group(3))
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return match.group(0)
+    return f"{prefix} {number_to_words(day)} tháng {_month_words(month)}"
+
+
+def _replace_month(match) -> str:
+    month = int(match.group(1))
+    if not 1 <= month <= 12:
+        return match.group(0)
+    return f"tháng {_month_words(month)}"
+
+
+def _replace_time(match) -> str:
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 24 or minute > 59:
+        return match.group(0)
+    if minute == 0:
+        return f" {number_to_words(hour)} giờ "
+    return f" {number_to_words(hour)} giờ {number_to_words(minute)} phút "
+
+
+def _replace_hour(match) -> str:
+    hour = int(match.group(1))
+    if hour > 24:
+        return match.group(0)
+    return f" {number_to_words(hour)} giờ "
+
+
+def _replace_ordinal(match) -> str:
+    value = int(match.group(1))
+    return f"thứ {_ORDINALS.get(value, number_to_words(value))}"
+
+
+def _replace_title_abbreviation(match) -> str:
+    token, dot = match.group(1), match.group(2)
+    key = token.lower()
+    if key not in TITLE_ABBREVIATIONS or (not dot and token == key):
+        return match.group(0)
+    return f" {TITLE_ABBREVIATIONS[key]} "
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFC", text).translate(_TRANSLATION)
+    text = _TITLE_ABBREVIATION_PATTERN.sub(_replace_title_abbreviation, text).lower()
+    text = _ABBREVIATION_PATTERN.sub(lambda m: f" {ABBREVIATIONS[m.group(1)]} ", text)
+    text = _FULL_DATE_PATTERN.sub(_replace_full_date, text)
+    text = _SHORT_DATE_PATTERN.sub(_replace_short_date, text)
+    text = _MONTH_PATTERN.sub(_replace_month, text)
+    text = _TIME_PATTERN.sub(_replace_time, text)
+    text = _HOUR_PATTERN.sub(_replace_hour, text)
+    text = _THOUSAND_PATTERN.sub(lambda m: f" {_expand_number(m.group(1))} nghìn ", text)
+    text = _VND_PATTERN.sub(lambda m: f" {_expand_number(m.group(1))} đồng ", text)
+    text = _USD_PATTERN.sub(lambda m: f" {_expand_number(m.group(1) or m.group(2))} đô la ", text)
+    text = _PERCENT_PATTERN.sub(lambda m: f" {_expand_number(m.group(1))} phần trăm ", text)
+    text = _UNIT_PATTERN.sub(lambda m: f" {_expand_number(m.group(1))} {UNITS[m.group(2)]} ", text)
+    text = _ORDINAL_PATTERN.sub(_replace_ordinal, text)
+    text = _RANGE_PATTERN.sub(r"\1 đến \2", text)
+    text = _NUMBER_PATTERN.sub(lambda m: f" {_expand_number(m.group(0))} ", text)
+    text = _SYMBOL_PATTERN.sub(lambda m: _SYMBOLS[m.group(1)], text)
+    text = _HYPHEN_PATTERN.sub(" ", text)
+    # Gộp dấu câu liên tiếp và bỏ khoảng trắng trước dấu câu
+    text = _PUNCTUATION_PATTERN.sub(r"\1 ", text)
+    text = _WHITESPACE_PATTERN.sub(" ", text).strip()
+    return text.strip(",;: ")
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def _normalize_cached(text: str) -> str:
+    return _normalize(text)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa văn bản tiếng Việt cho TTS:
+    - Unicode NFC (tránh lệch dấu giữa dạng tổ hợp và dựng sẵn)
+    - Đọc số, ngày, giờ, tiền tệ, phần trăm, đơn vị đo thành chữ
+    - Mở rộng từ viết tắt, bỏ ký hiệu không đọc được, gộp khoảng trắng
+    Chuỗi ngắn được cache để các request lặp lại không phải xử lý lại
+    """
+    if not text:
+        return ""
+    if len(text) <= NORMALIZER_CACHE_MAX_LENGTH:
+        return _normalize_cached(text)
+    return _normalize(text)
+
+
+def normalizer_cache_info():
+    return _normalize_cached.cache_info()
@@ -0,0 +1,228 @@
+# Ghi span lồng nhau cho từng request (bật bằng TRACING_ENABLED), tóm tắt qua header Server-Timing
+# và ghi ra file JSON lines (trường theo mô hình span của OTLP) để phân tích sau
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from app.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Trace của request hiện tại và span đang mở (contextvars đi theo cả khi chạy trong threadpool)
+_current_trace: ContextVar[Optional[dict]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[dict]] = ContextVar("current_span", default=None)
+
+_SERVER_TIMING_NAME = re.compile(r"[^A-Za-z0-9_\-]")
+
+# Trace đã kết thúc chờ thread nền ghi ra TRACE_SINK_PATH (không ghi file trên event loop)
+_pending_traces: List[dict] = []
+_pending_lock = threading.Lock()
+# Giới hạn bộ đệm khi ghi file lỗi hoặc chậm kéo dài, trace cũ nhất bị bỏ
+_MAX_PENDING_TRACES = 10000
+# Số trace trong bộ đệm để đánh thức thread ghi sớm
+_WRITE_BATCH_SIZE = 100
+_WRITE_INTERVAL_SECONDS = 1.0
+
+_write_event = threading.Event()
+_stop_event = threading.Event()
+_writer_thread: Optional[threading.Thread] = None
+
+
+def start_trace(name: str, **attributes) -> dict:
+    """Bắt đầu trace cho request hiện tại, trả về trace để kết thúc bằng finish_trace"""
+    trace = {
+        "trace_id": uuid.uuid4().hex,
+        "spans": [],
+        "dropped": 0,
+    }
+    root = _new_span(trace, name, None, attributes)
+    trace["root"] = root
+    trace["tokens"] = (_current_trace.set(trace), _current_span.set(root))
+    return trace
+
+
+def finish_trace(trace: dict, **attributes) -> None:
+    root = trace["root"]
+    root["attributes"].update(attributes)
+    _end_span(trace, root)
+    trace_token, span_token = trace.pop("tokens")
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+
+
+def _new_span(trace: dict, name: str, parent: Optional[dict], attributes: dict) -> dict:
+    return {
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start_ns": time.time_ns(),
+        "start": time.perf_counter(),
+        "end_ns": None,
+        "duration": None,
+        "attributes": dict(attributes),
+    }
+
+
+def _end_span(trace: dict, item: dict) -> None:
+    item["duration"] = time.perf_counter() - item["start"]
+    item["end_ns"] = item["start_ns"] + int(item["duration"] * 1e9)
+    if len(trace["spans"]) < settings.TRACE_MAX_SPANS:
+        trace["spans"].append(item)
+    else:
+        trace["dropped"] += 1
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Mở span con của span hiện tại; không làm gì nếu request không được trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    item = _new_span(trace, name, _current_span.get(), attributes)
+    token = _current_span.set(item)
+    try:
+        yield item
+    except BaseException as e:
+        item["attributes"]["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        _end_span(trace, item)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator bọc cả hàm trong một span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(trace: dict) -> str:
+    """Tóm tắt trace thành header Server-Timing: tổng thời gian theo tên span (ms) và số lần"""
+    totals = {}
+    for item in trace["spans"]:
+        if item is trace["root"]:
+            continue
+        key = _SERVER_TIMING_NAME.sub("_", item["name"])
+        total, count = totals.get(key, (0.0, 0))
+        totals[key] = (total + item["duration"], count + 1)
+    entries = [
+        f'{key};dur={total * 1000:.1f};desc="x{count}"'
+        for key, (total, count) in sorted(totals.items(), key=lambda entry: -entry[1][0])
+    ]
+    entries.append(f"total;dur={trace['root']['duration'] * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def export_trace(trace: dict) -> None:
+    """Đưa trace vào bộ đệm để thread nền ghi ra TRACE_SINK_PATH (không truy cập file)"""
+    if not settings.TRACE_SINK_PATH:
+        return
+    with _pending_lock:
+        _pending_traces.append(trace)
+        if len(_pending_traces) > _MAX_PENDING_TRACES:
+            del _pending_traces[:len(_pending_traces) - _MAX_PENDING_TRACES]
+        pending_count = len(_pending_traces)
+    if pending_count >= _WRITE_BATCH_SIZE:
+        _write_event.set()
+
+
+def _trace_lines(trace: dict) -> List[str]:
+    return [
+        json.dumps({
+            "traceId": trace["trace_id"],
+            "spanId": item["span_id"],
+            "parentSpanId": item["parent_id"] or "",
+            "name": item["name"],
+            "startTimeUnixNano": item["start_ns"],
+            "endTimeUnixNano": item["end_ns"],
+            "attributes": item["attributes"],
+        }, ensure_ascii=False, default=str)
+        for item in trace["spans"]
+    ]
+
+
+def flush_traces() -> int:
+    """Ghi các trace trong bộ đệm ra TRACE_SINK_PATH, mỗi dòng một span; trả về số trace đã ghi"""
+    global _pending_traces
+    with _pending_lock:
+        if not _pending_traces:
+            return 0
+        traces = _pending_traces
+        _pending_traces = []
+    try:
+        lines = [line for trace in traces for line in _trace_lines(trace)]
+        directory = os.path.dirname(settings.TRACE_SINK_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(settings.TRACE_SINK_PATH, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return len(traces)
+    except Exception as e:
+        logger.error("Lỗi khi ghi trace ra %s: %s", settings.TRACE_SINK_PATH, e)
+        return 0
+
+
+def _writer_loop() -> None:
+    while not _stop_event.is_set():
+        _write_event.wait(_WRITE_INTERVAL_SECONDS)
+        _write_event.clear()
+        flush_traces()
+    # Ghi nốt phần còn lại khi dừng
+    flush_traces()
+
+
+def start_trace_writer() -> None:
+    """Khởi động thread nền ghi trace (chỉ khi bật TRACING_ENABLED và có TRACE_SINK_PATH)"""
+    global _writer_thread
+    if not (settings.TRACING_ENABLED and settings.TRACE_SINK_PATH):
+        return
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    _stop_event.clear()
+    _writer_thread = threading.Thread(target=_writer_loop, name="trace-writer", daemon=True)
+    _writer_thread.start()
+
+
+def stop_trace_writer(timeout: float = 5.0) -> None:
+    global _writer_thread
+    _stop_event.set()
+    _write_event.set()
+    if _writer_thread is not None:
+        _writer_thread.join(timeout)
+        _writer_thread = None
+
+
+async def tracing_middleware(request, call_next):
+    """Middleware HTTP: trace toàn bộ request khi TRACING_ENABLED, thêm header Server-Timing"""
+    if not settings.TRACING_ENABLED:
+        return await call_next(request)
+    trace = start_trace(f"{request.method} {request.url.path}", method=request.method, path=request.url.path)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        finish_trace(trace, status=status_code)
+        export_trace(trace)
+    response.headers["Server-Timing"] = server_timing(trace)
+    response.headers["X-Trace-Id"] = trace["trace_id"]
+    return response
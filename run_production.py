@@ -0,0 +1,170 @@
+"""
+Chạy API cho production với nhiều worker (pre-fork):
+- Tiến trình chính import ứng dụng một lần (model MMS-TTS, librosa/scipy, bảng chuẩn hóa văn bản...) rồi mới fork worker,
+  các worker dùng chung bộ nhớ đó theo cơ chế copy-on-write thay vì mỗi worker tự tải một bản model
+- Số thread của torch/BLAS mỗi worker = số CPU / số worker để các worker không tranh nhau CPU
+- SIGTERM/SIGINT: worker ngừng nhận kết nối mới, xử lý nốt request đang chạy (tối đa --drain-timeout giây)
+  rồi chạy shutdown (ghi nốt sổ cái credits, log...); worker chết bất thường được khởi động lại
+Sử dụng:
+    python run_production.py --host 0.0.0.0 --port 60074 --workers 4
+    python run_production.py --workers 4 --no-preload   # mỗi worker tự import ứng dụng (để so sánh bộ nhớ)
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+
+# Biến môi trường điều khiển số thread của các thư viện tính toán, phải đặt trước khi import numpy/torch
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chạy API production với nhiều worker dùng chung model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=60074)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Số thread torch/BLAS mỗi worker (mặc định: số CPU / số worker, tối thiểu 1)")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Thời gian tối đa chờ request đang chạy hoàn thành khi tắt (giây)")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Không import ứng dụng trước khi fork (mỗi worker tự tải model như cách chạy cũ)")
+    parser.add_argument("--log-level", default="warning", help="Mức log của uvicorn")
+    return parser.parse_args()
+
+
+def log(message):
+    print(f"[launcher {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def run_worker(config, sock, threads):
+    """Chạy trong tiến trình con sau khi fork"""
+    import random
+    import uvicorn
+
+    # Bỏ handler của tiến trình chính, uvicorn tự đăng ký handler để dừng êm khi nhận SIGTERM/SIGINT
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Các worker không dùng chung trạng thái sinh số ngẫu nhiên của tiến trình chính
+    random.seed()
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    if not server.started:
+        # Lỗi khi startup: thoát với mã lỗi để tiến trình chính biết và khởi động lại
+        os._exit(3)
+
+
+def main():
+    args = parse_args()
+    workers = max(1, args.workers)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+    import gc
+    import uvicorn
+
+    # Tạo bảng một lần ở tiến trình chính, các worker cùng chạy create_all sẽ tranh nhau tạo bảng
+    os.environ["INIT_DB_ON_STARTUP"] = "false"
+    if args.no_preload:
+        target = "app.main:app"
+    else:
+        from app.main import app as target
+    # init_db.py import mọi model nên chạy được cả khi không preload ứng dụng
+    from app.database.connection import engine
+    from app.database.init_db import init_db
+    init_db()
+    # Không để worker dùng chung kết nối database đã mở trong tiến trình chính
+    engine.dispose()
+
+    if not args.no_preload:
+        from app.utils.logger import shutdown_logging
+
+        # Thread ghi log không tồn tại trong tiến trình con sau khi fork, worker tự khởi động lại khi startup
+        shutdown_logging()
+        # Chuyển các object đã tạo sang thế hệ cố định để GC không ghi vào chúng (tránh copy-on-write các trang nhớ)
+        gc.collect()
+        gc.freeze()
+
+    config = uvicorn.Config(
+        target,
+        host=args.host,
+        port=args.port,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=args.drain_timeout,
+    )
+    sock = config.bind_socket()
+
+    children = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(config, sock, threads)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            log(f"Nhận tín hiệu {signal.Signals(signum).name}, dừng {len(children)} worker...")
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    log(f"{workers} worker trên {args.host}:{args.port}, {threads} thread torch/BLAS mỗi worker, "
+        f"{'preload' if not args.no_preload else 'không preload'}")
+
+    last_restart = {}
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        log(f"Worker {pid} dừng bất thường (status {status}), khởi động lại")
+        # Tránh khởi động lại liên tục nếu worker chết ngay khi chạy
+        if time.monotonic() - last_restart.get(slot, 0) < 1:
+            time.sleep(1)
+        last_restart[slot] = time.monotonic()
+        spawn(slot)
+
+    for pid in list(children):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            children.pop(pid, None)
+    deadline = time.monotonic() + args.drain_timeout + 10
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+        else:
+            children.pop(pid, None)
+    for pid in children:
+        log(f"Worker {pid} chưa dừng sau {args.drain_timeout + 10:.0f}s, buộc dừng")
+        os.kill(pid, signal.SIGKILL)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Đo thời gian giải mã file audio theo từng định dạng và backend
+Sử dụng:
+    python scripts/benchmark_audio_decode.py --duration 3 --repeat 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from app.database import audio_decoder
+from app.database.audio_decoder import decode_audio, resolve_ffmpeg
+
+SOURCE_SR = 44100
+TARGET_SR = 22050
+
+
+def make_signal(duration):
+    """Tín hiệu stereo giả lập giọng nói: vài họa âm điều biên + nhiễu nhẹ"""
+    t = np.arange(int(duration * SOURCE_SR)) / SOURCE_SR
+    voice = sum(0.2 / k * np.sin(2 * np.pi * 180 * k * t) for k in range(1, 6))
+    voice *= 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    rng = np.random.default_rng(0)
+    left = voice + 0.01 * rng.standard_normal(len(t))
+    right = voice + 0.01 * rng.standard_normal(len(t))
+    return np.stack([left, right], axis=1).astype(np.float32)
+
+
+def write_samples(directory, audio):
+    """Tạo file mẫu cho các định dạng mà môi trường hiện tại ghi được"""
+    samples = {}
+    writers = {
+        "wav": {"format": "WAV", "subtype": "PCM_16"},
+        "flac": {"format": "FLAC", "subtype": "PCM_16"},
+        "ogg": {"format": "OGG", "subtype": "VORBIS"},
+        "mp3": {"format": "MP3", "subtype": "MPEG_LAYER_III"},
+    }
+    for ext, kwargs in writers.items():
+        path = os.path.join(directory, f"sample.{ext}")
+        try:
+            sf.write(path, audio, SOURCE_SR, **kwargs)
+            samples[ext] = path
+        except Exception as e:
+            print(f"Bỏ qua {ext}: libsndfile không ghi được ({e})")
+
+    ffmpeg_binary = resolve_ffmpeg()
+    if ffmpeg_binary and "wav" in samples:
+        path = os.path.join(directory, "sample.m4a")
+        result = subprocess.run(
+            [ffmpeg_binary, "-y", "-v", "error", "-i", samples["wav"], "-c:a", "aac", path],
+            capture_output=True
+        )
+        if result.returncode == 0:
+            samples["m4a"] = path
+    return samples
+
+
+def legacy_convert(path, directory):
+    """Luồng cũ: librosa.load -> int16 -> ghi WAV tạm -> đọc lại và resample khi ghép câu"""
+    y, sr = librosa.load(path, sr=None)
+    temp_path = os.path.join(directory, "legacy.temp.wav")
+    sf.write(temp_path, (y * 32767).astype(np.int16), sr, format="WAV")
+    y, sr = librosa.load(temp_path, sr=None)
+    return librosa.resample(y, orig_sr=sr, target_sr=TARGET_SR)
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark giải mã audio")
+    parser.add_argument("--duration", type=float, default=3.0, help="Độ dài file mẫu (giây)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        samples = write_samples(directory, make_signal(args.duration))
+        backends = ["soundfile"] + (["av"] if audio_decoder.av is not None else [])
+        if resolve_ffmpeg():
+            backends.append("ffmpeg")
+
+        print(f"\n=== {args.duration:.1f}s, {SOURCE_SR}Hz stereo -> {TARGET_SR}Hz mono, median {args.repeat} lần ===")
+        print(f"{'định dạng':<10}{'kích thước':>12}{'legacy (ms)':>14}{'decode_audio (ms)':>20}  backend")
+        for ext, path in samples.items():
+            size = os.path.getsize(path)
+            try:
+                legacy_ms = f"{measure(lambda: legacy_convert(path, directory), args.repeat):.2f}"
+            except Exception:
+                legacy_ms = "lỗi"
+            try:
+                backend = audio_decoder.probe_audio(path)["backend"]
+                new_ms = f"{measure(lambda: decode_audio(path, target_sr=TARGET_SR), args.repeat):.2f}"
+            except Exception as e:
+                backend, new_ms = f"lỗi: {e}", "-"
+            print(f"{ext:<10}{size:>12}{legacy_ms:>14}{new_ms:>20}  {backend}")
+
+        if "ffmpeg" in backends:
+            print("\nffmpeg (pipe f32le, không ghi file tạm):")
+            for ext, path in samples.items():
+                ms = measure(lambda: audio_decoder._decode_ffmpeg(path, TARGET_SR), args.repeat)
+                print(f"{ext:<10}{ms:>12.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
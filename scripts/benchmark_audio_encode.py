@@ -0,0 +1,70 @@
+"""
+Đo kích thước (byte/giây audio) và chi phí CPU khi mã hóa đầu ra theo từng định dạng
+Sử dụng:
+    python scripts/benchmark_audio_encode.py --duration 10 --sample-rate 22050
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+
+import numpy as np
+
+from app.utils.audio_encoder import available_formats, encode_audio_stream
+
+
+def make_speech_like(duration, sr):
+    """Tín hiệu giả lập giọng nói: họa âm với cao độ thay đổi, điều biên theo âm tiết + nhiễu"""
+    t = np.arange(int(duration * sr)) / sr
+    pitch = 160 + 40 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    voice = sum(0.25 / k * np.sin(k * phase) for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    rng = np.random.default_rng(0)
+    return (voice * envelope + 0.005 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mã hóa audio đầu ra")
+    parser.add_argument("--duration", type=float, default=10.0, help="Độ dài audio (giây)")
+    parser.add_argument("--sample-rate", type=int, default=22050)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    audio = make_speech_like(args.duration, args.sample_rate)
+    print(f"\n=== {args.duration:.1f}s mono {args.sample_rate}Hz, median {args.repeat} lần ===")
+    print(f"{'định dạng':<10}{'byte/giây':>12}{'kbps':>10}{'so với WAV':>12}{'CPU ms/giây audio':>20}{'byte đầu tiên (ms)':>20}")
+
+    wav_rate = None
+    for format_name in available_formats():
+        cpu_costs = []
+        first_chunk_ms = []
+        size = 0
+        for _ in range(args.repeat):
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            size = 0
+            first = None
+            for chunk in encode_audio_stream(audio, args.sample_rate, format_name):
+                if first is None:
+                    first = (time.perf_counter() - started) * 1000
+                size += len(chunk)
+            cpu_costs.append((time.process_time() - cpu_started) * 1000 / args.duration)
+            first_chunk_ms.append(first)
+        bytes_per_second = size / args.duration
+        if format_name == "wav":
+            wav_rate = bytes_per_second
+        ratio = f"{wav_rate / bytes_per_second:.1f}x" if wav_rate else "-"
+        print(
+            f"{format_name:<10}{bytes_per_second:>12.0f}{bytes_per_second * 8 / 1000:>10.1f}{ratio:>12}"
+            f"{float(np.median(cpu_costs)):>20.2f}{float(np.median(first_chunk_ms)):>20.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
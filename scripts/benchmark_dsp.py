@@ -0,0 +1,228 @@
+"""
+Benchmark các hàm xử lý âm thanh của voice_service trên tín hiệu giả lập giọng nói (tái lập được nhờ seed cố định)
+- Từng hàm: process_audio_for_vocabulary, denoise_audio, smooth_audio_transitions, trim_silence,
+  enhance_voice, normalize_audio theo từng sample rate
+- Ghép câu đầy đủ (text_to_speech) theo độ dài câu, cache cụm từ được xóa trước mỗi lần đo
+- Database là SQLite trong bộ nhớ (DATABASE_URL=sqlite://), thư mục profile/kết quả là thư mục tạm
+Kết quả (median/min, ms) được ghi ra file JSON làm baseline; các lần chạy sau so với baseline
+và trả về exit code 1 nếu có phép đo chậm hơn quá ngưỡng.
+Sử dụng:
+    python scripts/benchmark_dsp.py --baseline dsp_baseline.json --update-baseline
+    python scripts/benchmark_dsp.py --baseline dsp_baseline.json --threshold 0.2
+    python scripts/benchmark_dsp.py --lengths 1,10,100 --sample-rates 22050 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+# Cấu hình phải có trước khi import app: database trong bộ nhớ, thư mục dữ liệu tạm
+WORK_DIR = tempfile.mkdtemp(prefix="benchmark_dsp_")
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ["VOICE_PROFILES_DIR"] = os.path.join(WORK_DIR, "voice_profiles")
+os.environ["AUDIO_TEMP_DIR"] = os.path.join(WORK_DIR, "outputs")
+# Đo đường xử lý clip đầy đủ, không dùng kho clip dùng chung giữa các worker
+os.environ["CLIP_STORE_ENABLED"] = "false"
+
+import numpy as np
+import scipy
+import librosa
+import soundfile as sf
+
+from app.database.connection import Base, SessionLocal, engine
+from app.models.user import User
+from app.models.voice_library.vocabulary import Vocabulary, VoiceProfile
+from app.database.audio_format import set_profile_format
+from app.database.phrase_cache import discard_phrases
+from app.database.voice_service import (
+    VOICE_PROFILES_DIR, denoise_audio, enhance_voice, normalize_audio, process_audio_for_vocabulary,
+    smooth_audio_transitions, text_to_speech, trim_silence
+)
+
+ONSETS = ["b", "c", "d", "g", "h", "l", "m", "n", "s", "t"]
+RHYMES = ["a", "an", "o", "ong", "u", "anh"]
+# Từ vựng của profile benchmark: 60 âm tiết chỉ gồm chữ cái để bộ chuẩn hóa văn bản giữ nguyên
+WORDS = [onset + rhyme for onset in ONSETS for rhyme in RHYMES]
+USER_ID = 1
+
+
+def make_word_clip(sr, seed, duration=0.35, silence=0.1):
+    """Một "từ" giả lập: khoảng lặng hai đầu, họa âm với cao độ lượn, điều biên theo âm tiết, nhiễu nền nhẹ"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    base = 120 + 80 * rng.random()
+    pitch = base + 30 * np.sin(2 * np.pi * (1 + rng.random()) * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    voice = sum(0.3 / k * np.sin(k * phase) for k in range(1, 10))
+    voice *= np.hanning(len(t)) ** 0.5
+    pad = np.zeros(int(silence * sr))
+    audio = np.concatenate([pad, voice, pad])
+    audio += 0.003 * rng.standard_normal(len(audio))
+    return audio.astype(np.float32)
+
+
+def make_sentence(length, seed):
+    rng = np.random.default_rng(seed)
+    return " ".join(rng.choice(WORDS, size=length))
+
+
+def measure(func, repeat, prepare=None):
+    """Chạy func một lần để làm nóng rồi đo repeat lần, trả về thời gian (ms) của từng lần"""
+    if prepare:
+        prepare()
+    func()
+    timings = []
+    for _ in range(repeat):
+        if prepare:
+            prepare()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def create_profile(db, profile_id, sr):
+    """Tạo profile với đủ WORDS, clip ghi sẵn ở sample rate sr (cũng là định dạng chuẩn của profile)"""
+    profile_dir = VOICE_PROFILES_DIR / f"user_{USER_ID}" / f"profile_{profile_id}"
+    os.makedirs(profile_dir, exist_ok=True)
+    set_profile_format(profile_dir, sr)
+    db.add(VoiceProfile(id=profile_id, user_id=USER_ID, name=f"benchmark {sr}Hz"))
+    for index, word in enumerate(WORDS):
+        path = profile_dir / f"{word}.wav"
+        clip, _ = librosa.effects.trim(make_word_clip(sr, index), top_db=40)
+        sf.write(str(path), clip, sr, subtype="PCM_16")
+        db.add(Vocabulary(voice_profile_id=profile_id, word=word, audio_path=str(path)))
+    db.commit()
+
+
+def run_suite(sample_rates, lengths, repeat):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(id=USER_ID, username="benchmark", password="-", email="benchmark@example.com", credits=0))
+    db.commit()
+
+    results = {}
+
+    def record(name, timings):
+        results[name] = {
+            "median_ms": round(float(np.median(timings)), 3),
+            "min_ms": round(float(np.min(timings)), 3),
+            "runs": len(timings),
+        }
+        print(f"{name:<44}{results[name]['median_ms']:>12.2f}{results[name]['min_ms']:>12.2f}")
+
+    print(f"{'phép đo':<44}{'median ms':>12}{'min ms':>12}")
+    for profile_id, sr in enumerate(sample_rates, start=1):
+        # Clip một từ (có khoảng lặng hai đầu) và một câu ngắn ~3 giây cho các hàm xử lý cả đoạn
+        word = make_word_clip(sr, 1000)
+        phrase = np.concatenate([make_word_clip(sr, 1000 + i) for i in range(6)])
+        raw_path = os.path.join(WORK_DIR, f"raw_{sr}.wav")
+        work_path = os.path.join(WORK_DIR, f"work_{sr}.wav")
+        sf.write(raw_path, word, sr, subtype="PCM_16")
+
+        record(f"process_audio_for_vocabulary/sr={sr}",
+               measure(lambda: process_audio_for_vocabulary(raw_path), repeat))
+        record(f"denoise_audio/sr={sr}", measure(lambda: denoise_audio(phrase, sr), repeat))
+        first, second = make_word_clip(sr, 1), make_word_clip(sr, 2)
+        record(f"smooth_audio_transitions/sr={sr}",
+               measure(lambda: smooth_audio_transitions(first, second, sr), repeat))
+        # trim_silence ghi đè file nên chép lại file gốc trước mỗi lần đo (không tính vào thời gian)
+        record(f"trim_silence/sr={sr}",
+               measure(lambda: trim_silence(work_path), repeat, prepare=lambda: shutil.copyfile(raw_path, work_path)))
+        record(f"enhance_voice/sr={sr}", measure(lambda: enhance_voice(phrase, sr), repeat))
+        record(f"normalize_audio/sr={sr}", measure(lambda: normalize_audio(phrase), repeat))
+
+        create_profile(db, profile_id, sr)
+        for length in lengths:
+            text = make_sentence(length, length)
+            record(
+                f"text_to_speech/sr={sr}/words={length}",
+                measure(
+                    lambda: text_to_speech(profile_id, USER_ID, text, db),
+                    repeat,
+                    # Đo đường ghép đầy đủ, không dùng cụm từ đã ghép sẵn từ lần chạy trước
+                    prepare=lambda: discard_phrases(profile_id),
+                ),
+            )
+    db.close()
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def compare(results, baseline, threshold):
+    """In bảng so sánh với baseline, trả về danh sách phép đo chậm hơn quá ngưỡng"""
+    regressions = []
+    print(f"\n{'phép đo':<44}{'baseline':>12}{'hiện tại':>12}{'thay đổi':>10}")
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<44}{'-':>12}{current['median_ms']:>12.2f}{'mới':>10}")
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1 if previous["median_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  <-- chậm hơn"
+        print(f"{name:<44}{previous['median_ms']:>12.2f}{current['median_ms']:>12.2f}{change:>+10.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark các hàm xử lý âm thanh của voice_service")
+    parser.add_argument("--sample-rates", default="16000,22050,44100", help="Danh sách sample rate, cách nhau bởi dấu phẩy")
+    parser.add_argument("--lengths", default="1,10,100,1000", help="Số từ mỗi câu khi đo text_to_speech")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi phép (lấy median)")
+    parser.add_argument("--baseline", help="File JSON baseline để so sánh")
+    parser.add_argument("--update-baseline", action="store_true", help="Ghi kết quả lần này làm baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Ngưỡng chậm hơn baseline bị coi là regression (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    sample_rates = [int(value) for value in args.sample_rates.split(",")]
+    lengths = [int(value) for value in args.lengths.split(",")]
+    try:
+        results = run_suite(sample_rates, lengths, args.repeat)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    if not args.baseline:
+        return 0
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nĐã ghi baseline: {args.baseline}")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != report["environment"]:
+        print("\nCảnh báo: baseline được đo trên môi trường khác, so sánh có thể không chính xác")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} phép đo chậm hơn baseline quá {args.threshold:.0%}")
+        return 1
+    print(f"\nKhông có phép đo nào chậm hơn baseline quá {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Đo chi phí log trên thread xử lý request cho mỗi câu tổng hợp:
+- print: ghi trực tiếp ra stdout như trước đây (mỗi từ một dòng "Đang đọc file ...")
+- logging ở mức INFO: các bản ghi DEBUG theo từng từ bị bỏ ngay tại chỗ gọi
+- logging ở mức DEBUG: bản ghi được đưa vào hàng đợi, thread nền định dạng và ghi ra stdout
+Dùng --sink-latency-ms để giả lập stdout bị nghẽn (pipe tới log driver chậm)
+Sử dụng:
+    python scripts/benchmark_logging.py --sentences 2000 --words 12
+    python scripts/benchmark_logging.py --sink-latency-ms 0.2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+
+from app.utils.logger import get_logger, set_debug_sample_rate, set_log_level, setup_logging, shutdown_logging
+
+logger = get_logger("app.benchmark")
+
+
+class SlowSink:
+    """Stream ghi ra file, mỗi lần write chờ thêm một khoảng để giả lập stdout chậm"""
+
+    def __init__(self, path, latency):
+        self.file = open(path, "w", encoding="utf-8")
+        self.latency = latency
+
+    def write(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def sentence_with_print(words, sentence):
+    for i in range(words):
+        print(f"Đang đọc file: data/voice_profiles/1/tu_{i}.wav")
+    print("Đang kết hợp các từ...")
+    print(f"Đã lưu file audio: app/temp/audio/cau_{sentence}.wav")
+
+
+def sentence_with_logging(words, sentence):
+    for i in range(words):
+        logger.debug("Đang đọc file: %s", f"data/voice_profiles/1/tu_{i}.wav")
+    logger.debug("Đang kết hợp các từ...")
+    logger.info("Đã lưu file audio: %s", f"app/temp/audio/cau_{sentence}.wav")
+
+
+def run(func, sentences, words):
+    started = time.perf_counter()
+    for sentence in range(sentences):
+        func(words, sentence)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chi phí log trên mỗi câu tổng hợp")
+    parser.add_argument("--sentences", type=int, default=2000, help="Số câu mỗi lần đo")
+    parser.add_argument("--words", type=int, default=12, help="Số từ mỗi câu (mỗi từ một dòng log DEBUG)")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.0, help="Độ trễ mỗi lần ghi ra stdout (ms)")
+    parser.add_argument("--output", default=os.devnull, help="Nơi ghi log thay cho stdout")
+    args = parser.parse_args()
+
+    real_stdout = sys.stdout
+    sink = SlowSink(args.output, args.sink_latency_ms / 1000)
+    sys.stdout = sink
+    try:
+        print_time = run(sentence_with_print, args.sentences, args.words)
+
+        setup_logging()
+        results = []
+        for label, level, rate in [
+            ("logging INFO", "INFO", 1.0),
+            ("logging DEBUG (lấy mẫu 10%)", "DEBUG", 0.1),
+            ("logging DEBUG", "DEBUG", 1.0),
+        ]:
+            set_log_level("app", level)
+            set_debug_sample_rate(rate)
+            results.append((label, run(sentence_with_logging, args.sentences, args.words)))
+        drain_started = time.perf_counter()
+        shutdown_logging()
+        drain_time = time.perf_counter() - drain_started
+    finally:
+        sys.stdout = real_stdout
+        sink.close()
+
+    print(f"{args.sentences} câu x {args.words} từ, độ trễ stdout {args.sink_latency_ms} ms/lần ghi")
+    print(f"{'print':<30} {print_time * 1e6 / args.sentences:10.1f} µs/câu")
+    for label, elapsed in results:
+        saved = 1 - elapsed / print_time if print_time else 0.0
+        print(f"{label:<30} {elapsed * 1e6 / args.sentences:10.1f} µs/câu  (giảm {saved:.0%})")
+    print(f"Thời gian thread nền ghi nốt hàng đợi khi tắt: {drain_time:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
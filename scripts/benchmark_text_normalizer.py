@@ -0,0 +1,94 @@
+"""
+Đo tốc độ chuẩn hóa văn bản trên một corpus lớn (mặc định là corpus tổng hợp)
+- cold: mỗi câu chỉ xuất hiện một lần, bỏ qua cache
+- warm: corpus có nhiều câu lặp lại (giống traffic thật), đi qua cache
+Sử dụng:
+    python scripts/benchmark_text_normalizer.py --sentences 50000
+    python scripts/benchmark_text_normalizer.py --corpus path/to/corpus.txt
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+
+from app.utils import text_normalizer
+from app.utils.text_normalizer import normalize_text, normalizer_cache_info
+
+TEMPLATES = [
+    "Xin chào, hôm nay là ngày {d}/{m}/{y} và bây giờ là {h}h{mi}.",
+    "Giá sản phẩm là {money}đ, giảm {p}% chỉ còn ${usd}.",
+    "UBND TP.HCM thông báo lịch họp lúc {h}:{mi} ngày {d}/{m}.",
+    "Quãng đường dài {n},{frac}km, mất khoảng {a}-{b} tiếng.",
+    "Vui lòng gọi {phone} để được hỗ trợ, thứ {wd} hàng tuần.",
+    "Năm {y} trường THPT có {n} học sinh đạt giải, tăng {p}%.",
+    "Cảm ơn bạn rất nhiều, hẹn gặp lại vào tháng {m} nhé!",
+]
+
+
+def make_corpus(count, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        template = rng.choice(TEMPLATES)
+        corpus.append(template.format(
+            d=rng.randint(1, 28), m=rng.randint(1, 12), y=rng.randint(1990, 2030),
+            h=rng.randint(0, 23), mi=f"{rng.randint(0, 59):02d}",
+            money=f"{rng.randint(1, 999) * 1000:,}".replace(",", "."),
+            p=rng.randint(1, 99), usd=rng.randint(1, 500),
+            n=rng.randint(1, 5000), frac=rng.randint(1, 9),
+            a=rng.randint(1, 4), b=rng.randint(5, 9),
+            phone="09" + "".join(str(rng.randint(0, 9)) for _ in range(8)),
+            wd=rng.randint(2, 7),
+        ))
+    return corpus
+
+
+def run(corpus, func):
+    started = time.perf_counter()
+    for text in corpus:
+        func(text)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chuẩn hóa văn bản tiếng Việt")
+    parser.add_argument("--sentences", type=int, default=50000, help="Số câu của corpus tổng hợp")
+    parser.add_argument("--corpus", help="File văn bản (mỗi dòng một câu) thay cho corpus tổng hợp")
+    parser.add_argument("--unique", type=int, default=500, help="Số câu khác nhau trong lượt warm")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = make_corpus(args.sentences)
+    characters = sum(len(text) for text in corpus)
+    print(f"\n=== {len(corpus)} câu, {characters} ký tự ===")
+
+    # Cold: gọi thẳng hàm chuẩn hóa không qua cache
+    elapsed = run(corpus, text_normalizer._normalize)
+    print(f"cold : {elapsed * 1000:9.1f} ms  {len(corpus) / elapsed:10.0f} câu/s  {characters / elapsed / 1e6:6.2f} M ký tự/s")
+
+    # Warm: corpus lặp lại một tập nhỏ câu, đi qua cache
+    rng = random.Random(1)
+    pool = corpus[:args.unique]
+    repeated = [rng.choice(pool) for _ in range(len(corpus))]
+    text_normalizer._normalize_cached.cache_clear()
+    elapsed = run(repeated, normalize_text)
+    repeated_characters = sum(len(text) for text in repeated)
+    print(f"warm : {elapsed * 1000:9.1f} ms  {len(repeated) / elapsed:10.0f} câu/s  {repeated_characters / elapsed / 1e6:6.2f} M ký tự/s")
+    print(f"cache: {normalizer_cache_info()}")
+
+    print("\nVí dụ:")
+    for text in corpus[:3]:
+        print(f"  {text}\n  -> {normalize_text(text)}")
+
+
+if __name__ == "__main__":
+    main()
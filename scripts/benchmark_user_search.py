@@ -0,0 +1,113 @@
+"""
+Đo thời gian tìm kiếm user trên bảng lớn (mặc định 1 triệu user)
+Sử dụng:
+    python scripts/benchmark_user_search.py --db-url sqlite:////tmp/bench_users.db --users 1000000
+    python scripts/benchmark_user_search.py --db-url mysql+pymysql://root:@127.0.0.1/db_tts_bench --fulltext
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Thêm thư mục gốc vào sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("API_KEY", "benchmark")
+
+from sqlalchemy import create_engine, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database.connection import Base
+from app.models.user import User
+import app.models.voice_library.vocabulary  # noqa: F401
+
+
+def seed_users(engine, total, batch_size=20000):
+    """Tạo dữ liệu user giả lập nếu bảng chưa đủ số lượng"""
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        existing = db.query(func.count(User.id)).scalar()
+    finally:
+        db.close()
+    if existing >= total:
+        print(f"Bảng users đã có {existing} bản ghi, bỏ qua bước tạo dữ liệu")
+        return
+
+    print(f"Đang tạo {total - existing} user...")
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for start in range(existing, total, batch_size):
+            rows = [
+                {
+                    "username": f"user{i:07d}",
+                    "password": "x",
+                    "email": f"mail{i:07d}@example{i % 97}.com",
+                    "credits": 0,
+                    "usertype": "user",
+                    "active": True,
+                }
+                for i in range(start, min(start + batch_size, total))
+            ]
+            conn.execute(insert(User), rows)
+    print(f"Đã tạo dữ liệu trong {time.perf_counter() - started:.1f}s")
+
+
+def legacy_search(db, keyword, skip, limit):
+    """Truy vấn cũ: ILIKE '%kw%' trên cả hai cột với OFFSET"""
+    return db.query(User).filter(
+        (User.username.ilike(f"%{keyword}%")) |
+        (User.email.ilike(f"%{keyword}%"))
+    ).offset(skip).limit(limit).all()
+
+
+def measure(label, fn, repeat):
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(fn())
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<48} median {statistics.median(timings):9.2f} ms   min {min(timings):9.2f} ms   rows {rows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tìm kiếm user")
+    parser.add_argument("--db-url", default="sqlite:////tmp/bench_users.db")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fulltext", action="store_true", help="Bật đo chế độ FULLTEXT (chỉ MySQL)")
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url)
+    Base.metadata.create_all(bind=engine, tables=[User.__table__])
+    seed_users(engine, args.users)
+
+    # Import sau khi đã cấu hình để search_users đọc đúng settings
+    settings.USER_SEARCH_FULLTEXT = args.fulltext
+    if args.fulltext and engine.dialect.name == "mysql":
+        import app.database.init_db as init_db_module
+        init_db_module.engine = engine
+        init_db_module.ensure_user_fulltext_index()
+    from app.database.user_crud import search_users
+
+    db = sessionmaker(bind=engine)()
+    deep_offset = args.users // 2
+    deep_after_id = deep_offset
+    try:
+        print(f"\n=== {engine.dialect.name}, {args.users} user ===")
+        measure("legacy ILIKE '%user0012345%'", lambda: legacy_search(db, "user0012345", 0, 100), args.repeat)
+        measure("legacy ILIKE '%example1%' offset sâu", lambda: legacy_search(db, "example1", deep_offset // 10, 100), args.repeat)
+        measure("prefix 'user0012345'", lambda: search_users(db, "user0012345", limit=100, mode="prefix"), args.repeat)
+        measure("prefix 'mail0999'", lambda: search_users(db, "mail0999", limit=100, mode="prefix"), args.repeat)
+        measure("substring 'user0012345'", lambda: search_users(db, "user0012345", limit=100, mode="substring"), args.repeat)
+        measure("prefix 'user' offset sâu", lambda: search_users(db, "user", skip=deep_offset, limit=100, mode="prefix"), args.repeat)
+        measure("prefix 'user' keyset sâu", lambda: search_users(db, "user", after_id=deep_after_id, limit=100, mode="prefix"), args.repeat)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+"""
+Load test toàn bộ ứng dụng qua HTTP, không cần MySQL hay VietTTS thật:
+- Database là file SQLite trong thư mục tạm (DATABASE_URL), VietTTS là server giả lập trả về WAV sau một độ trễ cố định
+- Tạo sẵn user, voice profile và từ vựng (clip giả lập giọng nói) rồi khởi động app bằng uvicorn trong tiến trình riêng
+- Chạy lần lượt từng kịch bản (login, upload từ vựng, TTS voice library, MMS TTS, VietTTS, tải file, mixed)
+  với số request đồng thời cấu hình được
+- Báo cáo mỗi kịch bản: số request, tỉ lệ lỗi, throughput, độ trễ p50/p95/p99, RSS của server
+  và số request trên mỗi giây CPU của server (req/s cho mỗi core)
+Router /tts (VietTTS) chưa được include trong app.main nên harness gắn thêm vào app khi khởi động server.
+Chỉ đo CPU/RSS được trên Linux (đọc /proc); client sinh tải chạy trên cùng máy nên nên dùng máy nhiều core.
+Sử dụng:
+    python scripts/load_test.py --concurrency 8 --duration 20
+    python scripts/load_test.py --scenarios tts,download --words 30 --output load_test.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Thêm thư mục gốc vào sys.path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+os.environ.setdefault("API_KEY", "benchmark")
+
+import numpy as np
+import soundfile as sf
+
+ONSETS = ["b", "c", "d", "g", "h", "l", "m", "n", "s", "t"]
+RHYMES = ["a", "an", "o", "ong", "u", "anh"]
+# Từ vựng của mỗi profile: 60 âm tiết chỉ gồm chữ cái để bộ chuẩn hóa văn bản giữ nguyên
+WORDS = [onset + rhyme for onset in ONSETS for rhyme in RHYMES]
+PASSWORD = "load-test-password"
+SAMPLE_RATE = 22050
+SCENARIOS = ["login", "upload", "tts", "mms", "viettts", "download", "mixed"]
+# Tỉ trọng các loại request trong kịch bản mixed
+MIXED_WEIGHTS = {"login": 1, "upload": 1, "tts": 5, "mms": 1, "viettts": 1, "download": 3}
+
+
+def make_word_clip(seed, duration=0.35):
+    """Clip giả lập một từ: họa âm với cao độ lượn, điều biên theo âm tiết, nhiễu nền nhẹ"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 80 * rng.random() + 30 * np.sin(2 * np.pi * (1 + rng.random()) * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(0.3 / k * np.sin(k * phase) for k in range(1, 10)) * np.hanning(len(t)) ** 0.5
+    return (voice + 0.003 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def wav_bytes(audio, sr=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sr, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Các server chạy trong tiến trình con
+# ---------------------------------------------------------------------------
+
+def serve_viettts(port, latency):
+    """Server giả lập VietTTS: /v1/voices và /v1/audio/speech (WAV dài theo số ký tự, trả về sau `latency` giây)"""
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response
+
+    stub = FastAPI()
+
+    @stub.get("/v1/voices")
+    async def voices():
+        return ["cdteam", "nu-nhe-nhang", "nam-truyen-cam"]
+
+    @stub.post("/v1/audio/speech")
+    async def speech(request: Request):
+        data = await request.json()
+        await asyncio.sleep(latency)
+        duration = min(0.06 * len(data.get("input", "")), 30.0)
+        t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+        return Response(wav_bytes((0.2 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)), media_type="audio/wav")
+
+    uvicorn.run(stub, host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_app(port):
+    """Chạy app.main (cấu hình qua biến môi trường do tiến trình cha đặt), gắn thêm router /tts"""
+    import uvicorn
+    from app.main import app
+    from app.routers import text_to_speech
+
+    if not any(getattr(route, "path", "").startswith("/tts/") for route in app.routes):
+        app.include_router(text_to_speech.router)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_process(args, env):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__)] + args, env=env, cwd=ROOT_DIR)
+
+
+async def wait_ready(client, url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Tiến trình server đã dừng (exit code {process.returncode})")
+        try:
+            await client.get(url)
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server không phản hồi sau {timeout}s: {url}")
+
+
+# ---------------------------------------------------------------------------
+# Dữ liệu mẫu
+# ---------------------------------------------------------------------------
+
+def seed_database(users):
+    """Tạo user (mật khẩu PASSWORD), mỗi user một profile đủ WORDS; trả về [(user_id, username, profile_id, token)]"""
+    from app.database.connection import Base, SessionLocal, engine
+    from app.database.auth import create_access_token
+    from app.database.audio_format import set_profile_format
+    from app.database.user_crud import get_password_hash
+    from app.models.user import User
+    from app.models.voice_library.vocabulary import Vocabulary, VoiceProfile
+    from app.database.voice_service import VOICE_PROFILES_DIR
+
+    Base.metadata.create_all(bind=engine)
+    clips = {word: wav_bytes(make_word_clip(index)) for index, word in enumerate(WORDS)}
+    password = get_password_hash(PASSWORD)
+    db = SessionLocal()
+    accounts = []
+    try:
+        for user_id in range(1, users + 1):
+            username = f"load{user_id}"
+            user = User(id=user_id, username=username, password=password,
+                        email=f"{username}@example.com", credits=10 ** 12)
+            db.add(user)
+            db.add(VoiceProfile(id=user_id, user_id=user_id, name="load test"))
+            profile_dir = VOICE_PROFILES_DIR / f"user_{user_id}" / f"profile_{user_id}"
+            os.makedirs(profile_dir, exist_ok=True)
+            set_profile_format(profile_dir, SAMPLE_RATE)
+            for word, content in clips.items():
+                path = profile_dir / f"{word}.wav"
+                path.write_bytes(content)
+                db.add(Vocabulary(voice_profile_id=user_id, word=word, audio_path=str(path)))
+            # Các route tổng hợp tính phí nên bắt buộc có token
+            accounts.append((user_id, username, user_id, create_access_token(user)))
+        db.commit()
+    finally:
+        db.close()
+    return accounts
+
+
+# ---------------------------------------------------------------------------
+# Các loại request
+# ---------------------------------------------------------------------------
+
+class Workload:
+    def __init__(self, client, accounts, words, seed):
+        self.client = client
+        self.accounts = accounts
+        self.words = words
+        self.rng = random.Random(seed)
+        self.outputs = []
+        self.uploads = 0
+        self.upload_clip = wav_bytes(make_word_clip(9999))
+
+    def sentence(self):
+        # Mỗi request một câu khác nhau để đo đường tổng hợp, không phải lớp gộp request trùng nhau
+        return " ".join(self.rng.choice(WORDS) for _ in range(self.words))
+
+    async def login(self):
+        _, username, _, _ = self.rng.choice(self.accounts)
+        return await self.client.post("/users/login", json={"username": username, "password": PASSWORD})
+
+    async def upload(self):
+        user_id, _, profile_id, _ = self.rng.choice(self.accounts)
+        self.uploads += 1
+        # Từ mới chỉ gồm chữ cái: "tai" + số thứ tự viết bằng chữ a-z
+        number, suffix = self.uploads, ""
+        while number:
+            number, digit = divmod(number, 26)
+            suffix += chr(ord("a") + digit)
+        return await self.client.post(
+            f"/voice-library/profiles/{profile_id}/vocabulary",
+            params={"user_id": user_id},
+            data={"word": f"tai{suffix}"},
+            files={"audio_file": ("clip.wav", self.upload_clip, "audio/wav")},
+        )
+
+    async def tts(self, retain=False):
+        user_id, _, profile_id, token = self.rng.choice(self.accounts)
+        return await self.client.post(
+            "/voice-library/text-to-speech",
+            params={"user_id": user_id, "retain": retain},
+            headers={"Authorization": f"Bearer {token}"},
+            json={"text": self.sentence(), "voice_profile_id": profile_id},
+        )
+
+    async def mms(self):
+        _, _, _, token = self.rng.choice(self.accounts)
+        return await self.client.post(
+            "/tts-facebook/generate", json={"text": self.sentence()}, headers={"Authorization": f"Bearer {token}"}
+        )
+
+    async def viettts(self):
+        return await self.client.post(
+            "/tts/generate", json={"text": self.sentence(), "model_type": "mien-bac", "voice": "cdteam"}
+        )
+
+    async def download(self):
+        # Xen kẽ tải file kết quả đã giữ lại và file âm thanh từ vựng
+        if self.outputs and self.rng.random() < 0.5:
+            return await self.client.get(self.rng.choice(self.outputs))
+        user_id, _, profile_id, _ = self.rng.choice(self.accounts)
+        word = self.rng.choice(WORDS)
+        return await self.client.get(
+            f"/voice-library/profiles/{profile_id}/vocabulary/{word}/audio", params={"user_id": user_id}
+        )
+
+    async def mixed(self):
+        kinds = list(MIXED_WEIGHTS)
+        kind = self.rng.choices(kinds, weights=[MIXED_WEIGHTS[k] for k in kinds])[0]
+        return await getattr(self, kind)()
+
+    async def prepare_downloads(self, count):
+        for _ in range(count):
+            response = await self.tts(retain=True)
+            if response.status_code == 200 and "x-download-url" in response.headers:
+                self.outputs.append(response.headers["x-download-url"])
+
+
+# ---------------------------------------------------------------------------
+# Đo tài nguyên của server (Linux)
+# ---------------------------------------------------------------------------
+
+def read_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def read_cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime và stime là trường thứ 14 và 15 (tính cả pid và comm)
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Chạy kịch bản
+# ---------------------------------------------------------------------------
+
+async def run_scenario(workload, name, concurrency, duration, warmup, server_pid):
+    action = getattr(workload, name)
+    latencies = []
+    statuses = {}
+    failures = 0
+
+    async def worker(deadline, measure):
+        nonlocal failures
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await action()
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if not measure:
+                continue
+            statuses[status] = statuses.get(status, 0) + 1
+            if isinstance(status, int) and status < 400:
+                latencies.append(elapsed)
+            else:
+                failures += 1
+
+    if warmup > 0:
+        deadline = time.monotonic() + warmup
+        await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+
+    rss_samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(sample_rss(server_pid, rss_samples, stop))
+    cpu_before = read_cpu_seconds(server_pid)
+    started = time.perf_counter()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(worker(deadline, True) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu_after = read_cpu_seconds(server_pid)
+    stop.set()
+    await sampler
+
+    ok = len(latencies)
+    total = ok + failures
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else [None] * 3
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": failures,
+        "statuses": {str(key): value for key, value in sorted(statuses.items(), key=str)},
+        "throughput_rps": ok / elapsed if elapsed else 0.0,
+        "p50_ms": percentiles[0],
+        "p95_ms": percentiles[1],
+        "p99_ms": percentiles[2],
+        "server_cpu_seconds": cpu_seconds,
+        "rps_per_core": ok / cpu_seconds if cpu_seconds else None,
+        "rss_peak_mb": max(rss_samples) if rss_samples else None,
+        "rss_end_mb": rss_samples[-1] if rss_samples else None,
+    }
+
+
+def print_report(results):
+    def fmt(value, pattern="{:.1f}"):
+        return "-" if value is None else pattern.format(value)
+
+    header = (f"{'kịch bản':<10}{'req':>7}{'lỗi':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'req/s/core':>12}{'RSS đỉnh MB':>13}")
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<10}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>9.1f}"
+            f"{fmt(r['p50_ms']):>9}{fmt(r['p95_ms']):>9}{fmt(r['p99_ms']):>9}"
+            f"{fmt(r['rps_per_core']):>12}{fmt(r['rss_peak_mb']):>13}"
+        )
+    for r in results:
+        if r["errors"]:
+            print(f"  {r['scenario']}: mã trạng thái {r['statuses']}")
+
+
+async def run(args):
+    import httpx
+
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'load_test.db')}",
+        "VOICE_PROFILES_DIR": os.path.join(work_dir, "voice_profiles"),
+        "AUDIO_TEMP_DIR": os.path.join(work_dir, "outputs"),
+        "CLIP_STORE_DIR": os.path.join(work_dir, "clip_store"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+    viettts_port, app_port = free_port(), free_port()
+    env["VIETTTS_URL"] = f"http://127.0.0.1:{viettts_port}"
+    processes = []
+    try:
+        # Dữ liệu mẫu được ghi trực tiếp vào database và thư mục profile trước khi server khởi động
+        os.environ.update(env)
+        accounts = seed_database(args.users)
+        print(f"Đã tạo {len(accounts)} user/profile, mỗi profile {len(WORDS)} từ vựng tại {work_dir}")
+
+        async with httpx.AsyncClient(timeout=args.timeout) as probe:
+            processes.append(start_process(["--serve", "viettts", "--port", str(viettts_port),
+                                            "--viettts-latency-ms", str(args.viettts_latency_ms)], env))
+            await wait_ready(probe, f"{env['VIETTTS_URL']}/v1/voices", processes[-1])
+            processes.append(start_process(["--serve", "app", "--port", str(app_port)], env))
+            await wait_ready(probe, f"http://127.0.0.1:{app_port}/", processes[-1])
+        server = processes[-1]
+        print(f"Server sẵn sàng (pid {server.pid}), RSS lúc khởi động: {read_rss_mb(server.pid) or '-'} MB")
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        base_url = f"http://127.0.0.1:{app_port}"
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            workload = Workload(client, accounts, args.words, args.seed)
+            await workload.prepare_downloads(args.retained_outputs)
+            results = []
+            for name in args.scenarios:
+                print(f"Đang chạy kịch bản {name} ({args.concurrency} request đồng thời, {args.duration}s)...")
+                results.append(await run_scenario(
+                    workload, name, args.concurrency, args.duration, args.warmup, server.pid
+                ))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2, ensure_ascii=False, default=float)
+        print(f"\nĐã ghi kết quả: {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test ứng dụng với SQLite và VietTTS giả lập")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Các kịch bản cần chạy, cách nhau bởi dấu phẩy ({', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="Số request đồng thời")
+    parser.add_argument("--duration", type=float, default=15.0, help="Thời gian đo mỗi kịch bản (giây)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Thời gian chạy nóng trước khi đo (giây)")
+    parser.add_argument("--users", type=int, default=10, help="Số user/profile tạo sẵn")
+    parser.add_argument("--words", type=int, default=12, help="Số từ mỗi câu trong các request TTS")
+    parser.add_argument("--retained-outputs", type=int, default=20, help="Số file kết quả tạo sẵn cho kịch bản download")
+    parser.add_argument("--viettts-latency-ms", type=float, default=200.0, help="Độ trễ của VietTTS giả lập (ms)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout mỗi request (giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    # Dùng nội bộ: chạy server trong tiến trình con
+    parser.add_argument("--serve", choices=["app", "viettts"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "viettts":
+        serve_viettts(args.port, args.viettts_latency_ms / 1000)
+        return
+    if args.serve == "app":
+        serve_app(args.port)
+        return
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Kịch bản không hợp lệ: {', '.join(unknown)}")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+So sánh bộ nhớ của run_production.py khi preload ứng dụng trước khi fork và khi mỗi worker tự import (--no-preload)
+- RSS: bộ nhớ worker đang dùng, tính cả trang dùng chung (cộng RSS các worker sẽ bị đếm trùng)
+- PSS: trang dùng chung được chia đều cho các tiến trình dùng chung, tổng PSS là bộ nhớ thật của cả nhóm
+- USS: trang riêng của worker (Private_Clean + Private_Dirty), phần tăng thêm khi thêm một worker
+Chỉ chạy trên Linux (đọc /proc/<pid>/smaps_rollup). Database mặc định là SQLite tạm nếu chưa đặt DATABASE_URL.
+Sử dụng:
+    python scripts/measure_worker_memory.py --workers 4
+    python scripts/measure_worker_memory.py --workers 4 --requests 200
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children_of(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_of(pid):
+    """(RSS, PSS, USS) tính bằng MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":"):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return values.get("Rss", 0.0), values.get("Pss", 0.0), values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0)
+
+
+def wait_ready(url, process, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"run_production.py đã dừng (exit code {process.returncode})")
+        try:
+            urllib.request.urlopen(url, timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError(f"Server không phản hồi sau {timeout}s")
+
+
+def measure(mode_args, workers, requests, env):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT_DIR, "run_production.py"), "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers)] + mode_args,
+        cwd=ROOT_DIR, env=env,
+    )
+    try:
+        started = time.monotonic()
+        wait_ready(f"http://127.0.0.1:{port}/", process)
+        # Chờ đủ worker (request đầu tiên có thể được worker khởi động sớm nhất trả lời)
+        while len(children_of(process.pid)) < workers and time.monotonic() - started < 180:
+            time.sleep(0.3)
+        ready_seconds = time.monotonic() - started
+        for _ in range(requests):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=10).read()
+        time.sleep(1)
+
+        master = memory_of(process.pid)
+        worker_memory = [memory_of(pid) for pid in children_of(process.pid)]
+        drain_started = time.monotonic()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        return {
+            "ready_seconds": ready_seconds,
+            "master": master,
+            "workers": worker_memory,
+            "shutdown_seconds": time.monotonic() - drain_started,
+        }
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+
+def report(label, result):
+    workers = result["workers"]
+    count = len(workers) or 1
+    total_pss = result["master"][1] + sum(w[1] for w in workers)
+    print(f"\n=== {label} ===")
+    print(f"Khởi động: {result['ready_seconds']:.1f}s, dừng (SIGTERM): {result['shutdown_seconds']:.1f}s")
+    print(f"{'':<12}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+    print(f"{'master':<12}{result['master'][0]:>10.1f}{result['master'][1]:>10.1f}{result['master'][2]:>10.1f}")
+    for index, (rss, pss, uss) in enumerate(workers):
+        print(f"{f'worker {index}':<12}{rss:>10.1f}{pss:>10.1f}{uss:>10.1f}")
+    print(f"Trung bình mỗi worker: RSS {sum(w[0] for w in workers) / count:.1f} MB, "
+          f"USS {sum(w[2] for w in workers) / count:.1f} MB")
+    print(f"Tổng PSS (bộ nhớ thật của cả nhóm): {total_pss:.1f} MB")
+    return total_pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo bộ nhớ mỗi worker khi preload và khi không preload")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="Số request gửi trước khi đo")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="worker_memory_")
+    env = dict(os.environ)
+    env.setdefault("API_KEY", "benchmark")
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(work_dir, 'memory.db')}")
+    env.setdefault("VOICE_PROFILES_DIR", os.path.join(work_dir, "voice_profiles"))
+    env.setdefault("AUDIO_TEMP_DIR", os.path.join(work_dir, "outputs"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    try:
+        preload = report("preload trước khi fork", measure([], args.workers, args.requests, env))
+        separate = report("mỗi worker tự import (--no-preload)", measure(["--no-preload"], args.workers, args.requests, env))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"\nTiết kiệm: {separate - preload:.1f} MB ({1 - preload / separate:.0%}) với {args.workers} worker")
+
+
+if __name__ == "__main__":
+    main()